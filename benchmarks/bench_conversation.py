@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+"""
+bench_conversation.py
+
+Measures the library's own overhead across chat log sizes, with chat and embedding requests
+answered by the offline FakeOpenAI backend. Each benchmark is timed at every size so that
+operations which scale worse than linearly stand out in the per-message column.
+
+Usage:
+    python benchmarks/bench_conversation.py
+    python benchmarks/bench_conversation.py --sizes 10 1000 100000 --output results.json
+    python benchmarks/bench_conversation.py --baseline results.json --tolerance 1.5
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+# Allow running the script from a checkout without installing the package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from chatbot_library.agents.smart_agent import AmnesicAgent, SmartAgent
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.message import Message
+from chatbot_library.utils.rate_limiter import RateLimiter, set_rate_limiter
+
+DEFAULT_SIZES = [10, 100, 1000, 10_000, 100_000]
+AGENT_TURNS = 10
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while curious cats watch from "
+    "warm windows and distant trains rumble past quiet fields of golden wheat"
+).split()
+
+BENCHMARKS: Dict[str, Callable[[int, str], float]] = {}
+
+
+def benchmark(name: str):
+    """Registers a function that runs one benchmark at a given size and returns its time."""
+
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+def make_messages(n: int, seed: int = 0) -> List[Message]:
+    """
+    Generates a deterministic conversation of alternating user and assistant messages.
+
+    :param n: The number of messages.
+    :param seed: The seed for the generator.
+    :return: A list of Message objects.
+    """
+    rng = random.Random(seed)
+    return [
+        Message(
+            "user" if i % 2 == 0 else "assistant",
+            " ".join(rng.choices(WORDS, k=rng.randint(5, 60))),
+        )
+        for i in range(n)
+    ]
+
+
+def make_manager(n: int) -> ConversationManager:
+    """Returns a manager holding n messages and no token limit."""
+    conversation_manager = ConversationManager()
+    conversation_manager.max_tokens = float("inf")
+    conversation_manager.chat_log = make_messages(n)
+    return conversation_manager
+
+
+def timed(func: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+@benchmark("append")
+def bench_append(n: int, tmpdir: str) -> float:
+    conversation_manager = ConversationManager()
+    conversation_manager.max_tokens = float("inf")
+    contents = [msg.content for msg in make_messages(n)]
+
+    def run():
+        for content in contents:
+            conversation_manager.append_user_message(content)
+
+    return timed(run)
+
+
+@benchmark("count_tokens")
+def bench_count_tokens(n: int, tmpdir: str) -> float:
+    conversation_manager = ConversationManager()
+    messages = make_messages(n)
+    return timed(lambda: conversation_manager.num_tokens_from_messages(messages))
+
+
+@benchmark("trim_half")
+def bench_trim(n: int, tmpdir: str) -> float:
+    conversation_manager = make_manager(n)
+    conversation_manager.max_tokens = conversation_manager.total_tokens() // 2
+    return timed(conversation_manager.trim_chat_log_to_token_limit)
+
+
+@benchmark("search_for_message")
+def bench_search(n: int, tmpdir: str) -> float:
+    conversation_manager = make_manager(n)
+    return timed(lambda: conversation_manager.search_for_message("golden wheat"))
+
+
+@benchmark("semantic_search")
+def bench_semantic_search(n: int, tmpdir: str) -> float:
+    conversation_manager = make_manager(n)
+    conversation_manager.embed_chat_log()
+    conversation_manager.semantic_search("warm windows")
+    return timed(lambda: conversation_manager.semantic_search("quiet fields"))
+
+
+@benchmark("save_json")
+def bench_save_json(n: int, tmpdir: str) -> float:
+    conversation_manager = make_manager(n)
+    path = os.path.join(tmpdir, f"save_{n}.json")
+    return timed(lambda: conversation_manager.save_chat_log(path))
+
+
+@benchmark("load_json")
+def bench_load_json(n: int, tmpdir: str) -> float:
+    path = os.path.join(tmpdir, f"load_{n}.json")
+    make_manager(n).save_chat_log(path)
+    return timed(lambda: ConversationManager().load_chat_log(path))
+
+
+@benchmark("save_jsonl")
+def bench_save_jsonl(n: int, tmpdir: str) -> float:
+    conversation_manager = make_manager(n)
+    path = os.path.join(tmpdir, f"save_{n}.jsonl")
+    return timed(lambda: conversation_manager.save_chat_log(path))
+
+
+@benchmark("load_jsonl")
+def bench_load_jsonl(n: int, tmpdir: str) -> float:
+    path = os.path.join(tmpdir, f"load_{n}.jsonl")
+    make_manager(n).save_chat_log(path)
+    return timed(lambda: ConversationManager().load_chat_log(path))
+
+
+@benchmark("smart_agent_turn")
+def bench_smart_agent(n: int, tmpdir: str) -> float:
+    agent = SmartAgent(make_manager(n))
+    return timed(
+        lambda: [agent.get_response("Hello there") for _ in range(AGENT_TURNS)]
+    )
+
+
+@benchmark("amnesic_agent_turn")
+def bench_amnesic_agent(n: int, tmpdir: str) -> float:
+    agent = AmnesicAgent(make_manager(n))
+    return timed(
+        lambda: [agent.get_response("Hello there") for _ in range(AGENT_TURNS)]
+    )
+
+
+def per_item(name: str, n: int, seconds: float) -> float:
+    """Converts a benchmark time to microseconds per message, or per turn for agents."""
+    return seconds / (AGENT_TURNS if name.endswith("_turn") else n) * 1e6
+
+
+def run(
+    names: List[str], sizes: List[int], repeat: int, backend: FakeOpenAI
+) -> Dict[str, Dict[str, float]]:
+    """
+    Runs the benchmarks at every size and keeps the fastest of repeat runs.
+
+    :return: A dictionary mapping benchmark names to {size: seconds}.
+    """
+    results: Dict[str, Dict[str, float]] = {name: {} for name in names}
+    with backend.installed(tokenizer=True), tempfile.TemporaryDirectory() as tmpdir:
+        for name in names:
+            for n in sizes:
+                seconds = min(BENCHMARKS[name](n, tmpdir) for _ in range(repeat))
+                results[name][str(n)] = seconds
+                print(
+                    f"{name:20} {n:>8} {seconds * 1000:12.2f} ms "
+                    f"{per_item(name, n, seconds):12.2f} us/item",
+                    flush=True,
+                )
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+    """
+    Lists every result that is more than tolerance times slower than the baseline.
+
+    :return: A list of strings describing the regressions.
+    """
+    regressions = []
+    for name, by_size in results.items():
+        for size, seconds in by_size.items():
+            before = baseline.get(name, {}).get(size)
+            if before and seconds > before * tolerance:
+                regressions.append(
+                    f"{name} at {size} messages: {before * 1000:.2f} ms -> "
+                    f"{seconds * 1000:.2f} ms"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+
+    # Logging and rate limiting are not what is being measured here.
+    logging.disable(logging.INFO)
+    set_rate_limiter(
+        RateLimiter(requests_per_minute=float("inf"), tokens_per_minute=float("inf"))
+    )
+    backend = FakeOpenAI(latency=args.latency, embedding_dim=args.embedding_dim)
+    results = run(args.benchmarks, args.sizes, args.repeat, backend)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"sizes": args.sizes, "results": results}, f, indent=4)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
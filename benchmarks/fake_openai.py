@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+"""
+fake_openai.py
+
+This module defines FakeOpenAI, a deterministic local stand-in for the chat and embedding
+endpoints, used by the benchmarks and load tests to measure the library's own overhead without
+touching the network.
+"""
+
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from types import SimpleNamespace
+from typing import Deque, Dict, Iterator, List, Optional
+from unittest import mock
+
+import numpy as np
+
+import openai
+
+from chatbot_library.utils import tokens
+
+_PIECE_PATTERN = re.compile(r"\s*\w+|\s*[^\w\s]|\s+")
+
+
+class FakeEncoding:
+    """
+    A tokenizer with the encode/decode interface of a tiktoken encoding that needs no
+    downloaded vocabulary. Words and punctuation marks, with their leading whitespace, are one
+    token each, which is close enough to cl100k_base for English text.
+    """
+
+    name = "fake"
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, int] = {}
+        self._pieces: List[str] = []
+        self._lock = threading.Lock()
+
+    def encode(self, text: str, **kwargs) -> List[int]:
+        pieces = _PIECE_PATTERN.findall(text)
+        with self._lock:
+            for piece in pieces:
+                if piece not in self._ids:
+                    self._ids[piece] = len(self._pieces)
+                    self._pieces.append(piece)
+            return [self._ids[piece] for piece in pieces]
+
+    def decode(self, token_ids: List[int]) -> str:
+        return "".join(self._pieces[token_id] for token_id in token_ids)
+
+
+class FakeOpenAI:
+    """
+    Answers chat and embedding requests locally and deterministically.
+
+    Embeddings are unit vectors seeded by a hash of the input, so equal texts always get equal
+    embeddings. Chat replies are reply_words words long and depend only on the last message.
+    Every request sleeps for latency seconds, plus up to jitter seconds drawn from a seeded
+    generator, and a slow_fraction of requests sleep slow_latency seconds longer to simulate a
+    latency tail. A request given a request_timeout shorter than its delay raises TimeoutError
+    after request_timeout seconds, like the OpenAI client.
+
+    Usage:
+        backend = FakeOpenAI(latency=0.2)
+        with backend.installed(tokenizer=True):
+            agent.get_response("Hello")
+
+    :param latency: The base delay of every request in seconds.
+    :param jitter: The largest extra random delay in seconds.
+    :param embedding_dim: The length of the embedding vectors.
+    :param reply_words: The number of words in each chat reply.
+    :param seed: The seed for the jitter.
+    :param slow_fraction: The probability that a request is slow.
+    :param slow_latency: The extra delay of slow requests in seconds.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        embedding_dim: int = 1536,
+        reply_words: int = 20,
+        seed: int = 0,
+        slow_fraction: float = 0.0,
+        slow_latency: float = 1.0,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self._injected_delays: Deque[float] = deque()
+        self.embedding_dim = embedding_dim
+        self.reply_words = reply_words
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.num_chat_calls = 0
+        self.num_embedding_calls = 0
+        self.num_embedded_inputs = 0
+
+    def delay(self) -> float:
+        """
+        Draws the delay of the next request.
+
+        :return: The delay in seconds.
+        """
+        if not (self.jitter or self.slow_fraction or self._injected_delays):
+            return self.latency
+        with self._lock:
+            if self._injected_delays:
+                return self._injected_delays.popleft()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if self._random.random() < self.slow_fraction:
+                delay += self.slow_latency
+            return delay
+
+    def inject_delays(self, *delays: float) -> None:
+        """
+        Sets the delays of the next requests, in the order they are received, in place of the
+        drawn ones.
+
+        :param delays: The delays in seconds.
+        """
+        with self._lock:
+            self._injected_delays.extend(delays)
+
+    def _sleep(self, request_timeout: Optional[float]) -> None:
+        delay = self.delay()
+        if request_timeout is not None and delay > request_timeout:
+            time.sleep(request_timeout)
+            raise TimeoutError("Request timed out")
+        time.sleep(delay)
+
+    async def _asleep(self, request_timeout: Optional[float]) -> None:
+        delay = self.delay()
+        if request_timeout is not None and delay > request_timeout:
+            await asyncio.sleep(request_timeout)
+            raise TimeoutError("Request timed out")
+        await asyncio.sleep(delay)
+
+    def embed(self, text: str) -> List[float]:
+        """
+        Returns the deterministic embedding of a text.
+
+        :param text: The text to embed.
+        :return: A list of floats with unit norm.
+        """
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        vector = np.random.default_rng(seed).standard_normal(self.embedding_dim)
+        return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+    def reply(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Returns the deterministic reply to a conversation.
+
+        :param messages: The messages of the request, as dictionaries.
+        :return: A string of reply_words words.
+        """
+        last = messages[-1]["content"] if messages else ""
+        words = (last.split() or ["ok"]) * self.reply_words
+        return " ".join(words[: self.reply_words])
+
+    def _embedding_response(self, input, **kwargs) -> dict:
+        inputs = [input] if isinstance(input, str) else list(input)
+        with self._lock:
+            self.num_embedding_calls += 1
+            self.num_embedded_inputs += len(inputs)
+        return {
+            "data": [
+                {"index": i, "embedding": self.embed(text)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"total_tokens": sum(len(text.split()) for text in inputs)},
+        }
+
+    def _chat_response(self, messages, stream: bool = False, **kwargs):
+        with self._lock:
+            self.num_chat_calls += 1
+        content = self.reply(messages)
+        if stream:
+            return [
+                {"choices": [{"delta": {"content": piece}}]}
+                for piece in _PIECE_PATTERN.findall(content)
+            ]
+        return {
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {"completion_tokens": len(content.split())},
+        }
+
+    def embedding_create(self, input, request_timeout=None, **kwargs) -> dict:
+        """Stands in for openai.Embedding.create."""
+        self._sleep(request_timeout)
+        return self._embedding_response(input, **kwargs)
+
+    async def embedding_acreate(self, input, request_timeout=None, **kwargs) -> dict:
+        """Stands in for openai.Embedding.acreate."""
+        await self._asleep(request_timeout)
+        return self._embedding_response(input, **kwargs)
+
+    def chat_create(
+        self, messages, stream: bool = False, request_timeout=None, **kwargs
+    ):
+        """Stands in for openai.ChatCompletion.create."""
+        self._sleep(request_timeout)
+        response = self._chat_response(messages, stream=stream, **kwargs)
+        return iter(response) if stream else response
+
+    async def chat_acreate(
+        self, messages, stream: bool = False, request_timeout=None, **kwargs
+    ):
+        """Stands in for openai.ChatCompletion.acreate."""
+        await self._asleep(request_timeout)
+        response = self._chat_response(messages, stream=stream, **kwargs)
+        if not stream:
+            return response
+
+        async def chunks():
+            for chunk in response:
+                yield chunk
+
+        return chunks()
+
+    @contextmanager
+    def installed(self, tokenizer: bool = False) -> Iterator["FakeOpenAI"]:
+        """
+        Routes the library's OpenAI calls to this backend for the duration of the block.
+
+        :param tokenizer: Whether to also count tokens with a FakeEncoding, for environments
+            where tiktoken cannot download its vocabularies.
+        :return: A context manager yielding this backend.
+        """
+        with ExitStack() as stack:
+            stack.enter_context(
+                mock.patch.object(
+                    openai,
+                    "ChatCompletion",
+                    SimpleNamespace(create=self.chat_create, acreate=self.chat_acreate),
+                )
+            )
+            stack.enter_context(
+                mock.patch.object(
+                    openai,
+                    "Embedding",
+                    SimpleNamespace(
+                        create=self.embedding_create, acreate=self.embedding_acreate
+                    ),
+                )
+            )
+            if tokenizer:
+                encoding = FakeEncoding()
+                stack.enter_context(
+                    mock.patch.object(
+                        tokens.tiktoken, "encoding_for_model", lambda model: encoding
+                    )
+                )
+                stack.enter_context(
+                    mock.patch.object(
+                        tokens.tiktoken, "get_encoding", lambda name: encoding
+                    )
+                )
+                stack.callback(tokens.get_token_params.cache_clear)
+                tokens.get_token_params.cache_clear()
+            yield self
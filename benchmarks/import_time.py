@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""
+import_time.py
+
+Measures how long the library's modules take to import in a fresh interpreter, using
+`python -X importtime`, and fails if an import exceeds its budget or pulls in a dependency
+that should only be loaded on first use.
+
+Usage:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 1500 --repeat 5
+"""
+
+import argparse
+import subprocess
+import sys
+from typing import Dict, List
+
+MODULES = [
+    "chatbot_library.utils.message",
+    "chatbot_library.utils.conversation_manager",
+    "chatbot_library.agents.smart_agent",
+]
+
+# Modules that must not be imported until a feature that needs them is used.
+DEFERRED_MODULES = ["sklearn", "bs4", "googleapiclient", "requests"]
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """
+    Imports a module in a fresh interpreter and returns the cumulative import time of every
+    module it loaded.
+
+    :param module: The name of the module to import.
+    :return: A dictionary mapping module names to microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def check(modules: List[str], budget_ms: float, repeat: int) -> List[str]:
+    """
+    Measures each module and returns a description of every budget or deferral violation.
+
+    :param modules: The names of the modules to measure.
+    :param budget_ms: The largest acceptable import time in milliseconds.
+    :param repeat: The number of measurements per module; the fastest one is kept.
+    :return: A list of strings, empty if every module is within budget.
+    """
+    failures = []
+    for module in modules:
+        runs = [import_times(module) for _ in range(repeat)]
+        best_ms = min(run[module] for run in runs) / 1000
+        deferred = [name for name in DEFERRED_MODULES if name in runs[0]]
+        print(f"{module:50} {best_ms:8.1f} ms")
+        if best_ms > budget_ms:
+            failures.append(f"{module} took {best_ms:.1f} ms (budget {budget_ms} ms)")
+        if deferred:
+            failures.append(f"{module} imported {', '.join(deferred)} eagerly")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--budget-ms", type=float, default=2000.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    failures = check(args.modules, args.budget_ms, args.repeat)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+"""
+load_test.py
+
+Simulates many concurrent users talking to agents backed by the offline FakeOpenAI backend, to
+find how many users one process can serve. Each virtual user waits an exponentially
+distributed think time between turns and sends messages whose lengths follow a log-normal
+distribution.
+
+Usage:
+    python benchmarks/load_test.py --users 200 --duration 30 --latency 0.5
+    python benchmarks/load_test.py --agent amnesic --turn-rate 0.5 --mode threads
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Allow running the script from a checkout without installing the package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from chatbot_library.agents.smart_agent import Agent, AmnesicAgent, SmartAgent
+from chatbot_library.utils.async_conversation_manager import AsyncConversationManager
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.deadline import ChatError
+from chatbot_library.utils.rate_limiter import RateLimiter, set_rate_limiter
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while curious cats watch from "
+    "warm windows and distant trains rumble past quiet fields of golden wheat"
+).split()
+
+
+def make_agent(
+    kind: str, mode: str, timeout: Optional[float] = None, hedge: bool = False
+) -> Agent:
+    """
+    Creates the agent of one virtual user.
+
+    :param kind: 'smart' or 'amnesic'.
+    :param mode: 'async' for an AsyncConversationManager, 'threads' for a ConversationManager
+        whose turns run in worker threads.
+    :param timeout: The request timeout in seconds, or None.
+    :param hedge: Whether to hedge slow requests.
+    :return: An Agent.
+    """
+    manager_class = AsyncConversationManager if mode == "async" else ConversationManager
+    conversation_manager = manager_class()
+    conversation_manager.request_timeout = timeout
+    conversation_manager.hedge = hedge
+    if kind == "smart":
+        return SmartAgent(conversation_manager, personality="You are a helpful bot.")
+    return AmnesicAgent(conversation_manager)
+
+
+async def virtual_user(
+    agent: Agent,
+    rng: random.Random,
+    turn_rate: float,
+    mean_words: float,
+    sigma: float,
+    deadline: float,
+    latencies: List[float],
+    failures: List[float],
+) -> None:
+    """
+    Sends turns to one agent until the deadline.
+
+    :param turn_rate: The mean number of turns per second.
+    :param mean_words: The median message length in words.
+    :param sigma: The spread of the log-normal message length distribution.
+    :param latencies: The list each turn's latency is appended to.
+    :param failures: The list the latency of each failed turn is appended to.
+    """
+    while True:
+        think_time = rng.expovariate(turn_rate)
+        remaining = deadline - time.perf_counter()
+        if think_time >= remaining:
+            await asyncio.sleep(max(0.0, remaining))
+            return
+        await asyncio.sleep(think_time)
+        num_words = max(1, int(rng.lognormvariate(np.log(mean_words), sigma)))
+        message = " ".join(rng.choices(WORDS, k=num_words))
+        start = time.perf_counter()
+        try:
+            await agent.aget_response(message)
+        except ChatError:
+            failures.append(time.perf_counter() - start)
+        else:
+            latencies.append(time.perf_counter() - start)
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, float]:
+    """
+    Runs the virtual users for the configured duration and summarizes the turns.
+
+    :return: A dictionary of metrics.
+    """
+    if args.threads:
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=args.threads)
+        )
+    rng = random.Random(args.seed)
+    tracemalloc.start()
+    memory_before, _ = tracemalloc.get_traced_memory()
+    agents = [
+        make_agent(args.agent, args.mode, args.timeout, args.hedge)
+        for _ in range(args.users)
+    ]
+    latencies: List[float] = []
+    failures: List[float] = []
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    deadline = wall_start + args.duration
+    await asyncio.gather(
+        *(
+            virtual_user(
+                agent,
+                random.Random(rng.random()),
+                args.turn_rate,
+                args.mean_words,
+                args.sigma,
+                deadline,
+                latencies,
+                failures,
+            )
+            for agent in agents
+        )
+    )
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    memory_after, memory_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    turns = len(latencies)
+    percentiles = np.percentile(latencies, [50, 95, 99]) if latencies else np.zeros(3)
+    return {
+        "users": args.users,
+        "turns": turns,
+        "failed_turns": len(failures),
+        "wall_seconds": wall,
+        "throughput_turns_per_second": turns / wall,
+        "p50_ms": percentiles[0] * 1000,
+        "p95_ms": percentiles[1] * 1000,
+        "p99_ms": percentiles[2] * 1000,
+        "cpu_seconds": cpu,
+        "cpu_ms_per_turn": cpu / turns * 1000 if turns else 0.0,
+        "memory_per_session_kb": (memory_after - memory_before) / args.users / 1024,
+        "peak_memory_mb": memory_peak / 2**20,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--turn-rate", type=float, default=0.2, help="turns/s per user")
+    parser.add_argument("--mean-words", type=float, default=20.0)
+    parser.add_argument("--sigma", type=float, default=0.8)
+    parser.add_argument("--agent", choices=["smart", "amnesic"], default="smart")
+    parser.add_argument("--mode", choices=["async", "threads"], default="async")
+    parser.add_argument("--threads", type=int, help="worker threads for --mode threads")
+    parser.add_argument("--latency", type=float, default=0.5, help="backend seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="backend seconds")
+    parser.add_argument("--slow-fraction", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="seconds")
+    parser.add_argument("--timeout", type=float, help="request timeout in seconds")
+    parser.add_argument("--hedge", action="store_true", help="hedge slow requests")
+    parser.add_argument("--requests-per-minute", type=float, default=float("inf"))
+    parser.add_argument("--tokens-per-minute", type=float, default=float("inf"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the metrics to this JSON file")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    set_rate_limiter(
+        RateLimiter(
+            requests_per_minute=args.requests_per_minute,
+            tokens_per_minute=args.tokens_per_minute,
+        )
+    )
+    backend = FakeOpenAI(
+        latency=args.latency,
+        jitter=args.jitter,
+        seed=args.seed,
+        slow_fraction=args.slow_fraction,
+        slow_latency=args.slow_latency,
+    )
+    with backend.installed(tokenizer=True):
+        metrics = asyncio.run(run_load(args))
+
+    for name, value in metrics.items():
+        print(f"{name:30} {value:12.2f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(metrics, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,11 +5,18 @@ smart_agent.py
 This module defines the Agent classes used for interacting with the chatbot library.
 """
 from abc import ABC, abstractmethod
-from bs4 import BeautifulSoup, FeatureNotFound
+from chatbot_library.utils.async_conversation_manager import AsyncConversationManager
 from chatbot_library.utils.conversation_manager import ConversationManager
-from googleapiclient.discovery import build
-import os
-import requests
+from chatbot_library.utils.deadline import Deadline
+from chatbot_library.utils.instrumentation import timed
+from chatbot_library.utils.message import Message
+from chatbot_library.utils.response_cache import ResponseCache
+from chatbot_library.utils.search import GoogleSearchClient, get_search_client
+from chatbot_library.utils.summarizer import Summarizer
+from chatbot_library.utils.web import fetch_page_text
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Union
+import asyncio
 
 
 class Agent(ABC):
@@ -26,38 +33,305 @@ class Agent(ABC):
         self.temperature = temperature
 
     @abstractmethod
-    def get_response(self, message: str) -> str:
+    def get_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> str:
         """
         Returns a response to the given message.
 
         :param message: A string representing the user's message.
+        :param deadline: A Deadline or a number of seconds bounding the whole turn, by default
+            the conversation manager's request_timeout for each request.
         :return: A string representing the chatbot's response.
+        :raises ChatError: If no response can be produced in time.
         """
         pass
 
+    async def aget_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> str:
+        """
+        Asynchronous version of get_response.
+
+        Agents backed by an AsyncConversationManager hold its lock for the whole turn, so
+        concurrent turns on the same conversation do not interleave. Otherwise get_response runs
+        in a worker thread.
+
+        :param message: A string representing the user's message.
+        :param deadline: A Deadline or a number of seconds bounding the whole turn.
+        :return: A string representing the chatbot's response.
+        """
+        return await asyncio.to_thread(
+            self.get_response, message, Deadline.of(deadline)
+        )
+
+    def stream_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> Iterator[str]:
+        """
+        Streams a response to the given message as it is generated.
+
+        Agents that do not support streaming yield the whole response at once.
+
+        :param message: A string representing the user's message.
+        :param deadline: A Deadline or a number of seconds bounding the whole turn.
+        :return: An iterator of strings, each a piece of the chatbot's response.
+        """
+        yield self.get_response(message, deadline)
+
+    async def astream_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> AsyncIterator[str]:
+        """
+        Asynchronous version of stream_response.
+
+        :param message: A string representing the user's message.
+        :param deadline: A Deadline or a number of seconds bounding the whole turn.
+        :return: An asynchronous iterator of strings, each a piece of the chatbot's response.
+        """
+        yield await self.aget_response(message, deadline)
+
 
 class AmnesicAgent(Agent):
     """
     Amnesic agent that doesn't remember previous interactions.
+
+    Since its responses only depend on the message, an optional ResponseCache can answer
+    repeated messages without another completion request.
     """
 
     def __init__(
         self,
         conversation_manager: ConversationManager,
         temperature: float = 1,
+        response_cache: Optional[ResponseCache] = None,
     ):
         super().__init__(conversation_manager, temperature)
+        self.response_cache = response_cache
+
+    def _lookup_exact(self):
+        messages = self.conversation_manager.messages_objs_to_dicts(
+            self.conversation_manager.chat_log
+        )
+        response = self.response_cache.get_exact(
+            self.conversation_manager.model,
+            self.conversation_manager.temperature,
+            messages,
+        )
+        return messages, response
+
+    def _lookup_similar(self, messages, embedding):
+        return self.response_cache.get(
+            self.conversation_manager.model,
+            self.conversation_manager.temperature,
+            messages,
+            embedding,
+        )
 
-    def get_response(self, message: str) -> str:
+    def _lookup_response(self):
+        """
+        Looks up the current request in the response cache. The user's message is only embedded
+        when the exact tier misses.
+
+        :return: A tuple of (request messages, cached response or None, embedding or None).
+        """
+        messages, response = self._lookup_exact()
+        if response is not None:
+            return messages, response, None
+        embedding = self._message_embedding()
+        return messages, self._lookup_similar(messages, embedding), embedding
+
+    async def _alookup_response(self):
+        """
+        Asynchronous version of _lookup_response.
+
+        :return: A tuple of (request messages, cached response or None, embedding or None).
+        """
+        messages, response = self._lookup_exact()
+        if response is not None:
+            return messages, response, None
+        embedding = await self._amessage_embedding()
+        return messages, self._lookup_similar(messages, embedding), embedding
+
+    def _store_response(self, messages, response: str, embedding=None) -> None:
+        self.response_cache.set(
+            self.conversation_manager.model,
+            self.conversation_manager.temperature,
+            messages,
+            response,
+            embedding,
+        )
+
+    def _message_embedding(self):
+        if self.response_cache.semantic_threshold is None:
+            return None
+        return self.conversation_manager.chat_log[-1].embedding
+
+    async def _amessage_embedding(self):
+        if self.response_cache.semantic_threshold is None:
+            return None
+        return await self.conversation_manager.chat_log[-1].aembed()
+
+    def get_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> str:
+        self.conversation_manager.append_user_message(message)
+        try:
+            if self.response_cache is None:
+                return self.conversation_manager.get_chatbot_response(deadline=deadline)
+            messages, response, embedding = self._lookup_response()
+            if response is None:
+                response = self.conversation_manager.get_chatbot_response(
+                    deadline=deadline
+                )
+                self._store_response(messages, response, embedding)
+            return response
+        finally:
+            self.conversation_manager.reset_chat_log()
+
+    async def aget_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> str:
+        if not isinstance(self.conversation_manager, AsyncConversationManager):
+            return await super().aget_response(message, deadline)
+        async with self.conversation_manager.lock:
+            self.conversation_manager.append_user_message(message)
+            try:
+                if self.response_cache is None:
+                    return await self.conversation_manager.aget_chatbot_response(
+                        deadline=deadline
+                    )
+                messages, response, embedding = await self._alookup_response()
+                if response is None:
+                    response = await self.conversation_manager.aget_chatbot_response(
+                        deadline=deadline
+                    )
+                    self._store_response(messages, response, embedding)
+                return response
+            finally:
+                self.conversation_manager.reset_chat_log()
+
+    def stream_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> Iterator[str]:
         self.conversation_manager.append_user_message(message)
-        response = self.conversation_manager.get_chatbot_response()
-        self.conversation_manager.reset_chat_log()
-        return response
+        try:
+            if self.response_cache is None:
+                yield from self.conversation_manager.stream_chatbot_response(deadline)
+                return
+            messages, response, embedding = self._lookup_response()
+            if response is not None:
+                yield response
+                return
+            parts = []
+            for delta in self.conversation_manager.stream_chatbot_response(deadline):
+                parts.append(delta)
+                yield delta
+            self._store_response(messages, "".join(parts), embedding)
+        finally:
+            self.conversation_manager.reset_chat_log()
+
+    async def astream_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> AsyncIterator[str]:
+        if not isinstance(self.conversation_manager, AsyncConversationManager):
+            async for delta in super().astream_response(message, deadline):
+                yield delta
+            return
+        async with self.conversation_manager.lock:
+            self.conversation_manager.append_user_message(message)
+            try:
+                stream = self.conversation_manager.astream_chatbot_response(deadline)
+                if self.response_cache is None:
+                    async for delta in stream:
+                        yield delta
+                    return
+                messages, response, embedding = await self._alookup_response()
+                if response is not None:
+                    yield response
+                    return
+                parts = []
+                async for delta in stream:
+                    parts.append(delta)
+                    yield delta
+                self._store_response(messages, "".join(parts), embedding)
+            finally:
+                self.conversation_manager.reset_chat_log()
+
+    def batch(
+        self, messages: List[str], max_workers: int = 8
+    ) -> List[Union[str, Exception]]:
+        """
+        Answers many messages concurrently, as if get_response were called for each one.
+
+        Requests run on a pool of max_workers threads within the shared rate limits. Messages
+        found in the response cache's exact tier are answered without a request.
+
+        :param messages: A list of strings, each a user message.
+        :param max_workers: The maximum number of requests in flight.
+        :return: A list with, in the order of the messages, either the response or the
+            exception that request raised.
+        """
+        results, missing = self._batch_lookup(messages)
+        responses = self.conversation_manager.get_chatbot_responses(
+            [messages[i] for i in missing], max_workers
+        )
+        return self._batch_store(messages, results, missing, responses)
+
+    async def abatch(
+        self, messages: List[str], max_concurrency: int = 32
+    ) -> List[Union[str, Exception]]:
+        """
+        Asynchronous version of batch. Without an AsyncConversationManager, batch runs in a
+        worker thread.
+
+        :param messages: A list of strings, each a user message.
+        :param max_concurrency: The maximum number of requests in flight.
+        :return: A list with, in the order of the messages, either the response or the
+            exception that request raised.
+        """
+        if not isinstance(self.conversation_manager, AsyncConversationManager):
+            return await asyncio.to_thread(self.batch, messages, max_concurrency)
+        results, missing = self._batch_lookup(messages)
+        responses = await self.conversation_manager.aget_chatbot_responses(
+            [messages[i] for i in missing], max_concurrency
+        )
+        return self._batch_store(messages, results, missing, responses)
+
+    def _batch_lookup(self, messages: List[str]):
+        results = [None] * len(messages)
+        if self.response_cache is None:
+            return results, list(range(len(messages)))
+        missing = []
+        for i, message in enumerate(messages):
+            results[i] = self.response_cache.get(
+                self.conversation_manager.model,
+                self.conversation_manager.temperature,
+                self._batch_request(message),
+            )
+            if results[i] is None:
+                missing.append(i)
+        return results, missing
+
+    def _batch_store(self, messages, results, missing, responses):
+        for i, response in zip(missing, responses):
+            results[i] = response
+            if self.response_cache is not None and isinstance(response, str):
+                self._store_response(self._batch_request(messages[i]), response)
+        return results
+
+    def _batch_request(self, message: str):
+        return self.conversation_manager.messages_objs_to_dicts(
+            self.conversation_manager.prompt_messages(message)
+        )
 
 
 class SmartAgent(Agent):
     """
     Smart agent that can remember previous interactions and perform web searches.
+
+    Searches go through search_client, by default the process-wide GoogleSearchClient, which
+    caches results and shares one service between agents.
     """
 
     def __init__(
@@ -65,17 +339,77 @@ class SmartAgent(Agent):
         conversation_manager: ConversationManager,
         temperature: float = 1.0,
         personality: str = "",
+        search_client: Optional[GoogleSearchClient] = None,
     ) -> None:
         super().__init__(conversation_manager, temperature)
         self.personality = personality
+        self.search_client = search_client
+        # The number of tokens of page text sent per summarization request.
+        self.summary_chunk_tokens = 2000
         if personality:
             conversation_manager.initialize_conversation(self.personality)
 
-    def get_response(self, message: str) -> str:
+    def get_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> str:
         self.conversation_manager.append_user_message(message)
-        response = self.conversation_manager.get_chatbot_response()
-        return response
+        try:
+            return self.conversation_manager.get_chatbot_response(deadline=deadline)
+        except BaseException:
+            self._withdraw(message)
+            raise
 
+    async def aget_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> str:
+        if not isinstance(self.conversation_manager, AsyncConversationManager):
+            return await super().aget_response(message, deadline)
+        async with self.conversation_manager.lock:
+            self.conversation_manager.append_user_message(message)
+            try:
+                return await self.conversation_manager.aget_chatbot_response(
+                    deadline=deadline
+                )
+            except BaseException:
+                self._withdraw(message)
+                raise
+
+    def stream_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> Iterator[str]:
+        self.conversation_manager.append_user_message(message)
+        try:
+            yield from self.conversation_manager.stream_chatbot_response(deadline)
+        except BaseException:
+            self._withdraw(message)
+            raise
+
+    async def astream_response(
+        self, message: str, deadline: Union[Deadline, float, None] = None
+    ) -> AsyncIterator[str]:
+        if not isinstance(self.conversation_manager, AsyncConversationManager):
+            async for delta in super().astream_response(message, deadline):
+                yield delta
+            return
+        async with self.conversation_manager.lock:
+            self.conversation_manager.append_user_message(message)
+            try:
+                async for delta in self.conversation_manager.astream_chatbot_response(
+                    deadline
+                ):
+                    yield delta
+            except BaseException:
+                self._withdraw(message)
+                raise
+
+    def _withdraw(self, message: str) -> None:
+        # A turn that failed, or was closed or cancelled before the reply was complete, takes
+        # its user message back out, so the next request has no unanswered message in it.
+        chat_log = self.conversation_manager.chat_log
+        if chat_log and chat_log[-1].role == "user" and chat_log[-1].content == message:
+            self.conversation_manager.pop_last_message()
+
+    @timed("google_search")
     def search_google(self, query: str) -> str:
         """
         Searches Google ofr the given query and returns the top 3 results.
@@ -83,12 +417,7 @@ class SmartAgent(Agent):
         :param query: A string representing the search query
         :return: A formatted string containing the top 3 search results.
         """
-        api_key = os.environ["GOOGLE_API_KEY"]
-        cse_id = os.environ["GOOGLE_CSE_ID"]
-        service = build("customsearch", "v1", developerKey=api_key)
-        results = service.cse().list(q=query, cx=cse_id, num=3).execute()
-
-        top_results = results.get("items", [])
+        top_results = self._search_results(query, 3)
         formatted_results = ""
 
         for i, result in enumerate(top_results[:3]):
@@ -98,22 +427,190 @@ class SmartAgent(Agent):
 
         return formatted_results.strip()
 
+    def _search_results(self, query: str, num: int) -> List[Dict[str, str]]:
+        search_client = self.search_client or get_search_client()
+        return search_client.search(query, num)
+
+    async def asearch_google(self, query: str) -> str:
+        """
+        Asynchronous version of search_google. The Google client is blocking, so the search runs
+        in a worker thread.
+
+        :param query: A string representing the search query
+        :return: A formatted string containing the top 3 search results.
+        """
+        return await asyncio.to_thread(self.search_google, query)
+
+    @timed("web_fetch")
+    def _fetch_page_text(self, url: str, deadline: Optional[Deadline] = None) -> str:
+        return fetch_page_text(url, deadline=deadline)
+
+    def research(
+        self,
+        query: str,
+        num_results: int = 3,
+        deadline: Union[Deadline, float, None] = None,
+    ) -> str:
+        """
+        Answers a query from the top web search results.
+
+        Each result is fetched and summarized on its own thread, so the research takes about as
+        long as the slowest page rather than the sum of all of them. The summaries are then
+        merged into one answer. Only the query and the answer are added to the chat log; pages
+        that cannot be fetched or summarized are left out.
+
+        :param query: A string representing the research question.
+        :param num_results: The number of search results to read.
+        :param deadline: A Deadline or a number of seconds bounding the whole research. Pages
+            not summarized in time are left out.
+        :return: A string representing the merged answer.
+        :raises ChatError: If the answer cannot be produced in time.
+        """
+        deadline = Deadline.of(deadline)
+        results = self._search_results(query, num_results)[:num_results]
+        if not results:
+            return "No search results were found."
+        with ThreadPoolExecutor(max_workers=len(results)) as executor:
+            summaries = list(
+                executor.map(
+                    lambda result: self._research_page(query, result, deadline),
+                    results,
+                )
+            )
+        return self._merge_research(query, summaries, deadline)
+
+    async def aresearch(
+        self,
+        query: str,
+        num_results: int = 3,
+        deadline: Union[Deadline, float, None] = None,
+    ) -> str:
+        """
+        Asynchronous version of research. Pages are fetched in worker threads and summarized
+        with asynchronous requests when the manager is an AsyncConversationManager.
+
+        :param query: A string representing the research question.
+        :param num_results: The number of search results to read.
+        :param deadline: A Deadline or a number of seconds bounding the whole research.
+        :return: A string representing the merged answer.
+        """
+        deadline = Deadline.of(deadline)
+        if not isinstance(self.conversation_manager, AsyncConversationManager):
+            return await asyncio.to_thread(self.research, query, num_results, deadline)
+        results = await asyncio.to_thread(self._search_results, query, num_results)
+        results = results[:num_results]
+        if not results:
+            return "No search results were found."
+        summaries = await asyncio.gather(
+            *(self._aresearch_page(query, result, deadline) for result in results)
+        )
+        async with self.conversation_manager.lock:
+            answer = await self.conversation_manager.acreate_chat_completion(
+                [Message("user", self._merge_prompt(query, summaries))],
+                deadline=deadline,
+            )
+            self._record_research(query, answer)
+        return answer
+
+    def _research_page(
+        self, query: str, result: Dict[str, str], deadline: Optional[Deadline] = None
+    ) -> Optional[str]:
+        try:
+            text = self._fetch_page_text(result["link"], deadline)
+            return self.summarizer().summarize(text, query, deadline) or None
+        except Exception as e:
+            self.conversation_manager.logger.warning(
+                "Skipping %s: %s", result.get("link"), e
+            )
+            return None
+
+    async def _aresearch_page(
+        self, query: str, result: Dict[str, str], deadline: Optional[Deadline] = None
+    ) -> Optional[str]:
+        try:
+            text = await asyncio.to_thread(
+                self._fetch_page_text, result["link"], deadline
+            )
+            return await self.summarizer().asummarize(text, query, deadline) or None
+        except Exception as e:
+            self.conversation_manager.logger.warning(
+                "Skipping %s: %s", result.get("link"), e
+            )
+            return None
+
+    def summarizer(self) -> Summarizer:
+        """
+        Returns a Summarizer that sends its requests through this agent's conversation manager
+        without adding them to the chat log.
+
+        :return: A Summarizer.
+        """
+        return Summarizer(self.conversation_manager, self.summary_chunk_tokens)
+
+    def _merge_prompt(self, query: str, summaries: List[Optional[str]]) -> str:
+        sources = "\n\n".join(
+            f"Source {i + 1}: {summary}"
+            for i, summary in enumerate(summaries)
+            if summary
+        )
+        return (
+            f"Using the following summaries of web pages, answer: {query}\n\n"
+            f"{sources or 'No page could be read.'}"
+        )
+
+    def _merge_research(
+        self,
+        query: str,
+        summaries: List[Optional[str]],
+        deadline: Optional[Deadline] = None,
+    ) -> str:
+        answer = self.conversation_manager.create_chat_completion(
+            [Message("user", self._merge_prompt(query, summaries))], deadline=deadline
+        )
+        self._record_research(query, answer)
+        return answer
+
+    def _record_research(self, query: str, answer: str) -> None:
+        self.conversation_manager.append_user_message(query)
+        self.conversation_manager.append_bot_message(answer)
+
     def get_webpage_summary(self, url: str) -> str:
         """
         Retrieves a webpage summary by fetching its content and asking the chatbot to summarize it.
 
+        Long pages are summarized in parallel chunks (see Summarizer). Only the request and the
+        final summary are added to the chat log.
+
         :param url: A string representing the URL of the webpage.
         :return: A string representing the summary of the webpage content.
         """
         try:
-            response = requests.get(url)
-            try:
-                soup = BeautifulSoup(response.text, features="xml")
-            except FeatureNotFound:
-                soup = BeautifulSoup(response.text, "html.parser")
-            print(f"BeautifulSoup: {soup}\n\n")
-            text = " ".join([p.get_text() for p in soup.find_all("p")])
-            summary = self.get_response(f"Please summarize the following text: {text}")
+            text = self._fetch_page_text(url)
+            summary = self.summarizer().summarize(text)
+            self._record_summary(url, summary)
             return summary
         except Exception as e:
             return f"An error occurred while trying to fetch and summarize the webpage content: {e}"
+
+    async def aget_webpage_summary(self, url: str) -> str:
+        """
+        Asynchronous version of get_webpage_summary. The page is fetched in a worker thread.
+
+        :param url: A string representing the URL of the webpage.
+        :return: A string representing the summary of the webpage content.
+        """
+        try:
+            text = await asyncio.to_thread(self._fetch_page_text, url)
+            summary = await self.summarizer().asummarize(text)
+            if isinstance(self.conversation_manager, AsyncConversationManager):
+                async with self.conversation_manager.lock:
+                    self._record_summary(url, summary)
+            else:
+                self._record_summary(url, summary)
+            return summary
+        except Exception as e:
+            return f"An error occurred while trying to fetch and summarize the webpage content: {e}"
+
+    def _record_summary(self, url: str, summary: str) -> None:
+        self.conversation_manager.append_user_message(f"Please summarize {url}")
+        self.conversation_manager.append_bot_message(summary)
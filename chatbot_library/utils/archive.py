@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+"""
+archive.py
+
+This module defines a binary archive format for large conversation histories. An archive is a
+directory of flat files that are memory-mapped on open, so even very large archives open
+instantly and can be searched without creating Message objects.
+
+    meta.json        roles table, message count, embedding dimension and token model
+    roles.u8         one role code per message
+    offsets.u64      n + 1 byte offsets into content.bin
+    content.bin      the UTF-8 encoded contents, back to back
+    tokens.i32       cached token counts, -1 where unknown
+    embeddings.f32   an n x dim matrix of the embeddings as computed, zero rows where unknown
+    norms.f32        the norm of each embedding, 0 where unknown
+"""
+
+import json
+import os
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from chatbot_library.utils.message import Message
+from chatbot_library.utils.tokens import DEFAULT_TOKEN_MODEL
+
+ARCHIVE_VERSION = 2
+
+
+def export_archive(
+    messages: Iterable[Message],
+    directory: str,
+    token_model: str = DEFAULT_TOKEN_MODEL,
+) -> int:
+    """
+    Writes messages to an archive directory.
+
+    Token counts and embeddings are only written if they are already cached on the messages;
+    nothing is computed during the export.
+
+    :param messages: An iterable of Message objects.
+    :param directory: A string representing the path of the archive directory.
+    :param token_model: The model whose cached token counts are stored.
+    :return: The number of messages written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    roles: List[str] = []
+    role_codes: Dict[str, int] = {}
+    codes = bytearray()
+    offsets = [0]
+    tokens: List[int] = []
+    vectors: List[Tuple[int, np.ndarray]] = []
+
+    with open(os.path.join(directory, "content.bin"), "wb") as content_file:
+        for position, message in enumerate(messages):
+            if message.role not in role_codes:
+                if len(roles) == 256:
+                    raise ValueError("An archive can hold at most 256 distinct roles.")
+                role_codes[message.role] = len(roles)
+                roles.append(message.role)
+            codes.append(role_codes[message.role])
+
+            content = message.content.encode("utf-8")
+            content_file.write(content)
+            offsets.append(offsets[-1] + len(content))
+            num_tokens = message.cached_num_tokens(token_model)
+            tokens.append(-1 if num_tokens is None else num_tokens)
+            if message.has_embedding():
+                vectors.append((position, message.embedding_vector()))
+
+    num_messages = len(codes)
+    dim = len(vectors[0][1]) if vectors else 0
+    embeddings = np.zeros((num_messages, dim), dtype=np.float32)
+    norms = np.zeros(num_messages, dtype=np.float32)
+    for position, vector in vectors:
+        embeddings[position] = vector
+        norms[position] = np.linalg.norm(vector)
+
+    np.frombuffer(bytes(codes), dtype=np.uint8).tofile(
+        os.path.join(directory, "roles.u8")
+    )
+    np.asarray(offsets, dtype=np.uint64).tofile(os.path.join(directory, "offsets.u64"))
+    np.asarray(tokens, dtype=np.int32).tofile(os.path.join(directory, "tokens.i32"))
+    embeddings.tofile(os.path.join(directory, "embeddings.f32"))
+    norms.tofile(os.path.join(directory, "norms.f32"))
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "version": ARCHIVE_VERSION,
+                "count": num_messages,
+                "dim": dim,
+                "roles": roles,
+                "token_model": token_model,
+            },
+            f,
+            indent=4,
+        )
+    return num_messages
+
+
+class ChatArchive:
+    """
+    A read-only, memory-mapped view of an archive written by export_archive.
+
+    Usage:
+        archive = ChatArchive(directory)
+        for position, score in archive.search(query_embedding, k=10):
+            print(archive[position])
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta["version"] != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported archive version: {meta['version']}")
+        self.roles: List[str] = meta["roles"]
+        self.token_model: str = meta["token_model"]
+        self.dim: int = meta["dim"]
+        self._count: int = meta["count"]
+
+        self.role_codes = self._map("roles.u8", np.uint8)
+        self.offsets = self._map("offsets.u64", np.uint64)
+        self.content = self._map("content.bin", np.uint8)
+        self.tokens = self._map("tokens.i32", np.int32)
+        self.embeddings = self._map("embeddings.f32", np.float32).reshape(
+            self._count, self.dim
+        )
+        self.norms = self._map("norms.f32", np.float32)
+        # Messages without an embedding have a zero row, which must never match.
+        self.has_embedding = self.norms > 0
+        self._num_embedded = int(np.count_nonzero(self.has_embedding))
+
+    def _map(self, name: str, dtype) -> np.ndarray:
+        path = os.path.join(self.directory, name)
+        if os.path.getsize(path) == 0:
+            # Empty files cannot be memory-mapped.
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def role(self, position: int) -> str:
+        return self.roles[self.role_codes[position]]
+
+    def content_at(self, position: int) -> str:
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        return self.content[start:end].tobytes().decode("utf-8")
+
+    def __getitem__(self, position: int) -> Dict[str, str]:
+        """
+        Returns a message in the same shape that Message.from_dict accepts.
+
+        :param position: The position of the message in the archive.
+        :return: A dictionary with 'role' and 'content' keys.
+        """
+        if not -self._count <= position < self._count:
+            raise IndexError("archive index out of range")
+        position %= self._count
+        return {"role": self.role(position), "content": self.content_at(position)}
+
+    def __iter__(self):
+        for position in range(self._count):
+            yield self[position]
+
+    def message(self, position: int) -> Message:
+        """
+        Rebuilds a Message, restoring its cached token count and embedding.
+
+        Embeddings come back as they were exported.
+
+        :param position: The position of the message in the archive.
+        :return: A Message object.
+        """
+        record = self[position]
+        position %= self._count
+        if self.tokens[position] >= 0:
+            record["tokens"] = {self.token_model: int(self.tokens[position])}
+        message = Message.from_record(record)
+        if self.dim and self.has_embedding[position]:
+            message.embedding = array("f", self.embeddings[position].tobytes())
+        return message
+
+    def messages(self) -> List[Message]:
+        """
+        Rebuilds every Message in the archive.
+
+        :return: A list of Message objects.
+        """
+        return [self.message(position) for position in range(self._count)]
+
+    def search(self, query_embedding, k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Finds the archived messages most similar to a query embedding.
+
+        :param query_embedding: A sequence of floats representing the query's embedding.
+        :param k: The maximum number of results.
+        :return: A list of (position, cosine similarity) pairs, most similar first. Messages
+            archived without an embedding are never returned.
+        """
+        if not self._num_embedded or not self.dim or k <= 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = np.full(self._count, -np.inf, dtype=np.float32)
+        np.divide(
+            self.embeddings @ query, self.norms, out=scores, where=self.has_embedding
+        )
+        k = min(k, self._num_embedded)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(position), float(scores[position])) for position in top]
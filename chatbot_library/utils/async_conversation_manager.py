@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+"""
+async_conversation_manager.py
+
+This module defines the AsyncConversationManager, which adds coroutine versions of the network
+bound ConversationManager methods so many conversations can be served from one event loop.
+"""
+
+import asyncio
+import functools
+import time
+from typing import AsyncIterator, List, Optional, Union
+
+import openai
+
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.deadline import ChatError, ChatRequestError, Deadline
+from chatbot_library.utils.hedging import acall_with_deadline, get_latency_tracker
+from chatbot_library.utils.instrumentation import increment, timed, timer
+from chatbot_library.utils.message import EmbeddingBatcher, Message
+from chatbot_library.utils.rate_limiter import get_rate_limiter
+
+
+class AsyncConversationManager(ConversationManager):
+    """
+    A ConversationManager whose chat, embedding and search calls can be awaited.
+
+    The synchronous API stays available. Each manager holds one conversation, and its lock is
+    meant to be held for a whole turn so that concurrent turns on the same log do not interleave:
+
+        async with conversation_manager.lock:
+            conversation_manager.append_user_message(message)
+            response = await conversation_manager.aget_chatbot_response()
+    """
+
+    def __init__(self, model: str = "gpt-3.5-turbo", temperature: float = 1.0) -> None:
+        super().__init__(model, temperature)
+        self.lock = asyncio.Lock()
+
+    def fork(self) -> "AsyncConversationManager":
+        """
+        Returns a branch of the conversation with its own lock. See ConversationManager.fork.
+
+        :return: A new AsyncConversationManager.
+        """
+        branch = super().fork()
+        branch.lock = asyncio.Lock()
+        return branch
+
+    async def aget_chatbot_response(
+        self, message: str = "", deadline: Union[Deadline, float, None] = None
+    ) -> str:
+        """
+        Asynchronous version of get_chatbot_response. Cancelling the awaiting task cancels
+        the request.
+
+        :param deadline: A Deadline or a number of seconds bounding the request, by default
+            request_timeout.
+        :return: A string representing the chatbot's response.
+        :raises ChatTimeoutError: If the response does not arrive before the deadline.
+        :raises ChatCancelledError: If the deadline is cancelled first.
+        :raises ChatRequestError: If the request fails.
+        """
+        try:
+            messages = await self.acontext_messages()
+            content = await self.acreate_chat_completion(
+                messages,
+                estimated_tokens=(
+                    self.total_tokens() if messages is self.chat_log else None
+                ),
+                deadline=deadline,
+            )
+        except ChatError:
+            increment("chat_errors")
+            raise
+        except Exception as e:
+            increment("chat_errors")
+            raise ChatRequestError(f"Error generating assistant response: {e}") from e
+        self.append_bot_message(content)
+        return content
+
+    async def acontext_messages(self) -> List[Message]:
+        """
+        Asynchronous version of context_messages, which embeds the chat log without blocking.
+
+        :return: A list of Message objects, in chronological order.
+        """
+        memories = await self.arecall_memories()
+        budget = self._context_budget(memories)
+        if budget is None or self.total_tokens() <= budget:
+            return self._with_memories(self.chat_log, memories)
+        similarities = None
+        if self.relevance_weight > 0:
+            try:
+                await self.embedding_index.aembed_pending()
+                similarities = self.embedding_index.similarities(
+                    await self.chat_log[-1].aembed(), self.chat_log
+                )
+            except Exception as e:
+                self.logger.warning("Selecting context by recency only: %s", e)
+        return self._with_memories(self._pack_context(similarities, budget), memories)
+
+    async def arecall_memories(self) -> List[Message]:
+        """
+        Asynchronous version of recall_memories.
+
+        :return: A list of Message objects, empty without a long_term_memory.
+        """
+        if not self.long_term_memory or not self.chat_log:
+            return []
+        try:
+            await self.long_term_memory.aembed_pending()
+            results = self.long_term_memory.search(
+                await self.chat_log[-1].aembed(), self.memory_k
+            )
+        except Exception as e:
+            self.logger.warning("Skipping long-term memory: %s", e)
+            return []
+        return self._select_memories(results)
+
+    @timed("chat")
+    async def acreate_chat_completion(
+        self,
+        messages: List[Message],
+        estimated_tokens: Optional[int] = None,
+        deadline: Union[Deadline, float, None] = None,
+    ) -> str:
+        """
+        Asynchronous version of create_chat_completion.
+
+        :param messages: A list of Message objects making up the request.
+        :param estimated_tokens: The request's token count, if already known.
+        :param deadline: A Deadline or a number of seconds bounding the request, by default
+            request_timeout.
+        :return: A string representing the chatbot's response.
+        """
+        deadline = self._deadline(deadline)
+        request = functools.partial(
+            get_rate_limiter().acall,
+            self._acreate,
+            deadline,
+            deadline=deadline,
+            estimated_tokens=(
+                estimated_tokens
+                if estimated_tokens is not None
+                else self.num_tokens_from_messages(messages)
+            ),
+            model=self.model,
+            messages=self.messages_objs_to_dicts(messages),
+            temperature=self.temperature,
+        )
+        hedge_delay = self._hedge_delay()
+        if deadline is None and hedge_delay is None:
+            response = await request()
+        else:
+            response = await acall_with_deadline(
+                request, deadline or Deadline(), hedge_delay
+            )
+        return response["choices"][0]["message"]["content"]
+
+    async def _acreate(self, deadline: Optional[Deadline], **kwargs):
+        if deadline is not None:
+            deadline.check()
+            if deadline.expires_at is not None:
+                kwargs["request_timeout"] = deadline.remaining()
+        start = time.monotonic()
+        response = await openai.ChatCompletion.acreate(**kwargs)
+        if not kwargs.get("stream"):
+            get_latency_tracker(self.model).record(time.monotonic() - start)
+        return response
+
+    async def aget_chatbot_responses(
+        self, prompts: List[str], max_concurrency: int = 32
+    ) -> List[Union[str, Exception]]:
+        """
+        Asynchronous version of get_chatbot_responses, with at most max_concurrency requests
+        in flight.
+
+        :param prompts: A list of strings, each a user message.
+        :param max_concurrency: The maximum number of requests in flight.
+        :return: A list with, in the order of the prompts, either the response or the exception
+            that request raised.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def complete(prompt: str) -> Union[str, Exception]:
+            async with semaphore:
+                try:
+                    return await self.acreate_chat_completion(
+                        self.prompt_messages(prompt)
+                    )
+                except Exception as e:
+                    increment("chat_errors")
+                    return e
+
+        return await asyncio.gather(*(complete(prompt) for prompt in prompts))
+
+    async def astream_chatbot_response(
+        self, deadline: Union[Deadline, float, None] = None
+    ) -> AsyncIterator[str]:
+        """
+        Asynchronous version of stream_chatbot_response.
+
+        The complete response is appended to the chat log only once the stream finishes, so a
+        cancelled or closed stream leaves no partial message behind.
+
+        :param deadline: A Deadline or a number of seconds bounding the whole stream, by
+            default request_timeout.
+        :return: An asynchronous iterator of strings, each a piece of the response.
+        """
+        deadline = self._deadline(deadline)
+        try:
+            messages = await self.acontext_messages()
+            request = functools.partial(
+                get_rate_limiter().acall,
+                self._acreate,
+                deadline,
+                deadline=deadline,
+                estimated_tokens=self.num_tokens_from_messages(messages),
+                model=self.model,
+                messages=self.messages_objs_to_dicts(messages),
+                temperature=self.temperature,
+                stream=True,
+            )
+            with timer("chat_stream_open"):
+                response = await (
+                    request()
+                    if deadline is None
+                    else acall_with_deadline(request, deadline)
+                )
+        except ChatError:
+            increment("chat_errors")
+            raise
+        except Exception as e:
+            increment("chat_errors")
+            raise ChatRequestError(f"Error generating assistant response: {e}") from e
+
+        parts = []
+        chunks = response.__aiter__()
+        try:
+            while True:
+                try:
+                    if deadline is None:
+                        chunk = await chunks.__anext__()
+                    else:
+                        chunk = await acall_with_deadline(chunks.__anext__, deadline)
+                except StopAsyncIteration:
+                    break
+                delta = chunk["choices"][0]["delta"].get("content")
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except ChatError:
+            increment("chat_errors")
+            raise
+        except Exception as e:
+            increment("chat_errors")
+            raise ChatRequestError(f"Error generating assistant response: {e}") from e
+        finally:
+            if hasattr(response, "aclose"):
+                await response.aclose()
+        self.append_bot_message("".join(parts))
+
+    async def aembed_chat_log(self) -> int:
+        """Asynchronous version of embed_chat_log."""
+        batcher = EmbeddingBatcher()
+        batcher.add_all(self.chat_log)
+        return await batcher.aflush()
+
+    @timed("semantic_search")
+    async def asemantic_search(self, query: str, k: int = 5) -> List[Message]:
+        """
+        Asynchronous version of semantic_search. The query and any pending messages are
+        embedded concurrently.
+
+        :param query: A string representing the search query.
+        :param k: The maximum number of messages to return.
+        :return: A list of Message objects, most similar first.
+        """
+        query_message = Message("user", query)
+        query_embedding, _ = await asyncio.gather(
+            query_message.aembed(), self.embedding_index.aembed_pending()
+        )
+        return [
+            msg for msg, _ in await self.embedding_index.asearch(query_embedding, k)
+        ]
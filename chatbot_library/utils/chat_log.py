@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""
+chat_log.py
+
+This module defines the ChatLog, the list of messages kept by a ConversationManager, which can
+be forked without copying it.
+"""
+
+from collections.abc import MutableSequence
+from itertools import chain, islice
+from typing import Iterator, List, Optional
+
+from chatbot_library.utils.message import Message
+
+
+class ChatLog(MutableSequence):
+    """
+    A list of messages made of a prefix shared with other logs and a tail of its own.
+
+    fork moves the tail to the end of the prefix and returns a log that shares the whole
+    prefix. A shared prefix is only ever extended, never changed, and each log only sees its
+    first prefix_len messages, so logs can keep extending it for their next forks without
+    affecting each other. Messages appended afterwards go to each log's own tail. A log copies
+    its part of the prefix the first time it removes or replaces one of the shared messages.
+
+    :param messages: The initial messages. The list is used as is, not copied.
+    """
+
+    def __init__(self, messages: Optional[List[Message]] = None) -> None:
+        self._prefix: List[Message] = []
+        self._prefix_len = 0
+        self._tail: List[Message] = messages if messages is not None else []
+
+    def fork(self) -> "ChatLog":
+        """
+        Returns a copy of the log that shares its messages with this one.
+
+        :return: A new ChatLog with the same messages.
+        """
+        if self._tail:
+            if len(self._prefix) != self._prefix_len:
+                # Another log has already extended the prefix past this log's part of it.
+                self._prefix = self._prefix[: self._prefix_len]
+            self._prefix.extend(self._tail)
+            self._prefix_len = len(self._prefix)
+            self._tail = []
+        branch = ChatLog()
+        branch._prefix, branch._prefix_len = self._prefix, self._prefix_len
+        return branch
+
+    def _own(self) -> None:
+        # Copies the shared messages before one of them is removed or replaced.
+        if self._prefix_len:
+            self._tail = self._prefix[: self._prefix_len] + self._tail
+            self._prefix, self._prefix_len = [], 0
+
+    def _position(self, index: int) -> int:
+        position = index + len(self) if index < 0 else index
+        if not 0 <= position < len(self):
+            raise IndexError("chat log index out of range")
+        return position
+
+    def __len__(self) -> int:
+        return self._prefix_len + len(self._tail)
+
+    def __iter__(self) -> Iterator[Message]:
+        return chain(islice(self._prefix, self._prefix_len), self._tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        position = self._position(index)
+        if position < self._prefix_len:
+            return self._prefix[position]
+        return self._tail[position - self._prefix_len]
+
+    def __setitem__(self, index, value) -> None:
+        if isinstance(index, slice):
+            self._own()
+            self._tail[index] = value
+            return
+        position = self._position(index)
+        if position < self._prefix_len:
+            self._own()
+        self._tail[position - self._prefix_len] = value
+
+    def __delitem__(self, index) -> None:
+        if isinstance(index, slice):
+            self._own()
+            del self._tail[index]
+            return
+        position = self._position(index)
+        if position < self._prefix_len:
+            self._own()
+        del self._tail[position - self._prefix_len]
+
+    def insert(self, index: int, message: Message) -> None:
+        position = max(0, index + len(self)) if index < 0 else index
+        if position < self._prefix_len:
+            self._own()
+        self._tail.insert(position - self._prefix_len, message)
+
+    def append(self, message: Message) -> None:
+        self._tail.append(message)
+
+    def pop(self, index: int = -1) -> Message:
+        position = self._position(index)
+        if position < self._prefix_len:
+            self._own()
+        return self._tail.pop(position - self._prefix_len)
+
+    def clear(self) -> None:
+        self._prefix, self._prefix_len, self._tail = [], 0, []
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (ChatLog, list)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __add__(self, other) -> List[Message]:
+        return list(self) + list(other)
+
+    def __radd__(self, other) -> List[Message]:
+        return list(other) + list(self)
+
+    def __repr__(self) -> str:
+        return f"ChatLog({list(self)!r})"
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+context.py
+
+This module selects which messages of a chat log are sent with a request when the whole log
+does not fit the context budget.
+"""
+
+from typing import List, Optional
+
+import numpy as np
+
+from chatbot_library.utils.message import Message
+from chatbot_library.utils.tokens import DEFAULT_TOKEN_MODEL, REPLY_PRIMING_TOKENS
+
+
+def score_messages(
+    num_messages: int,
+    similarities: Optional[np.ndarray] = None,
+    relevance_weight: float = 0.5,
+    recency_half_life: float = 8.0,
+) -> np.ndarray:
+    """
+    Scores messages by a mix of recency and similarity to the current message.
+
+    Recency halves every recency_half_life messages back from the end of the log. Without
+    similarities, messages are scored by recency alone.
+
+    :param num_messages: The number of messages in the log.
+    :param similarities: An array of cosine similarities to the current message, or None.
+    :param relevance_weight: The weight of similarity against recency, from 0 to 1.
+    :param recency_half_life: The number of messages over which recency halves.
+    :return: An array of scores, higher is more worth sending.
+    """
+    age = np.arange(num_messages - 1, -1, -1, dtype=np.float64)
+    recency = 0.5 ** (age / recency_half_life)
+    if similarities is None:
+        return recency
+    relevance = np.clip(np.asarray(similarities, dtype=np.float64), 0.0, 1.0)
+    return (1 - relevance_weight) * recency + relevance_weight * relevance
+
+
+def pack_context(
+    messages: List[Message],
+    max_tokens: int,
+    similarities: Optional[np.ndarray] = None,
+    relevance_weight: float = 0.5,
+    recency_half_life: float = 8.0,
+    model: str = DEFAULT_TOKEN_MODEL,
+) -> List[Message]:
+    """
+    Picks the messages to send so that the request fits max_tokens, in chronological order.
+
+    System messages and the last message are always kept. The others are chosen greedily by
+    score per token, which is the usual approximation of the knapsack problem: messages are
+    taken densest first, and one that does not fit the tokens left is skipped so that smaller
+    messages after it can still fill the budget. The prefix that fits is found with a
+    cumulative sum, so only the messages after it are visited one by one.
+
+    :param messages: The chat log.
+    :param max_tokens: The token budget of the request, including the reply priming tokens.
+    :param similarities: An array of cosine similarities to the last message, or None.
+    :param relevance_weight: The weight of similarity against recency, from 0 to 1.
+    :param recency_half_life: The number of messages over which recency halves.
+    :param model: The model whose token counts are used.
+    :return: The selected messages, in their original order.
+    """
+    num_messages = len(messages)
+    tokens = np.fromiter(
+        (message.num_tokens(model) for message in messages),
+        dtype=np.int64,
+        count=num_messages,
+    )
+    if tokens.sum() + REPLY_PRIMING_TOKENS <= max_tokens:
+        return list(messages)
+
+    pinned = np.fromiter(
+        (message.role == "system" for message in messages),
+        dtype=bool,
+        count=num_messages,
+    )
+    pinned[-1] = True
+    budget = max_tokens - REPLY_PRIMING_TOKENS - tokens[pinned].sum()
+
+    candidates = np.flatnonzero(~pinned)
+    scores = score_messages(
+        num_messages, similarities, relevance_weight, recency_half_life
+    )[candidates]
+    density = scores / np.maximum(tokens[candidates], 1)
+    # Densest first, and newest first among equally dense messages.
+    order = candidates[np.lexsort((-candidates, -density))]
+    order_tokens = tokens[order]
+    fits = np.cumsum(order_tokens) <= budget
+    prefix = len(order) if fits.all() else int(np.argmin(fits))
+    keep = pinned.copy()
+    keep[order[:prefix]] = True
+    left = budget - int(order_tokens[:prefix].sum())
+    for i, num_tokens in zip(order[prefix:].tolist(), order_tokens[prefix:].tolist()):
+        if num_tokens <= left:
+            keep[i] = True
+            left -= num_tokens
+    return [messages[i] for i in np.flatnonzero(keep)]
@@ -1,36 +1,138 @@
 #!/usr/bin/env python3
 from colored import fg, attr
-from typing import List, Dict
-from chatbot_library.utils.message import Message
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Dict, Optional, Union
+from chatbot_library.utils.archive import ChatArchive, export_archive
+from chatbot_library.utils.chat_log import ChatLog
+from chatbot_library.utils.context import pack_context
+from chatbot_library.utils.deadline import ChatError, ChatRequestError, Deadline
+from chatbot_library.utils.embedding_index import EmbeddingIndex
+from chatbot_library.utils.hedging import call_with_deadline, get_latency_tracker
+from chatbot_library.utils.instrumentation import increment, timed, timer
+from chatbot_library.utils.journal import ChatLogJournal, read_journal, write_snapshot
+from chatbot_library.utils.memory import LongTermMemory
+from chatbot_library.utils.message import EmbeddingBatcher, Message
+from chatbot_library.utils.rate_limiter import get_rate_limiter
+from chatbot_library.utils.text_index import TextIndex
+from chatbot_library.utils.tokens import DEFAULT_TOKEN_MODEL, REPLY_PRIMING_TOKENS
+import copy
+import functools
 import json
-import tiktoken
 import openai
+import os
 import sys
 import logging
+import time
+import uuid
 
 CHAT_LOG_FILE = "chat_log.json"
 
 
 class ConversationManager:
     def __init__(self, model: str = "gpt-3.5-turbo", temperature: float = 1.0) -> None:
-        # Create a logger instance
+        # Create a logger instance. The handler is added once per process, not per manager,
+        # or every message would be printed once for each manager ever created.
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(logging.INFO)
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s = %(levelname)s - %(message)s"
-        )
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
+        if not self.logger.handlers:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setLevel(logging.INFO)
+            formatter = logging.Formatter(
+                "%(asctime)s - %(name)s = %(levelname)s - %(message)s"
+            )
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
 
         # Main attributes
         self.max_tokens: int = 2000
+        self._chat_log_tokens: int = 0
+        self.embedding_index = EmbeddingIndex()
+        self.journal: Optional[ChatLogJournal] = None
+        self.text_index: Optional[TextIndex] = None
+        self.session_id: str = ""
+        # Document IDs of the chat log's messages in text_index, in chat log order.
+        self._text_doc_ids: List[int] = []
+        self._text_docs: Dict[int, Message] = {}
         self.chat_log: list = []
         self.temperature = temperature
         self.model = model
         self.system_message = None
 
+        # Context selection: when context_tokens is set, requests only carry the messages that
+        # fit it, scored by recency and similarity to the latest message.
+        self.context_tokens: Optional[int] = None
+        self.relevance_weight: float = 0.5
+        self.recency_half_life: float = 8.0
+
+        # Long-term memory: when set, trimmed messages are kept in it, and up to memory_k of
+        # them that are relevant to the latest message are sent back within memory_tokens.
+        self.long_term_memory: Optional[LongTermMemory] = None
+        self.memory_k: int = 3
+        self.memory_tokens: int = 500
+        self.memory_min_similarity: float = 0.0
+
+        # Deadlines and hedging: chat requests must complete within request_timeout seconds
+        # unless the call passes its own deadline. With hedge set, a request still running
+        # after the hedge_quantile of recent latencies is sent again, and the first answer wins.
+        self.request_timeout: Optional[float] = None
+        self.hedge: bool = False
+        self.hedge_quantile: float = 0.95
+
+    @property
+    def chat_log(self) -> ChatLog:
+        return self._chat_log
+
+    @chat_log.setter
+    def chat_log(self, messages: List[Message]) -> None:
+        # Replacing the log wholesale re-sums the cached per-message counts, so it stays cheap.
+        self._chat_log = (
+            messages.fork() if isinstance(messages, ChatLog) else ChatLog(messages)
+        )
+        self._chat_log_tokens = sum(msg.num_tokens() for msg in messages)
+        self.embedding_index.clear()
+        self.embedding_index.add_all(messages)
+        if self.text_index is not None:
+            self._reindex_text()
+        if self.journal is not None:
+            self.journal.reset(messages)
+
+    def _append_message(self, message: Message) -> None:
+        self._chat_log.append(message)
+        self._chat_log_tokens += message.num_tokens()
+        self.embedding_index.add(message)
+        if self.text_index is not None:
+            doc_id = self.text_index.add(self.session_id, message.role, message.content)
+            self._text_doc_ids.append(doc_id)
+            self._text_docs[doc_id] = message
+        if self.journal is not None:
+            self.journal.record_embeddings(self._chat_log)
+            self.journal.append(message)
+            self.journal.maybe_compact(self._chat_log)
+
+    def _pop_message(self, position: int) -> Message:
+        message = self._chat_log.pop(position)
+        self._chat_log_tokens -= message.num_tokens()
+        self.embedding_index.remove(message)
+        if self.text_index is not None:
+            doc_id = self._text_doc_ids.pop(position)
+            self.text_index.remove(doc_id)
+            del self._text_docs[doc_id]
+        if self.journal is not None:
+            self.journal.pop(position)
+        return message
+
+    def pop_last_message(self) -> Message:
+        """
+        Removes the last message of the chat log, for example to withdraw a turn that failed.
+
+        :return: The removed Message.
+        """
+        return self._pop_message(len(self._chat_log) - 1)
+
+    def total_tokens(self) -> int:
+        """Returns the number of tokens used by the chat log, without recounting it."""
+        return self._chat_log_tokens + REPLY_PRIMING_TOKENS
+
     def get_message_at(self, position: int) -> Message:
         return self.chat_log[position]
 
@@ -41,70 +143,316 @@ class ConversationManager:
         self.system_message = Message("system", system_message)
         self.chat_log = [self.system_message]
 
+    def fork(self) -> "ConversationManager":
+        """
+        Returns a branch of the conversation that can diverge from it, for instance to try
+        another system message, temperature or agent from the same history.
+
+        The branch shares the chat log, the Message objects with their cached token counts and
+        embeddings, and the embedding rows indexed so far with this manager, so forking does not
+        copy the history. Messages appended or trimmed afterwards only affect one side. Settings
+        are copied, but the branch has no journal, text index or long-term memory.
+
+        :return: A new ConversationManager of the same class.
+        """
+        branch = copy.copy(self)
+        branch._chat_log = self._chat_log.fork()
+        branch.embedding_index = self.embedding_index.fork()
+        branch.journal = None
+        branch.text_index = None
+        branch._text_doc_ids = []
+        branch._text_docs = {}
+        branch.long_term_memory = None
+        return branch
+
     def messages_objs_to_dicts(self, messages: List[Message]) -> List[Dict[str, str]]:
         return [msg.to_dict() for msg in messages]
 
-    def num_tokens_from_messages(self, messages, model="gpt-3.5-turbo-0301"):
+    def num_tokens_from_messages(self, messages, model=DEFAULT_TOKEN_MODEL):
         """Returns the number of tokens used by a list of messages."""
-        messages_as_dicts = self.messages_objs_to_dicts(messages)
+        return sum(msg.num_tokens(model) for msg in messages) + REPLY_PRIMING_TOKENS
+
+    def get_chatbot_response(
+        self, message: str = "", deadline: Union[Deadline, float, None] = None
+    ) -> str:
+        """
+        Requests the chatbot's response to the chat log and appends it to the chat log.
+
+        :param deadline: A Deadline or a number of seconds bounding the request, by default
+            request_timeout.
+        :return: A string representing the chatbot's response.
+        :raises ChatTimeoutError: If the response does not arrive before the deadline.
+        :raises ChatCancelledError: If the deadline is cancelled first.
+        :raises ChatRequestError: If the request fails.
+        """
         try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            print("Warning: model not found. Using cl100k_base encoding.")
-            encoding = tiktoken.get_encoding("cl100k_base")
-        if model == "gpt-3.5-turbo":
-            print(
-                "Warning: gpt-3.5-turbo may change over time. Returning num tokens assuming gpt-3.5-turbo-0301."
-            )
-            return self.num_tokens_from_messages(messages, model="gpt-3.5-turbo-0301")
-        elif model == "gpt-4":
-            print(
-                "Warning: gpt-4 may change over time. Returning num tokens assuming gpt-4-0314."
+            messages = self.context_messages()
+            content = self.create_chat_completion(
+                messages,
+                estimated_tokens=(
+                    self.total_tokens() if messages is self.chat_log else None
+                ),
+                deadline=deadline,
             )
-            return self.num_tokens_from_messages(messages, model="gpt-4-0314")
-        elif model == "gpt-3.5-turbo-0301":
-            tokens_per_message = (
-                4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
+        except ChatError:
+            increment("chat_errors")
+            raise
+        except Exception as e:
+            increment("chat_errors")
+            raise ChatRequestError(f"Error generating assistant response: {e}") from e
+        self.append_bot_message(content)
+        return content
+
+    def context_messages(self) -> List[Message]:
+        """
+        Returns the messages to send with the next request.
+
+        Without a context_tokens budget, or when the chat log fits it, this is the whole chat
+        log. Otherwise the system messages and the latest message are kept, and the remaining
+        budget goes to the messages with the best mix of recency and embedding similarity to
+        the latest message (see chatbot_library.utils.context.pack_context). If the embeddings
+        cannot be fetched, messages are picked by recency alone.
+
+        With a long_term_memory, the recalled messages are placed after the system messages and
+        their tokens are taken out of the budget (context_tokens, or max_tokens without it).
+
+        :return: A list of Message objects, in chronological order.
+        """
+        memories = self.recall_memories()
+        budget = self._context_budget(memories)
+        if budget is None or self.total_tokens() <= budget:
+            return self._with_memories(self.chat_log, memories)
+        similarities = None
+        if self.relevance_weight > 0:
+            try:
+                self.embedding_index.sync()
+                similarities = self.embedding_index.similarities(
+                    self.chat_log[-1].embedding, self.chat_log
+                )
+            except Exception as e:
+                self.logger.warning("Selecting context by recency only: %s", e)
+        return self._with_memories(self._pack_context(similarities, budget), memories)
+
+    @timed("pack_context")
+    def _pack_context(self, similarities, budget: int) -> List[Message]:
+        return pack_context(
+            self.chat_log,
+            budget,
+            similarities,
+            self.relevance_weight,
+            self.recency_half_life,
+        )
+
+    def recall_memories(self) -> List[Message]:
+        """
+        Retrieves the trimmed messages most relevant to the latest message from the long-term
+        memory, most relevant first, keeping at most memory_k of them within memory_tokens.
+
+        :return: A list of Message objects, empty without a long_term_memory.
+        """
+        if not self.long_term_memory or not self.chat_log:
+            return []
+        try:
+            self.long_term_memory.sync()
+            results = self.long_term_memory.search(
+                self.chat_log[-1].embedding, self.memory_k
             )
-            tokens_per_name = -1  # if there's a name, the role is omitted
-        elif model == "gpt-4-0314":
-            tokens_per_message = 3
-            tokens_per_name = 1
+        except Exception as e:
+            self.logger.warning("Skipping long-term memory: %s", e)
+            return []
+        return self._select_memories(results)
+
+    def _select_memories(self, results) -> List[Message]:
+        memories = []
+        used = 0
+        for message, similarity in results:
+            if similarity < self.memory_min_similarity:
+                break
+            if used + message.num_tokens() <= self.memory_tokens:
+                memories.append(message)
+                used += message.num_tokens()
+        return memories
+
+    def _context_budget(self, memories: List[Message]) -> Optional[int]:
+        if not memories:
+            return self.context_tokens
+        budget = (
+            self.context_tokens if self.context_tokens is not None else self.max_tokens
+        )
+        return budget - sum(message.num_tokens() for message in memories)
+
+    def _with_memories(
+        self, messages: List[Message], memories: List[Message]
+    ) -> List[Message]:
+        if not memories:
+            return messages
+        position = 0
+        while position < len(messages) and messages[position].role == "system":
+            position += 1
+        return messages[:position] + memories + messages[position:]
+
+    @timed("chat")
+    def create_chat_completion(
+        self,
+        messages: List[Message],
+        estimated_tokens: Optional[int] = None,
+        deadline: Union[Deadline, float, None] = None,
+    ) -> str:
+        """
+        Requests a completion for the given messages, without reading or changing the chat log.
+
+        :param messages: A list of Message objects making up the request.
+        :param estimated_tokens: The request's token count, if already known.
+        :param deadline: A Deadline or a number of seconds bounding the request, by default
+            request_timeout.
+        :return: A string representing the chatbot's response.
+        :raises ChatTimeoutError: If the response does not arrive before the deadline.
+        :raises ChatCancelledError: If the deadline is cancelled first.
+        :raises: Any error raised by the OpenAI client, after rate limit retries.
+        """
+        deadline = self._deadline(deadline)
+        request = functools.partial(
+            get_rate_limiter().call,
+            self._create,
+            deadline,
+            deadline=deadline,
+            estimated_tokens=(
+                estimated_tokens
+                if estimated_tokens is not None
+                else self.num_tokens_from_messages(messages)
+            ),
+            model=self.model,
+            messages=self.messages_objs_to_dicts(messages),
+            temperature=self.temperature,
+        )
+        hedge_delay = self._hedge_delay()
+        if deadline is None and hedge_delay is None:
+            response = request()
         else:
-            raise NotImplementedError(
-                f"""num_tokens_from_messages() is not implemented for model {model}. See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens."""
-            )
-        num_tokens = 0
-        for message in messages_as_dicts:
-            num_tokens += tokens_per_message
-            for key, value in message.items():
-                num_tokens += len(encoding.encode(value))
-                if key == "name":
-                    num_tokens += tokens_per_name
-        num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-        return num_tokens
-
-    def get_chatbot_response(self, message: str = "") -> str:
+            response = call_with_deadline(request, deadline or Deadline(), hedge_delay)
+        return response["choices"][0]["message"]["content"]
+
+    def _deadline(self, deadline: Union[Deadline, float, None]) -> Optional[Deadline]:
+        return Deadline.of(deadline if deadline is not None else self.request_timeout)
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge:
+            return None
+        return get_latency_tracker(self.model).quantile(self.hedge_quantile)
+
+    def _create(self, deadline: Optional[Deadline], **kwargs):
+        # One attempt at a request. Rate limit retries call this again, so the deadline is
+        # checked, and the time left passed on as the HTTP timeout, on every attempt.
+        if deadline is not None:
+            deadline.check()
+            if deadline.expires_at is not None:
+                kwargs["request_timeout"] = deadline.remaining()
+        start = time.monotonic()
+        response = openai.ChatCompletion.create(**kwargs)
+        if not kwargs.get("stream"):
+            get_latency_tracker(self.model).record(time.monotonic() - start)
+        return response
+
+    def prompt_messages(self, prompt: str) -> List[Message]:
+        """
+        Builds the request for an independent prompt: the current chat log followed by the
+        prompt as a user message. The chat log itself is not changed.
+
+        :param prompt: A string representing the user's message.
+        :return: A list of Message objects.
+        """
+        return self.chat_log + [Message("user", prompt)]
+
+    def get_chatbot_responses(
+        self, prompts: List[str], max_workers: int = 8
+    ) -> List[Union[str, Exception]]:
+        """
+        Answers many independent prompts concurrently. Each prompt is sent as if it were the
+        next user message of the current chat log, and the chat log is left untouched.
+
+        Requests run on a pool of max_workers threads and go through the shared rate limiter,
+        so a large batch proceeds as fast as the rate limits allow.
+
+        :param prompts: A list of strings, each a user message.
+        :param max_workers: The maximum number of requests in flight.
+        :return: A list with, in the order of the prompts, either the response or the exception
+            that request raised.
+        """
+        if not prompts:
+            return []
+
+        def complete(prompt: str) -> Union[str, Exception]:
+            try:
+                return self.create_chat_completion(self.prompt_messages(prompt))
+            except Exception as e:
+                increment("chat_errors")
+                return e
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(prompts))) as pool:
+            return list(pool.map(complete, prompts))
+
+    def stream_chatbot_response(
+        self, deadline: Union[Deadline, float, None] = None
+    ) -> Iterator[str]:
+        """
+        Streams the chatbot's response as content deltas while it is being generated.
+
+        The complete response is appended to the chat log only once the stream finishes, so
+        closing the generator early leaves no partial message behind. Streams are not hedged.
+
+        :param deadline: A Deadline or a number of seconds bounding the whole stream, by
+            default request_timeout.
+        :return: An iterator of strings, each a piece of the response.
+        :raises ChatTimeoutError: If the stream does not finish before the deadline.
+        :raises ChatCancelledError: If the deadline is cancelled first.
+        :raises ChatRequestError: If the request fails.
+        """
+        deadline = self._deadline(deadline)
         try:
-            if message != "":
-                response = openai.ChatCompletion.create(
-                    model=self.model,
-                    messages=self.messages_objs_to_dicts(self.chat_log),
-                    temperature=self.temperature,
-                )
-            else:
-                response = openai.ChatCompletion.create(
-                    model=self.model,
-                    messages=self.messages_objs_to_dicts(self.chat_log),
-                    temperature=self.temperature,
+            messages = self.context_messages()
+            request = functools.partial(
+                get_rate_limiter().call,
+                self._create,
+                deadline,
+                deadline=deadline,
+                estimated_tokens=self.num_tokens_from_messages(messages),
+                model=self.model,
+                messages=self.messages_objs_to_dicts(messages),
+                temperature=self.temperature,
+                stream=True,
+            )
+            with timer("chat_stream_open"):
+                response = (
+                    request()
+                    if deadline is None
+                    else call_with_deadline(request, deadline)
                 )
-            content = response["choices"][0]["message"]["content"]
-            self.append_bot_message(content)
-            return content
+        except ChatError:
+            increment("chat_errors")
+            raise
+        except Exception as e:
+            increment("chat_errors")
+            raise ChatRequestError(f"Error generating assistant response: {e}") from e
 
+        parts = []
+        try:
+            for chunk in response:
+                if deadline is not None:
+                    deadline.check()
+                delta = chunk["choices"][0]["delta"].get("content")
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except ChatError:
+            increment("chat_errors")
+            raise
         except Exception as e:
-            print(f"Error generating asssistant response: {e}", file=sys.stderr)
-            return ""
+            increment("chat_errors")
+            raise ChatRequestError(f"Error generating assistant response: {e}") from e
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+        self.append_bot_message("".join(parts))
 
     def print_latest_message(self, role: str) -> None:
         filtered_messages = [
@@ -147,53 +495,207 @@ class ConversationManager:
 
     def append_system_message(self, message: str) -> None:
         self.system_message = Message("system", message)
-        self.chat_log.append(self.system_message)
+        self._append_message(self.system_message)
         self.logger.info(
-            f"System message appended with {self.num_tokens_from_messages([Message('system', message)])} "
-            + f"tokens. Total tokens: {self.num_tokens_from_messages(self.chat_log)}"
+            "System message appended with %d tokens. Total tokens: %d",
+            self.system_message.num_tokens(),
+            self.total_tokens(),
         )
 
     def append_user_message(self, message: str) -> None:
-        self.chat_log.append(Message("user", message))
+        user_message = Message("user", message)
+        self._append_message(user_message)
         self.trim_chat_log_to_token_limit()
         self.logger.info(
-            f"User message appended with {self.num_tokens_from_messages([Message('system', message)])} "
-            + f"tokens. Total tokens: {self.num_tokens_from_messages(self.chat_log)}"
+            "User message appended with %d tokens. Total tokens: %d",
+            user_message.num_tokens(),
+            self.total_tokens(),
         )
 
     def append_bot_message(self, message: str) -> None:
-        self.chat_log.append(Message("assistant", message))
+        bot_message = Message("assistant", message)
+        self._append_message(bot_message)
         self.trim_chat_log_to_token_limit()
         self.logger.info(
-            f"Bot message appended with {self.num_tokens_from_messages([Message('system', message)])} "
-            + f"tokens. Total tokens: {self.num_tokens_from_messages(self.chat_log)}"
+            "Bot message appended with %d tokens. Total tokens: %d",
+            bot_message.num_tokens(),
+            self.total_tokens(),
         )
 
+    @timed("trim")
     def trim_chat_log_to_token_limit(self) -> None:
-        total_tokens = self.num_tokens_from_messages(self.chat_log)
-        tokens_to_remove = total_tokens - self.max_tokens
-
-        while tokens_to_remove > 0 and len(self.chat_log) > 1:
+        while self.total_tokens() > self.max_tokens and len(self.chat_log) > 1:
             # Remove the second message to leave the system message at the beginning of the conversation.
-            removed_message = self.chat_log.pop(1)
-            tokens_removed = self.num_tokens_from_messages([removed_message])
-            tokens_to_remove -= tokens_removed
+            removed_message = self._pop_message(1)
+            increment("trimmed_messages")
+            if self.long_term_memory is not None:
+                self.long_term_memory.add(removed_message)
             self.logger.info(
-                f"Message removed with {tokens_removed} tokens. Remaining tokens: {self.num_tokens_from_messages(self.chat_log)}"
+                "Message removed with %d tokens. Remaining tokens: %d",
+                removed_message.num_tokens(),
+                self.total_tokens(),
             )
 
+    @timed("save_chat_log")
     def save_chat_log(self, file_path: str = CHAT_LOG_FILE) -> None:
+        if file_path.endswith(".jsonl"):
+            write_snapshot(file_path, self.chat_log)
+            return
         with open(file_path, "w") as f:
             json.dump(self.messages_objs_to_dicts(self.chat_log), f, indent=4)
 
+    @timed("load_chat_log")
     def load_chat_log(self, file_path: str = CHAT_LOG_FILE) -> None:
+        if file_path.endswith(".jsonl"):
+            self.chat_log = read_journal(file_path)
+            return
         with open(file_path, "r") as f:
             chat_log_data = json.load(f)
             self.chat_log = [Message.from_dict(msg_data) for msg_data in chat_log_data]
 
-    def search_for_message(self, query: str) -> List[Message]:
+    def export_archive(self, directory: str) -> int:
+        """
+        Writes the chat log to a memory-mapped binary archive. See chatbot_library.utils.archive.
+
+        :param directory: A string representing the path of the archive directory.
+        :return: The number of messages written.
+        """
+        return export_archive(self.chat_log, directory)
+
+    def import_archive(self, directory: str) -> None:
+        """
+        Replaces the chat log with the messages of a binary archive.
+
+        :param directory: A string representing the path of the archive directory.
+        """
+        self.chat_log = ChatArchive(directory).messages()
+
+    def attach_journal(
+        self,
+        file_path: str,
+        fsync: str = "never",
+        fsync_interval: float = 1.0,
+        compact_every: int = 1000,
+    ) -> None:
+        """
+        Mirrors every change of the chat log to an append-only JSONL journal.
+
+        If the journal already exists, the chat log is restored from it first; otherwise it is
+        created from the current chat log. See ChatLogJournal for the fsync policies.
+
+        :param file_path: A string representing the path of the journal.
+        :param fsync: The fsync policy: 'never', 'interval' or 'always'.
+        :param fsync_interval: The number of seconds between fsyncs for the 'interval' policy.
+        :param compact_every: The number of lines after which the journal may be compacted.
+        """
+        self.detach_journal()
+        if os.path.exists(file_path):
+            self.chat_log = read_journal(file_path)
+        else:
+            write_snapshot(file_path, self.chat_log)
+        self.journal = ChatLogJournal(
+            file_path,
+            fsync=fsync,
+            fsync_interval=fsync_interval,
+            compact_every=compact_every,
+        )
+
+    def detach_journal(self) -> None:
+        """
+        Stops mirroring the chat log and closes the journal, if one is attached. Embeddings
+        computed since their message was written are recorded first.
+        """
+        if self.journal is not None:
+            self.journal.record_embeddings(self._chat_log)
+            self.journal.close()
+            self.journal = None
+
+    def compact_journal(self) -> None:
+        """
+        Rewrites the attached journal as a snapshot of the chat log, with every token count and
+        embedding computed so far.
+        """
+        if self.journal is not None:
+            self.journal.compact(self._chat_log)
+
+    def embed_chat_log(self) -> int:
+        """Fetches the embeddings of every message that lacks one in batched requests."""
+        batcher = EmbeddingBatcher()
+        batcher.add_all(self.chat_log)
+        return batcher.flush()
+
+    def attach_text_index(
+        self, text_index: TextIndex, session_id: Optional[str] = None
+    ) -> None:
+        """
+        Keeps the chat log's messages in a full-text index, which may be shared with other
+        conversations, and makes search_for_message use it.
+
+        Messages already indexed under session_id are replaced by the current chat log.
+
+        :param text_index: The TextIndex to maintain.
+        :param session_id: A string identifying this conversation in the index, or None to
+            generate a unique one.
+        :raises ValueError: If session_id is empty.
+        """
+        if session_id == "":
+            raise ValueError("session_id must not be empty")
+        self.text_index = text_index
+        self.session_id = session_id if session_id is not None else uuid.uuid4().hex
+        self._reindex_text()
+
+    def detach_text_index(self) -> None:
+        """Stops maintaining the full-text index. Indexed messages stay searchable in it."""
+        self.text_index = None
+        self._text_doc_ids = []
+        self._text_docs = {}
+
+    def _reindex_text(self) -> None:
+        self.text_index.remove_session(self.session_id)
+        self._text_doc_ids = self.text_index.add_messages(
+            self.session_id, self._chat_log
+        )
+        self._text_docs = dict(zip(self._text_doc_ids, self._chat_log))
+
+    @timed("search")
+    def search_for_message(self, query: str, k: Optional[int] = None) -> List[Message]:
+        """
+        Finds the messages of the chat log that match a query.
+
+        With a text index attached (see attach_text_index), the query's terms and "quoted
+        phrases" are looked up in the index and the messages are ranked by relevance. Otherwise
+        the messages containing the query, ignoring case, are returned in chronological order.
+
+        :param query: A string representing the search query.
+        :param k: The maximum number of messages to return, or None for all of them.
+        :return: A list of Message objects.
+        """
+        if self.text_index is not None:
+            hits = self.text_index.search(
+                query,
+                k if k is not None else len(self._chat_log),
+                session_id=self.session_id,
+            )
+            # Messages indexed by another conversation under the same session_id are skipped.
+            return [
+                self._text_docs[hit.doc_id]
+                for hit in hits
+                if hit.doc_id in self._text_docs
+            ]
         query = query.lower()
         filtered_messages = [
             msg for msg in self.chat_log if query in msg.content.lower()
         ]
-        return filtered_messages
+        return filtered_messages[:k] if k is not None else filtered_messages
+
+    @timed("semantic_search")
+    def semantic_search(self, query: str, k: int = 5) -> List[Message]:
+        """
+        Finds the messages in the chat log that are most similar in meaning to the query.
+
+        :param query: A string representing the search query.
+        :param k: The maximum number of messages to return.
+        :return: A list of Message objects, most similar first.
+        """
+        query_embedding = Message("user", query).embedding
+        return [msg for msg, _ in self.embedding_index.search(query_embedding, k)]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+"""
+deadline.py
+
+This module defines the Deadline that bounds a chat request, or a whole agent turn made of
+several requests, and the typed errors chat calls raise instead of returning empty answers.
+"""
+
+import threading
+import time
+from typing import Callable, Optional, Union
+
+
+class ChatError(Exception):
+    """
+    Base class of the errors raised when the chatbot cannot produce a response.
+    """
+
+
+class ChatTimeoutError(ChatError, TimeoutError):
+    """
+    Raised when a chat request does not complete before its deadline.
+    """
+
+
+class ChatCancelledError(ChatError):
+    """
+    Raised when a chat request's deadline is cancelled before the request completes.
+    """
+
+
+class ChatRequestError(ChatError):
+    """
+    Raised when a chat request fails upstream. The original error is its __cause__.
+    """
+
+
+class Deadline:
+    """
+    A point in time by which a call must complete, which can also be cancelled early.
+
+    A Deadline is meant to be created once per user turn and passed down, so that every
+    request made for the turn shares the time left rather than each getting a fresh timeout.
+    cancel can be called from any thread, and calls waiting on the deadline give up promptly.
+
+    Usage:
+        deadline = Deadline(10.0)
+        agent.get_response("Hello", deadline=deadline)
+
+    :param timeout: The number of seconds from now, or None for no time limit.
+    :param clock: A callable returning the current time in seconds.
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.clock = clock
+        self.expires_at = None if timeout is None else clock() + timeout
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def of(cls, deadline: Union["Deadline", float, None]) -> Optional["Deadline"]:
+        """
+        Converts a timeout into a Deadline.
+
+        :param deadline: A Deadline, which is returned as is, a number of seconds, or None.
+        :return: A Deadline, or None when given None.
+        """
+        if deadline is None or isinstance(deadline, Deadline):
+            return deadline
+        return cls(deadline)
+
+    def remaining(self) -> Optional[float]:
+        """
+        Returns the time left.
+
+        :return: The number of seconds left, at least 0, or None without a time limit.
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """Cancels every call bound by this deadline."""
+        self._cancelled.set()
+
+    def check(self) -> None:
+        """
+        Checks that calls bound by this deadline may go on.
+
+        :raises ChatCancelledError: If the deadline was cancelled.
+        :raises ChatTimeoutError: If the deadline has passed.
+        """
+        if self.cancelled:
+            raise ChatCancelledError("The chat request was cancelled")
+        if self.expired:
+            raise ChatTimeoutError(
+                "The chat request did not complete before its deadline"
+            )
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+"""
+embedding_cache.py
+
+This module defines the EmbeddingCache, a content-addressed cache that keeps embeddings in an
+in-process LRU tier backed by an optional SQLite file, so identical text is only embedded once.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+
+_default_cache: Optional["EmbeddingCache"] = None
+
+# The number of pending last-used updates that triggers a write from a lookup.
+MAX_PENDING_TOUCHES = 1024
+
+
+def normalize_content(content: str) -> str:
+    """
+    Normalizes message content for use in a cache key.
+
+    :param content: A string representing the message content.
+    :return: The ASCII content with runs of whitespace collapsed.
+    """
+    content = content.encode(encoding="ASCII", errors="ignore").decode()
+    return " ".join(content.split())
+
+
+def get_embedding_cache() -> Optional["EmbeddingCache"]:
+    """
+    Returns the process-wide embedding cache used by Message, if one has been configured.
+
+    :return: The configured EmbeddingCache or None.
+    """
+    return _default_cache
+
+
+def set_embedding_cache(cache: Optional["EmbeddingCache"]) -> None:
+    """
+    Configures the process-wide embedding cache used by Message.
+
+    :param cache: An EmbeddingCache, or None to disable caching.
+    """
+    global _default_cache
+    _default_cache = cache
+
+
+class EmbeddingCache:
+    """
+    Caches embeddings keyed by a hash of the engine and the normalized content.
+
+    Lookups are served from a bounded in-memory LRU tier first and then from SQLite when a path
+    is given. The SQLite tier is bounded too, evicting the least recently used entries. Reads
+    do not write: the last-used times of SQLite hits are kept in memory and written with the
+    next set, flush or close.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 100_000,
+        memory_entries: int = 1024,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.evictions = 0
+        self._memory: "OrderedDict[str, array]" = OrderedDict()
+        # key -> last-used time not yet written to SQLite
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used "
+                "ON embeddings (last_used)"
+            )
+            self._connection.commit()
+            (self._num_entries,) = self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+
+    @staticmethod
+    def make_key(engine: str, content: str) -> str:
+        """
+        Builds the cache key for a piece of content embedded by an engine.
+
+        :param engine: A string representing the name of the embedding engine.
+        :param content: A string representing the content to embed.
+        :return: A hex digest identifying the pair.
+        """
+        digest = hashlib.sha256()
+        digest.update(engine.encode())
+        digest.update(b"\0")
+        digest.update(normalize_content(content).encode())
+        return digest.hexdigest()
+
+    def get(self, engine: str, content: str) -> Optional[array]:
+        """
+        Looks up the embedding of some content.
+
+        :param engine: A string representing the name of the embedding engine.
+        :param content: A string representing the content.
+        :return: The cached embedding as a float32 array, or None on a miss.
+        """
+        key = self.make_key(engine, content)
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return embedding
+
+            if self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._touched[key] = time.time()
+                    if len(self._touched) >= MAX_PENDING_TOUCHES:
+                        self._flush_touched()
+                        self._connection.commit()
+                    embedding = array("f", row[0])
+                    self._remember(key, embedding)
+                    self.hits += 1
+                    return embedding
+
+            self.misses += 1
+            return None
+
+    def set(self, engine: str, content: str, embedding: Sequence[float]) -> None:
+        """
+        Stores the embedding of some content.
+
+        :param engine: A string representing the name of the embedding engine.
+        :param content: A string representing the content.
+        :param embedding: A sequence of floats representing the embedding.
+        """
+        key = self.make_key(engine, content)
+        if not (isinstance(embedding, array) and embedding.typecode == "f"):
+            embedding = array("f", embedding)
+        with self._lock:
+            self._remember(key, embedding)
+            if self._connection is None:
+                return
+            self._touched.pop(key, None)
+            self._flush_touched()
+            exists = self._connection.execute(
+                "SELECT 1 FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) "
+                "VALUES (?, ?, ?)",
+                (key, embedding.tobytes(), time.time()),
+            )
+            if exists is None:
+                self._num_entries += 1
+            overflow = self._num_entries - self.max_entries
+            if overflow > 0:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self._num_entries -= overflow
+                self.evictions += overflow
+            self._connection.commit()
+
+    def flush(self) -> None:
+        """Writes the pending last-used times of SQLite hits."""
+        with self._lock:
+            if self._connection is not None and self._touched:
+                self._flush_touched()
+                self._connection.commit()
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(last_used, key) for key, last_used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _remember(self, key: str, embedding: array) -> None:
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            if self._connection is None:
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self._connection is None:
+                return len(self._memory)
+            return self._num_entries
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the hit/miss counters of the cache.
+
+        :return: A dictionary of counters and the overall hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "evictions": self.evictions,
+            "entries": len(self),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Removes every cached embedding from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM embeddings")
+                self._connection.commit()
+                self._num_entries = 0
+
+    def close(self) -> None:
+        """Closes the SQLite connection, if any."""
+        with self._lock:
+            if self._connection is not None:
+                self._flush_touched()
+                self._connection.commit()
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+
+"""
+embedding_index.py
+
+This module defines the EmbeddingIndex, a contiguous float32 matrix of normalized message
+embeddings that answers top-k similarity queries with a single matrix-vector product.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from chatbot_library.utils.message import EmbeddingBatcher, Message
+
+# Forking an index whose chain of shared bases is this deep flattens it first, so searches
+# never walk a long chain.
+MAX_BASE_DEPTH = 8
+
+
+class EmbeddingIndex:
+    """
+    Keeps one normalized embedding row per message, in step with a chat log.
+
+    Messages without an embedding are queued and embedded in one batched request on the next
+    search. Removed messages are masked out and their rows reclaimed by an occasional compaction,
+    so appends and removals never rebuild the matrix.
+
+    fork returns a copy that shares the rows indexed so far with the original. Both then keep
+    their own rows for the messages they add, and only hide the shared rows they remove. Forking
+    again without adding rows reuses the same shared rows.
+    """
+
+    def __init__(self, initial_capacity: int = 64) -> None:
+        self.initial_capacity = initial_capacity
+        self.clear()
+
+    def clear(self) -> None:
+        """Removes every message from the index."""
+        self._matrix: Optional[np.ndarray] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._messages: List[Optional[Message]] = []
+        self._rows: Dict[int, int] = {}
+        self._pending: Dict[int, Message] = {}
+        self._num_dead = 0
+        # A frozen index shared with forks, the number of its messages, and the IDs of those
+        # removed from this index.
+        self._base: Optional[EmbeddingIndex] = None
+        self._base_len = 0
+        self._hidden: Set[int] = set()
+
+    def __len__(self) -> int:
+        base_len = self._base_len - len(self._hidden)
+        return len(self._rows) + len(self._pending) + base_len
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes held by the embedding matrix and its mask."""
+        matrix_bytes = self._matrix.nbytes if self._matrix is not None else 0
+        return matrix_bytes + self._alive.nbytes
+
+    def __contains__(self, message: Message) -> bool:
+        key = id(message)
+        if key in self._rows or key in self._pending:
+            return True
+        return (
+            self._base is not None and key not in self._hidden and message in self._base
+        )
+
+    def fork(self) -> "EmbeddingIndex":
+        """
+        Returns a copy of the index without copying its rows. The current rows are frozen into
+        a base shared by this index and the copy, or if this index has no rows of its own, the
+        copy shares its base.
+
+        :return: A new EmbeddingIndex with the same messages.
+        """
+        if not self._rows:
+            child = EmbeddingIndex(self.initial_capacity)
+            child._base, child._base_len = self._base, self._base_len
+            child._hidden = set(self._hidden)
+            child._pending = dict(self._pending)
+            return child
+        if self._depth() >= MAX_BASE_DEPTH:
+            self._flatten()
+
+        base = EmbeddingIndex(self.initial_capacity)
+        base.__dict__.update(self.__dict__)
+        # Pending messages get their rows in each index once they are embedded.
+        pending, base._pending = base._pending, {}
+        base_len = len(base)
+
+        self.clear()
+        child = EmbeddingIndex(self.initial_capacity)
+        for index in (self, child):
+            index._base = base
+            index._base_len = base_len
+            index._pending = dict(pending)
+        return child
+
+    def _depth(self) -> int:
+        depth, index = 0, self._base
+        while index is not None:
+            depth, index = depth + 1, index._base
+        return depth
+
+    def add(self, message: Message) -> None:
+        """
+        Adds a message to the index, deferring the embedding request if it has none yet.
+
+        :param message: The Message to add.
+        """
+        if id(message) in self._hidden and message in self._base:
+            self._hidden.discard(id(message))
+            return
+        if message in self:
+            return
+        if message.has_embedding():
+            self._add_row(message)
+        else:
+            self._pending[id(message)] = message
+
+    def add_all(self, messages: Iterable[Message]) -> None:
+        """
+        Adds several messages to the index.
+
+        :param messages: An iterable of Message objects.
+        """
+        for message in messages:
+            self.add(message)
+
+    def remove(self, message: Message) -> None:
+        """
+        Removes a message from the index.
+
+        :param message: The Message to remove.
+        """
+        if self._pending.pop(id(message), None) is not None:
+            return
+        row = self._rows.pop(id(message), None)
+        if row is None:
+            self._hide(message)
+            return
+        self._alive[row] = False
+        self._messages[row] = None
+        self._num_dead += 1
+        if self._num_dead > max(len(self._rows), self.initial_capacity):
+            self._compact()
+
+    def sync(self) -> None:
+        """Embeds every pending message in batched requests and adds their rows."""
+        if not self._pending:
+            return
+        batcher = EmbeddingBatcher()
+        batcher.add_all(self._pending.values())
+        batcher.flush()
+        self._add_pending_rows()
+
+    async def aembed_pending(self) -> None:
+        """Asynchronous version of sync."""
+        if not self._pending:
+            return
+        batcher = EmbeddingBatcher()
+        batcher.add_all(self._pending.values())
+        await batcher.aflush()
+        self._add_pending_rows()
+
+    def _add_pending_rows(self) -> None:
+        # Messages removed while their embeddings were being fetched are no longer pending.
+        for key, message in list(self._pending.items()):
+            if message.has_embedding():
+                del self._pending[key]
+                self._add_row(message)
+
+    def search(
+        self, query_embedding: List[float], k: int = 5
+    ) -> List[Tuple[Message, float]]:
+        """
+        Finds the messages most similar to a query embedding.
+
+        :param query_embedding: A list of floats representing the query's embedding.
+        :param k: The maximum number of messages to return.
+        :return: A list of (message, cosine similarity) pairs, most similar first.
+        """
+        self.sync()
+        if k <= 0:
+            return []
+
+        query = self._normalize(np.asarray(query_embedding, dtype=np.float32))
+        results = []
+        index, hidden = self, set()
+        while index is not None:
+            results.extend(index._top(query, k, hidden))
+            hidden = hidden | index._hidden
+            index = index._base
+        results.sort(key=lambda result: -result[1])
+        return results[:k]
+
+    def _top(
+        self, query: np.ndarray, k: int, hidden: Set[int]
+    ) -> List[Tuple[Message, float]]:
+        # The top k of this index's own rows, leaving out the messages in hidden.
+        if not self._rows:
+            return []
+        num_rows = len(self._messages)
+        scores = self._matrix[:num_rows] @ query
+        scores[~self._alive[:num_rows]] = -np.inf
+        hidden_rows = [self._rows[key] for key in hidden if key in self._rows]
+        scores[hidden_rows] = -np.inf
+
+        k = min(k, len(self._rows) - len(hidden_rows))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._messages[row], float(scores[row])) for row in top]
+
+    def similarities(
+        self, query_embedding: List[float], messages: List[Message]
+    ) -> np.ndarray:
+        """
+        Scores the given messages against a query embedding in one matrix product.
+
+        Pending messages are not embedded here, so call sync first if they should be scored.
+
+        :param query_embedding: A list of floats representing the query's embedding.
+        :param messages: The messages to score.
+        :return: An array of cosine similarities aligned with messages, 0 for messages that
+            are not in the index.
+        """
+        scores = np.zeros(len(messages), dtype=np.float32)
+        query = self._normalize(np.asarray(query_embedding, dtype=np.float32))
+        remaining = np.ones(len(messages), dtype=bool)
+        index, hidden = self, set()
+        while index is not None:
+            if index._rows:
+                rows = np.fromiter(
+                    (
+                        (
+                            index._rows.get(id(message), -1)
+                            if id(message) not in hidden
+                            else -1
+                        )
+                        for message in messages
+                    ),
+                    dtype=np.int64,
+                    count=len(messages),
+                )
+                present = (rows >= 0) & remaining
+                scores[present] = index._matrix[rows[present]] @ query
+                remaining &= ~present
+            hidden = hidden | index._hidden
+            index = index._base
+        return scores
+
+    async def asearch(
+        self, query_embedding: List[float], k: int = 5
+    ) -> List[Tuple[Message, float]]:
+        """
+        Asynchronous version of search, which embeds pending messages without blocking.
+
+        :param query_embedding: A list of floats representing the query's embedding.
+        :param k: The maximum number of messages to return.
+        :return: A list of (message, cosine similarity) pairs, most similar first.
+        """
+        await self.aembed_pending()
+        return self.search(query_embedding, k)
+
+    def _hide(self, message: Message) -> None:
+        if (
+            self._base is None
+            or id(message) in self._hidden
+            or message not in self._base
+        ):
+            return
+        self._hidden.add(id(message))
+        # Once most of the base is hidden, copying the rest is cheaper than masking it.
+        if len(self._hidden) > max(self._base_len - len(self._hidden), 64):
+            self._flatten()
+
+    def _flatten(self) -> None:
+        messages = []
+        index, hidden = self._base, self._hidden
+        while index is not None:
+            messages.extend(
+                message
+                for message in index._messages
+                if message is not None and id(message) not in hidden
+            )
+            hidden = hidden | index._hidden
+            index = index._base
+        messages.extend(message for message in self._messages if message is not None)
+        pending = self._pending
+        self.clear()
+        for message in messages:
+            self._add_row(message)
+        self._pending = pending
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _add_row(self, message: Message) -> None:
+        vector = message.embedding_vector()
+        row = len(self._messages)
+        if self._matrix is None:
+            self._matrix = np.zeros(
+                (self.initial_capacity, vector.shape[0]), dtype=np.float32
+            )
+            self._alive = np.zeros(self.initial_capacity, dtype=bool)
+        elif row == self._matrix.shape[0]:
+            self._grow()
+
+        self._matrix[row] = self._normalize(vector)
+        self._alive[row] = True
+        self._messages.append(message)
+        self._rows[id(message)] = row
+
+    def _grow(self) -> None:
+        capacity = self._matrix.shape[0] * 2
+        matrix = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+        matrix[: self._matrix.shape[0]] = self._matrix
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: self._alive.shape[0]] = self._alive
+        self._matrix, self._alive = matrix, alive
+
+    def _compact(self) -> None:
+        num_rows = len(self._messages)
+        keep = np.flatnonzero(self._alive[:num_rows])
+        self._matrix[: len(keep)] = self._matrix[keep]
+        self._alive[:] = False
+        self._alive[: len(keep)] = True
+        self._messages = [self._messages[row] for row in keep]
+        self._rows = {id(message): row for row, message in enumerate(self._messages)}
+        self._num_dead = 0
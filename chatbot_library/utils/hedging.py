@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+"""
+hedging.py
+
+This module runs chat requests under a Deadline, optionally hedged: when a request is slower
+than most recent ones, an identical second request is sent and whichever answers first wins.
+Hedging costs a few percent of extra requests and cuts the latency tail.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from chatbot_library.utils.deadline import Deadline
+from chatbot_library.utils.instrumentation import increment
+
+T = TypeVar("T")
+
+# How often waiting calls check whether their deadline was cancelled, in seconds.
+POLL_INTERVAL = 0.05
+MAX_WORKERS = 32
+# Hedged calls are only sent while fewer calls than this, abandoned by earlier waits, are still
+# running on the worker threads, so that slow calls cannot fill the pool.
+MAX_ABANDONED = MAX_WORKERS // 4
+
+_trackers: Dict[str, "LatencyTracker"] = {}
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_num_abandoned = 0
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the most recent successful requests to estimate their quantiles.
+
+    :param window: The number of latencies kept.
+    :param min_samples: The number of latencies needed before quantiles are estimated.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def record(self, seconds: float) -> None:
+        """
+        Records the latency of a successful request.
+
+        :param seconds: The latency in seconds.
+        """
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimates a quantile of the recent latencies.
+
+        :param q: The quantile, between 0 and 1.
+        :return: The latency in seconds, or None with fewer than min_samples latencies.
+        """
+        with self._lock:
+            if len(self._latencies) < max(self.min_samples, 1):
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def clear(self) -> None:
+        """Forgets every latency."""
+        with self._lock:
+            self._latencies.clear()
+
+
+def get_latency_tracker(model: str) -> LatencyTracker:
+    """
+    Returns the process-wide latency tracker of a model, creating it if needed.
+
+    :param model: The name of the model.
+    :return: The model's LatencyTracker.
+    """
+    tracker = _trackers.get(model)
+    if tracker is None:
+        with _lock:
+            tracker = _trackers.setdefault(model, LatencyTracker())
+    return tracker
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=MAX_WORKERS, thread_name_prefix="chat-request"
+                )
+    return _executor
+
+
+def num_abandoned() -> int:
+    """
+    Returns the number of calls abandoned by call_with_deadline that are still running.
+
+    :return: The number of running abandoned calls.
+    """
+    return _num_abandoned
+
+
+def _abandon(future: Future) -> None:
+    global _num_abandoned
+    with _lock:
+        _num_abandoned += 1
+    future.add_done_callback(_abandoned_done)
+
+
+def _abandoned_done(future: Future) -> None:
+    global _num_abandoned
+    with _lock:
+        _num_abandoned -= 1
+
+
+def _wait_timeout(deadline: Deadline, hedge_at: Optional[float]) -> float:
+    timeout = POLL_INTERVAL
+    remaining = deadline.remaining()
+    if remaining is not None:
+        timeout = min(timeout, remaining)
+    if hedge_at is not None:
+        timeout = min(timeout, max(0.0, hedge_at - time.monotonic()))
+    return timeout
+
+
+def call_with_deadline(
+    func: Callable[[], T], deadline: Deadline, hedge_delay: Optional[float] = None
+) -> T:
+    """
+    Calls a function on a worker thread and waits for its result until the deadline.
+
+    With a hedge_delay, the function is called a second time if the first call has not
+    returned after that many seconds, and the first result wins. A call that fails while the
+    other is still running is ignored. Calls still running when this returns are abandoned,
+    so func should bound its own blocking with the deadline, for instance by passing the time
+    remaining as its request timeout. No hedged call is sent while MAX_ABANDONED abandoned
+    calls are still running.
+
+    :param func: The function to call, without arguments.
+    :param deadline: The Deadline bounding the wait.
+    :param hedge_delay: The number of seconds after which to send a hedged call, or None.
+    :return: The result of the first call to return.
+    :raises ChatTimeoutError: If no call returns before the deadline.
+    :raises ChatCancelledError: If the deadline is cancelled first.
+    :raises: The error raised by the first call, if every call fails.
+    """
+    deadline.check()
+    executor = _get_executor()
+    pending = {executor.submit(func)}
+    hedge_at = None if hedge_delay is None else time.monotonic() + hedge_delay
+    error = None
+    try:
+        while True:
+            done, pending = wait(
+                pending,
+                timeout=_wait_timeout(deadline, hedge_at),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = error or future.exception()
+            if not pending:
+                # A call cut short by its own timeout failed because of the deadline.
+                deadline.check()
+                raise error
+            deadline.check()
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                if _num_abandoned < MAX_ABANDONED:
+                    increment("chat_hedges")
+                    pending.add(executor.submit(func))
+                else:
+                    increment("chat_hedges_skipped")
+                hedge_at = None
+    finally:
+        for future in pending:
+            if not future.cancel():
+                _abandon(future)
+
+
+async def acall_with_deadline(
+    func: Callable[[], Awaitable[T]],
+    deadline: Deadline,
+    hedge_delay: Optional[float] = None,
+) -> T:
+    """
+    Asynchronous version of call_with_deadline. Calls still running when this returns, or
+    when the calling task is cancelled, are cancelled.
+
+    :param func: The coroutine function to call, without arguments.
+    :param deadline: The Deadline bounding the wait.
+    :param hedge_delay: The number of seconds after which to send a hedged call, or None.
+    :return: The result of the first call to return.
+    :raises ChatTimeoutError: If no call returns before the deadline.
+    :raises ChatCancelledError: If the deadline is cancelled first.
+    :raises: The error raised by the first call, if every call fails.
+    """
+    deadline.check()
+    pending = {asyncio.ensure_future(func())}
+    hedge_at = None if hedge_delay is None else time.monotonic() + hedge_delay
+    error = None
+    try:
+        while True:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=_wait_timeout(deadline, hedge_at),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = error or task.exception()
+            if not pending:
+                # A call cut short by its own timeout failed because of the deadline.
+                deadline.check()
+                raise error
+            deadline.check()
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                increment("chat_hedges")
+                pending.add(asyncio.ensure_future(func()))
+                hedge_at = None
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+"""
+instrumentation.py
+
+This module defines optional timers and counters for the library's hot paths: chat and
+embedding calls, token counting, trimming, persistence, search and web fetches.
+
+Instrumentation is off by default. Until set_instrumentation is called, every hook is a single
+check of a module global, so the instrumented code runs at full speed.
+
+Usage:
+    instrumentation = Instrumentation()
+    set_instrumentation(instrumentation)
+    ...
+    print(instrumentation.to_prometheus())
+"""
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_instrumentation: Optional["Instrumentation"] = None
+_disabled_timer = nullcontext()
+
+
+def get_instrumentation() -> Optional["Instrumentation"]:
+    """
+    Returns the process-wide instrumentation, or None if it is disabled.
+
+    :return: The active Instrumentation, or None.
+    """
+    return _instrumentation
+
+
+def set_instrumentation(instrumentation: Optional["Instrumentation"]) -> None:
+    """
+    Enables instrumentation, or disables it when given None.
+
+    :param instrumentation: An Instrumentation, or None.
+    """
+    global _instrumentation
+    _instrumentation = instrumentation
+
+
+def increment(name: str, value: float = 1) -> None:
+    """
+    Adds to a counter, if instrumentation is enabled.
+
+    :param name: The name of the counter.
+    :param value: The amount to add.
+    """
+    if _instrumentation is not None:
+        _instrumentation.increment(name, value)
+
+
+def timer(name: str):
+    """
+    Returns a context manager that times its block, if instrumentation is enabled.
+
+    :param name: The name of the timer.
+    :return: A context manager.
+    """
+    if _instrumentation is None:
+        return _disabled_timer
+    return _instrumentation.timer(name)
+
+
+def timed(name: str):
+    """
+    Decorates a function or coroutine function so that every call is timed, if
+    instrumentation is enabled when the call is made.
+
+    :param name: The name of the timer.
+    :return: A decorator.
+    """
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                instrumentation = _instrumentation
+                if instrumentation is None:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    instrumentation.observe(name, time.perf_counter() - start)
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            instrumentation = _instrumentation
+            if instrumentation is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                instrumentation.observe(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class TimerStats:
+    """
+    The count, total, maximum and histogram of the durations recorded by one timer.
+
+    :param buckets: The upper bounds of the histogram buckets, in seconds.
+    """
+
+    __slots__ = ("count", "total", "max", "buckets", "bucket_counts")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = buckets
+        # One extra bucket for durations above the last bound.
+        self.bucket_counts = [0] * (len(buckets) + 1)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.bucket_counts[bisect_left(self.buckets, seconds)] += 1
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+
+class Instrumentation:
+    """
+    Collects timers and counters, and forwards every observation to optional callbacks.
+
+    A callback is called as callback(kind, name, value), where kind is 'timer' (value in
+    seconds) or 'counter' (value is the increment). Callbacks run on the calling thread and
+    should return quickly.
+
+    :param callbacks: A list of callables receiving every observation.
+    :param buckets: The upper bounds of the latency histogram buckets, in seconds.
+    :param prefix: The prefix of the metric names in the Prometheus output.
+    """
+
+    def __init__(
+        self,
+        callbacks: Optional[List[Callable[[str, str, float], None]]] = None,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+        prefix: str = "chatbot",
+    ) -> None:
+        self.callbacks = list(callbacks or [])
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self.timers: Dict[str, TimerStats] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Records a duration.
+
+        :param name: The name of the timer.
+        :param seconds: The duration in seconds.
+        """
+        with self._lock:
+            stats = self.timers.get(name)
+            if stats is None:
+                stats = self.timers[name] = TimerStats(self.buckets)
+            stats.observe(seconds)
+        for callback in self.callbacks:
+            callback("timer", name, seconds)
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """
+        Adds to a counter.
+
+        :param name: The name of the counter.
+        :param value: The amount to add.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for callback in self.callbacks:
+            callback("counter", name, value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        Times the enclosed block.
+
+        :param name: The name of the timer.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Returns the current values of every timer and counter.
+
+        :return: A dictionary with 'timers' and 'counters' keys.
+        """
+        with self._lock:
+            return {
+                "timers": {
+                    name: stats.to_dict() for name, stats in self.timers.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def reset(self) -> None:
+        """Clears every timer and counter."""
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+
+    def to_prometheus(self) -> str:
+        """
+        Renders the timers as histograms and the counters as counters in the Prometheus text
+        exposition format.
+
+        :return: A string ready to be served from a /metrics endpoint.
+        """
+        lines = []
+        with self._lock:
+            for name, stats in sorted(self.timers.items()):
+                metric = f"{self.prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(stats.buckets, stats.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {stats.count}')
+                lines.append(f"{metric}_sum {stats.total}")
+                lines.append(f"{metric}_count {stats.count}")
+            for name, value in sorted(self.counters.items()):
+                metric = f"{self.prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
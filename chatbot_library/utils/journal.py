@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+"""
+journal.py
+
+This module defines the ChatLogJournal, an append-only JSONL file that mirrors a chat log one
+line per change, along with helpers to stream a chat log back from such a file.
+"""
+
+import base64
+import json
+import logging
+import os
+import time
+from array import array
+from collections import deque
+from typing import Deque, Iterator, List, Optional
+
+from chatbot_library.utils.instrumentation import increment, timed
+from chatbot_library.utils.message import Message
+
+FSYNC_POLICIES = ("never", "interval", "always")
+# The number of recent messages whose embeddings are recorded once they are computed.
+UNEMBEDDED_WINDOW = 64
+CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_line(line: bytes) -> Optional[dict]:
+    try:
+        return json.loads(line.decode("utf-8"))
+    except ValueError:
+        return None
+
+
+def iter_journal(file_path: str) -> Iterator[dict]:
+    """
+    Streams the entries of a JSONL chat log file, one parsed line at a time.
+
+    A crash in the middle of a write can leave the last line incomplete. That line is skipped;
+    an unreadable line anywhere else means the file is corrupt.
+
+    :param file_path: A string representing the path of the file.
+    :return: An iterator of dictionaries.
+    :raises ValueError: If a line other than the last one cannot be parsed.
+    """
+    with open(file_path, "rb") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = _parse_line(line)
+            if entry is None:
+                if f.read().strip():
+                    raise ValueError(f"Corrupt line {line_number} in {file_path}")
+                logger.warning("Skipping incomplete last line of %s", file_path)
+                return
+            yield entry
+
+
+def repair_journal(file_path: str) -> bool:
+    """
+    Truncates an incomplete last line left by a crash, so that new lines start cleanly.
+
+    :param file_path: A string representing the path of the file.
+    :return: True if the file was truncated.
+    """
+    with open(file_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        # The last line starts after the last newline before the file's final byte.
+        start = position = max(size - 1, 0)
+        while position > 0:
+            chunk_start = max(0, position - CHUNK_SIZE)
+            f.seek(chunk_start)
+            index = f.read(position - chunk_start).rfind(b"\n")
+            if index >= 0:
+                start = chunk_start + index + 1
+                break
+            position = start = chunk_start
+        f.seek(start)
+        line = f.read()
+        if not line.strip() or (line.endswith(b"\n") and _parse_line(line)):
+            return False
+        logger.warning("Truncating incomplete last line of %s", file_path)
+        f.truncate(start)
+        return True
+
+
+def read_journal(file_path: str) -> List[Message]:
+    """
+    Rebuilds a chat log from a JSONL file, restoring cached token counts and embeddings.
+
+    Message lines are appended in order, 'pop' entries replay the trims and 'embed' entries
+    restore embeddings computed after their message was written.
+
+    :param file_path: A string representing the path of the file.
+    :return: A list of Message objects.
+    """
+    messages: List[Message] = []
+    for entry in iter_journal(file_path):
+        op = entry.get("op")
+        if op is None:
+            messages.append(Message.from_record(entry))
+        elif op == "pop":
+            messages.pop(entry["position"])
+        elif op == "embed":
+            messages[entry["position"]].embedding = array(
+                "f", base64.b64decode(entry["embedding"])
+            )
+        else:
+            raise ValueError(f"Unknown journal entry in {file_path}: {entry}")
+    return messages
+
+
+def write_snapshot(file_path: str, messages: List[Message]) -> None:
+    """
+    Writes a chat log to a JSONL file, one message record per line.
+
+    The file is written to a temporary path first and then moved into place.
+
+    :param file_path: A string representing the path of the file.
+    :param messages: A list of Message objects.
+    """
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "w") as f:
+        for message in messages:
+            f.write(json.dumps(message.to_record()) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+class ChatLogJournal:
+    """
+    Appends every change of a chat log to a JSONL file, so saving a turn costs O(1).
+
+    Lines accumulate for messages that were later trimmed, so once more than compact_every lines
+    have been written and they outnumber the live messages, the file is rewritten as a snapshot.
+
+    Embeddings are computed lazily, usually after their message was written, so the journal
+    keeps the last UNEMBEDDED_WINDOW messages written without one, and record_embeddings adds
+    an 'embed' line for each of them once its embedding exists.
+
+    :param file_path: A string representing the path of the journal.
+    :param fsync: 'never' to leave flushing to the OS, 'always' to fsync after every write, or
+        'interval' to fsync at most every fsync_interval seconds.
+    :param fsync_interval: The number of seconds between fsyncs for the 'interval' policy.
+    :param compact_every: The number of lines after which compaction is considered.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        fsync: str = "never",
+        fsync_interval: float = 1.0,
+        compact_every: int = 1000,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, not {fsync!r}")
+        self.file_path = file_path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.num_lines = 0
+        self._unembedded: Deque[Message] = deque(maxlen=UNEMBEDDED_WINDOW)
+        if os.path.exists(file_path):
+            repair_journal(file_path)
+            with open(file_path, "rb") as f:
+                self.num_lines = sum(1 for _ in f)
+        self._last_fsync = time.monotonic()
+        self._file = open(file_path, "a")
+
+    def append(self, message: Message) -> None:
+        """
+        Records a message appended to the chat log.
+
+        :param message: The appended Message.
+        """
+        self._write(message.to_record())
+        if not message.has_embedding():
+            self._unembedded.append(message)
+
+    def record_embeddings(self, messages: List[Message]) -> int:
+        """
+        Records the embeddings computed since their messages were written.
+
+        :param messages: The current chat log.
+        :return: The number of embeddings recorded.
+        """
+        if not any(message.has_embedding() for message in self._unembedded):
+            return 0
+        recorded = 0
+        unembedded = self._unembedded
+        self._unembedded = deque(maxlen=UNEMBEDDED_WINDOW)
+        for message in unembedded:
+            if not message.has_embedding():
+                self._unembedded.append(message)
+                continue
+            position = _find(messages, message)
+            if position is not None:
+                self._write(
+                    {
+                        "op": "embed",
+                        "position": position,
+                        "embedding": base64.b64encode(
+                            message.embedding.tobytes()
+                        ).decode(),
+                    }
+                )
+                recorded += 1
+        return recorded
+
+    def pop(self, position: int) -> None:
+        """
+        Records a message removed from the chat log.
+
+        :param position: The position the message was removed from.
+        """
+        self._write({"op": "pop", "position": position})
+
+    def reset(self, messages: List[Message]) -> None:
+        """
+        Records that the chat log was replaced wholesale, by rewriting the file.
+
+        :param messages: The new chat log.
+        """
+        self.compact(messages)
+
+    def maybe_compact(self, messages: List[Message]) -> None:
+        """
+        Compacts the journal if enough superseded lines have accumulated.
+
+        :param messages: The current chat log.
+        """
+        if self.num_lines > self.compact_every and self.num_lines > 2 * len(messages):
+            self.compact(messages)
+
+    @timed("journal_compact")
+    def compact(self, messages: List[Message]) -> None:
+        """
+        Rewrites the journal so it holds exactly one line per live message.
+
+        :param messages: The current chat log.
+        """
+        self._file.close()
+        write_snapshot(self.file_path, messages)
+        self._file = open(self.file_path, "a")
+        self.num_lines = len(messages)
+        self._last_fsync = time.monotonic()
+        self._unembedded = deque(
+            (message for message in self._unembedded if not message.has_embedding()),
+            maxlen=UNEMBEDDED_WINDOW,
+        )
+
+    def close(self) -> None:
+        """Flushes and closes the journal file."""
+        if not self._file.closed:
+            self._file.flush()
+            if self.fsync != "never":
+                os.fsync(self._file.fileno())
+            self._file.close()
+
+    def _write(self, entry: dict) -> None:
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        self.num_lines += 1
+        increment("journal_writes")
+        if self.fsync == "always" or (
+            self.fsync == "interval"
+            and time.monotonic() - self._last_fsync >= self.fsync_interval
+        ):
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+
+def _find(messages: List[Message], message: Message) -> Optional[int]:
+    # Messages waiting for their embedding are recent, so the search starts from the end.
+    for position in range(len(messages) - 1, -1, -1):
+        if messages[position] is message:
+            return position
+    return None
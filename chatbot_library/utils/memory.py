@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+
+"""
+memory.py
+
+This module defines the LongTermMemory that keeps the messages trimmed from a chat log and
+finds the ones relevant to the current turn, using an inverted file (IVF) index so that lookups
+stay fast as it grows to millions of messages.
+"""
+
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from chatbot_library.utils.message import EmbeddingBatcher, Message
+
+logger = logging.getLogger(__name__)
+
+# k-means is trained on at most this many vectors per cluster, and assigns vectors in chunks of
+# ASSIGN_CHUNK rows so that the distance matrix stays small.
+MAX_TRAINING_POINTS_PER_LIST = 64
+ASSIGN_CHUNK = 65536
+
+
+class IVFIndex:
+    """
+    An approximate nearest-neighbor index over normalized vectors, scored by inner product.
+
+    Vectors are searched exhaustively until train_size of them have been added. The index is
+    then clustered with spherical k-means into about 4 * sqrt(n) lists, at most nlist, and each
+    search only scores the vectors in the nprobe lists whose centroids are closest to the query.
+    The index is retrained, with more lists, whenever it has grown retrain_factor times since
+    it was last trained, so the lists stay short and their centroids stay representative.
+
+    Training runs on a background thread when background is true: add returns at once, searches
+    keep using the current lists, and vectors added meanwhile are moved to the new lists when
+    training completes. Setting max_probe_rows bounds the work per probed list to its most
+    recently added vectors, trading the recall of older ones for a predictable search time.
+
+    :param nlist: The maximum number of clusters.
+    :param nprobe: The number of clusters scored per search.
+    :param train_size: The number of vectors at which the clusters are first trained.
+    :param seed: The seed for the k-means initialization.
+    :param retrain_factor: How many times the index grows before it is retrained.
+    :param max_probe_rows: The maximum number of vectors scored per probed list, or None to
+        score every vector in it.
+    :param background: Whether training runs on a background thread.
+    """
+
+    def __init__(
+        self,
+        nlist: int = 1024,
+        nprobe: int = 8,
+        train_size: int = 4096,
+        seed: int = 0,
+        retrain_factor: float = 4.0,
+        max_probe_rows: Optional[int] = None,
+        background: bool = True,
+    ) -> None:
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.seed = seed
+        self.retrain_factor = retrain_factor
+        self.max_probe_rows = max_probe_rows
+        self.background = background
+        self.centroids: Optional[np.ndarray] = None
+        self._flat_vectors: Optional[np.ndarray] = None
+        self._flat_ids = np.zeros(0, dtype=np.int64)
+        self._flat_size = 0
+        self._list_vectors: List[np.ndarray] = []
+        self._list_ids: List[np.ndarray] = []
+        self._list_sizes: List[int] = []
+        self._trained_size = 0
+        # Vectors added while training runs, moved to the new lists when it completes.
+        self._added: List[Tuple[np.ndarray, int]] = []
+        self._training: Optional[threading.Thread] = None
+        self._training_started = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._size()
+
+    def _size(self) -> int:
+        if self.centroids is None:
+            return self._flat_size
+        return sum(self._list_sizes)
+
+    def add(self, vector: np.ndarray, item_id: int) -> None:
+        """
+        Adds a normalized vector. Starts training once enough vectors have been added.
+
+        :param vector: A float32 vector with unit norm.
+        :param item_id: The integer returned by search for this vector.
+        """
+        with self._lock:
+            if self.centroids is not None:
+                self._append(self._nearest_list(vector), vector, item_id)
+            else:
+                self._append_flat(vector, item_id)
+            if self._training_started:
+                self._added.append((vector, item_id))
+                return
+            if self.centroids is None:
+                due = self._flat_size >= self.train_size
+            else:
+                due = self._size() >= self.retrain_factor * self._trained_size
+            if not due:
+                return
+            vectors, ids = self._snapshot()
+            self._training_started = True
+            if self.background:
+                self._training = threading.Thread(
+                    target=self._train, args=(vectors, ids), daemon=True
+                )
+                self._training.start()
+                return
+        self._train(vectors, ids)
+
+    def train(self, iterations: int = 10) -> None:
+        """
+        Clusters every vector added so far and moves them into their lists, on this thread.
+
+        :param iterations: The number of k-means iterations.
+        """
+        self.wait_for_training()
+        with self._lock:
+            if self._size() == 0:
+                return
+            vectors, ids = self._snapshot()
+            self._training_started = True
+        self._train(vectors, ids, iterations)
+
+    def wait_for_training(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits for a background training to complete, if one is running.
+
+        :param timeout: The maximum number of seconds to wait, or None.
+        """
+        training = self._training
+        if training is not None:
+            training.join(timeout)
+
+    def _train(
+        self, vectors: np.ndarray, ids: np.ndarray, iterations: int = 10
+    ) -> None:
+        try:
+            centroids = self._kmeans(vectors, iterations)
+            assignments = _assign(vectors, centroids)
+        except Exception as e:
+            logger.warning("Could not train the IVF index: %s", e)
+            with self._lock:
+                # Wait for the index to grow again rather than retrying on every add.
+                if self.centroids is None:
+                    self.train_size = 2 * len(vectors)
+                else:
+                    self._trained_size = len(vectors)
+                self._added = []
+                self._training_started = False
+                self._training = None
+            return
+
+        nlist = len(centroids)
+        with self._lock:
+            self.centroids = centroids
+            self._list_vectors = []
+            self._list_ids = []
+            self._list_sizes = []
+            for cluster in range(nlist):
+                members = np.flatnonzero(assignments == cluster)
+                self._list_vectors.append(_with_room(vectors[members]))
+                self._list_ids.append(_with_room(ids[members]))
+                self._list_sizes.append(len(members))
+            for vector, item_id in self._added:
+                self._append(self._nearest_list(vector), vector, item_id)
+            self._trained_size = self._size()
+            self._added = []
+            self._flat_vectors = None
+            self._flat_ids = np.zeros(0, dtype=np.int64)
+            self._flat_size = 0
+            self._training_started = False
+            self._training = None
+
+    def _kmeans(self, vectors: np.ndarray, iterations: int) -> np.ndarray:
+        nlist = max(1, min(self.nlist, int(4 * np.sqrt(len(vectors))), len(vectors)))
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(vectors), MAX_TRAINING_POINTS_PER_LIST * nlist)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = _assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid.
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        return centroids.astype(np.float32)
+
+    def _snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.centroids is None:
+            return (
+                self._flat_vectors[: self._flat_size].copy(),
+                self._flat_ids[: self._flat_size].copy(),
+            )
+        return (
+            np.concatenate(
+                [v[:size] for v, size in zip(self._list_vectors, self._list_sizes)]
+            ),
+            np.concatenate(
+                [i[:size] for i, size in zip(self._list_ids, self._list_sizes)]
+            ),
+        )
+
+    def _nearest_list(self, vector: np.ndarray) -> int:
+        return int(np.argmax(self.centroids @ vector))
+
+    def _append_flat(self, vector: np.ndarray, item_id: int) -> None:
+        if self._flat_vectors is None:
+            self._flat_vectors = np.zeros((64, vector.shape[0]), dtype=np.float32)
+            self._flat_ids = np.zeros(64, dtype=np.int64)
+        elif self._flat_size == self._flat_vectors.shape[0]:
+            self._flat_vectors = _grow(self._flat_vectors)
+            self._flat_ids = _grow(self._flat_ids)
+        self._flat_vectors[self._flat_size] = vector
+        self._flat_ids[self._flat_size] = item_id
+        self._flat_size += 1
+
+    def _append(self, cluster: int, vector: np.ndarray, item_id: int) -> None:
+        size = self._list_sizes[cluster]
+        if size == self._list_vectors[cluster].shape[0]:
+            self._list_vectors[cluster] = _grow(self._list_vectors[cluster])
+            self._list_ids[cluster] = _grow(self._list_ids[cluster])
+        self._list_vectors[cluster][size] = vector
+        self._list_ids[cluster][size] = item_id
+        self._list_sizes[cluster] = size + 1
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the vectors with the highest inner product with a normalized query.
+
+        :param query: A float32 vector with unit norm.
+        :param k: The maximum number of results.
+        :return: A tuple of (ids, scores), best first.
+        """
+        with self._lock:
+            if self.centroids is None:
+                ids = self._flat_ids[: self._flat_size]
+                scores = (
+                    self._flat_vectors[: self._flat_size] @ query
+                    if self._flat_size
+                    else np.zeros(0, dtype=np.float32)
+                )
+            else:
+                nprobe = min(self.nprobe, len(self.centroids))
+                probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+                ranges = [
+                    (c, self._probe_start(self._list_sizes[c]), self._list_sizes[c])
+                    for c in probes
+                ]
+                ids = np.concatenate(
+                    [self._list_ids[c][start:end] for c, start, end in ranges]
+                )
+                scores = np.concatenate(
+                    [
+                        self._list_vectors[c][start:end] @ query
+                        for c, start, end in ranges
+                    ]
+                )
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    def _probe_start(self, size: int) -> int:
+        if self.max_probe_rows is None:
+            return 0
+        return max(0, size - self.max_probe_rows)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return np.concatenate(
+        [
+            np.argmax(vectors[start : start + ASSIGN_CHUNK] @ centroids.T, axis=1)
+            for start in range(0, len(vectors), ASSIGN_CHUNK)
+        ]
+    )
+
+
+def _with_room(array: np.ndarray) -> np.ndarray:
+    grown = np.zeros((max(16, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+def _grow(array: np.ndarray) -> np.ndarray:
+    grown = np.zeros((array.shape[0] * 2,) + array.shape[1:], dtype=array.dtype)
+    grown[: array.shape[0]] = array
+    return grown
+
+
+class LongTermMemory:
+    """
+    Keeps messages that no longer fit in a chat log and retrieves the relevant ones.
+
+    Messages without an embedding are queued and embedded in one batched request on the next
+    search. Stored messages are returned by search as they were added, with their cached token
+    counts and embeddings.
+
+    :param nlist: The maximum number of IVF clusters.
+    :param nprobe: The number of clusters scored per search.
+    :param train_size: The number of messages at which the clusters are first trained.
+    """
+
+    def __init__(
+        self,
+        nlist: int = 1024,
+        nprobe: int = 8,
+        train_size: int = 4096,
+    ) -> None:
+        self.index = IVFIndex(nlist, nprobe, train_size)
+        self._messages: List[Message] = []
+        self._pending: List[Message] = []
+
+    def __len__(self) -> int:
+        return len(self._messages) + len(self._pending)
+
+    def add(self, message: Message) -> None:
+        """
+        Stores a message.
+
+        :param message: The Message to remember.
+        """
+        if message.has_embedding():
+            self._add_embedded(message)
+        else:
+            self._pending.append(message)
+
+    def add_all(self, messages: List[Message]) -> None:
+        """
+        Stores several messages.
+
+        :param messages: A list of Message objects.
+        """
+        for message in messages:
+            self.add(message)
+
+    def _add_embedded(self, message: Message) -> None:
+        vector = message.embedding_vector()
+        norm = np.linalg.norm(vector)
+        self.index.add(vector / norm if norm else vector, len(self._messages))
+        self._messages.append(message)
+
+    def sync(self) -> None:
+        """Embeds the queued messages in batched requests and indexes them."""
+        if not self._pending:
+            return
+        batcher = EmbeddingBatcher()
+        batcher.add_all(self._pending)
+        batcher.flush()
+        self._add_pending()
+
+    async def aembed_pending(self) -> None:
+        """Asynchronous version of sync."""
+        if not self._pending:
+            return
+        batcher = EmbeddingBatcher()
+        batcher.add_all(self._pending)
+        await batcher.aflush()
+        self._add_pending()
+
+    def _add_pending(self) -> None:
+        pending, self._pending = self._pending, []
+        for message in pending:
+            if message.has_embedding():
+                self._add_embedded(message)
+            else:
+                self._pending.append(message)
+
+    def search(
+        self, query_embedding: List[float], k: int = 5
+    ) -> List[Tuple[Message, float]]:
+        """
+        Finds the stored messages most similar to a query embedding. Queued messages are only
+        searched once they have been embedded by sync.
+
+        :param query_embedding: A list of floats representing the query's embedding.
+        :param k: The maximum number of messages to return.
+        :return: A list of (message, cosine similarity) pairs, most similar first.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        ids, scores = self.index.search(query / norm if norm else query, k)
+        return [
+            (self._messages[item_id], float(score))
+            for item_id, score in zip(ids, scores)
+        ]
@@ -3,66 +3,211 @@
 """
 message.py
 
-This module defines the Message class used for representing chatbot messages and their embeddings.
+This module defines the Message class used for representing chatbot messages and their embeddings,
+along with the EmbeddingBatcher used to embed many messages in a single request.
 """
 
-import time
-from typing import List, Dict
+import asyncio
+import base64
+from array import array
+from typing import Any, Iterable, List, Dict, Optional, Sequence
 
-from openai import OpenAIError
 import openai
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+
+from chatbot_library.utils.embedding_cache import get_embedding_cache
+from chatbot_library.utils.instrumentation import timed
+from chatbot_library.utils.rate_limiter import estimate_tokens, get_rate_limiter
+from chatbot_library.utils.tokens import DEFAULT_TOKEN_MODEL, num_tokens_from_message
+
+EMBEDDING_ENGINE = "text-embedding-ada-002"
+
+
+def prepare_embedding_input(content: str) -> str:
+    """
+    Normalizes message content into the form that is sent to the embedding endpoint.
+
+    :param content: A string representing the message content.
+    :return: The content with non-ASCII characters removed.
+    """
+    return content.encode(encoding="ASCII", errors="ignore").decode()
 
 
 class Message:
     """
     Represents a chatbot message with a role (e.g., 'user', 'bot') and content.
+
+    Messages are treated as immutable once created, so derived values such as token counts are
+    cached on the instance. The embedding is only requested the first time it is accessed, and
+    is stored as a compact float32 array.
     """
 
-    def __init__(self, role: str, content: str) -> None:
+    __slots__ = ("role", "content", "_embedding", "_token_counts")
+
+    def __init__(
+        self, role: str, content: str, embedding: Optional[Sequence[float]] = None
+    ) -> None:
         self.role = role
         self.content = content
-        self.embedding = self.get_embedding(self.content)
+        self._embedding: Optional[array] = None
+        self._token_counts: Dict[str, int] = {}
+        if embedding is not None:
+            self.embedding = embedding
 
     def __repr__(self) -> str:
         return f"{self.role}: {self.content}"
 
+    @property
+    def embedding(self) -> array:
+        """
+        The embedding of the message content, fetched on first access.
+
+        :return: A float32 array representing the message content's embedding.
+        """
+        if self._embedding is None:
+            self.embedding = self.get_embedding(self.content)
+        return self._embedding
+
+    @embedding.setter
+    def embedding(self, embedding: Sequence[float]) -> None:
+        if not (isinstance(embedding, array) and embedding.typecode == "f"):
+            embedding = array("f", embedding)
+        self._embedding = embedding
+
+    def embedding_vector(self) -> np.ndarray:
+        """
+        Returns the embedding as a NumPy view that shares memory with the stored array.
+
+        :return: A one-dimensional float32 array.
+        """
+        return np.frombuffer(self.embedding, dtype=np.float32)
+
+    def has_embedding(self) -> bool:
+        """
+        Checks whether the embedding has already been computed, without fetching it.
+
+        :return: True if the embedding is available locally.
+        """
+        return self._embedding is not None
+
+    def num_tokens(self, model: str = DEFAULT_TOKEN_MODEL) -> int:
+        """
+        Returns the number of tokens this message contributes to a request, cached per model.
+
+        :param model: A string representing the name of the model used for counting.
+        :return: An integer representing the number of tokens, excluding reply priming.
+        """
+        num_tokens = self._token_counts.get(model)
+        if num_tokens is None:
+            num_tokens = num_tokens_from_message(self.to_dict(), model)
+            self._token_counts[model] = num_tokens
+        return num_tokens
+
+    def cached_num_tokens(self, model: str = DEFAULT_TOKEN_MODEL) -> Optional[int]:
+        """
+        Returns the token count for a model if it has already been computed, without counting.
+
+        :param model: A string representing the name of the model used for counting.
+        :return: An integer representing the number of tokens, or None.
+        """
+        return self._token_counts.get(model)
+
     def get_embedding(
-        self, content: str, engine: str = "text-embedding-ada-002"
-    ) -> List[float]:
+        self, content: str, engine: str = EMBEDDING_ENGINE
+    ) -> Sequence[float]:
         """
         Retrieves the message content's embedding using the specified engine.
 
         :param content: A string representing the message content.
         :param engine: A string representing the name of the engine to use for generating the embedding.
-        :return: A list of floats representing the message content's embedding.
+        :return: A sequence of floats representing the message content's embedding.
         """
-        content = content.encode(encoding="ASCII", errors="ignore").decode()
+        content = prepare_embedding_input(content)
+        cache = get_embedding_cache()
+        if cache is not None:
+            embedding = cache.get(engine, content)
+            if embedding is not None:
+                return embedding
+
         response = self.call_with_rate_limit_retry(
             openai.Embedding.create, input=content, engine=engine
         )
         embedding = response["data"][0]["embedding"]  # this is a normal list
+        if cache is not None:
+            cache.set(engine, content, embedding)
         return embedding
 
-    def call_with_rate_limit_retry(self, func, *args, **kwargs):
+    async def aget_embedding(
+        self, content: str, engine: str = EMBEDDING_ENGINE
+    ) -> Sequence[float]:
+        """
+        Asynchronous version of get_embedding.
+
+        :param content: A string representing the message content.
+        :param engine: A string representing the name of the engine to use for generating the embedding.
+        :return: A sequence of floats representing the message content's embedding.
         """
-        Calls the given function and retries if a rate limit is exceeded.
+        content = prepare_embedding_input(content)
+        cache = get_embedding_cache()
+        if cache is not None:
+            embedding = cache.get(engine, content)
+            if embedding is not None:
+                return embedding
+
+        response = await self.acall_with_rate_limit_retry(
+            openai.Embedding.acreate, input=content, engine=engine
+        )
+        embedding = response["data"][0]["embedding"]
+        if cache is not None:
+            cache.set(engine, content, embedding)
+        return embedding
+
+    async def aembed(self) -> array:
+        """
+        Fetches the embedding without blocking the event loop, if it is not available yet.
+
+        :return: A float32 array representing the message content's embedding.
+        """
+        if self._embedding is None:
+            self.embedding = await self.aget_embedding(self.content)
+        return self._embedding
+
+    @staticmethod
+    @timed("embedding")
+    def call_with_rate_limit_retry(func, *args, **kwargs):
+        """
+        Calls the given function through the shared rate limiter, which retries with backoff if a
+        rate limit is exceeded.
 
         :param func: The function to call.
         :param args: Positional arguments for the function.
         :param kwargs: Keyword arguments for the function.
         :return: The result of the function call.
         """
-        delay_seconds = 10
-        while True:
-            try:
-                return func(*args, **kwargs)
-            except OpenAIError as e:
-                if e.code == "rate_limit":
-                    print(f"Rate limit exceeded, waiting for {delay_seconds} seconds")
-                    time.sleep(delay_seconds)
-                else:
-                    raise
+        return get_rate_limiter().call(
+            func,
+            *args,
+            estimated_tokens=estimate_tokens(kwargs.get("input", "")),
+            **kwargs,
+        )
+
+    @staticmethod
+    @timed("embedding")
+    async def acall_with_rate_limit_retry(func, *args, **kwargs):
+        """
+        Asynchronous version of call_with_rate_limit_retry, for coroutine functions.
+
+        :param func: The coroutine function to call.
+        :param args: Positional arguments for the function.
+        :param kwargs: Keyword arguments for the function.
+        :return: The result of the function call.
+        """
+        return await get_rate_limiter().acall(
+            func,
+            *args,
+            estimated_tokens=estimate_tokens(kwargs.get("input", "")),
+            **kwargs,
+        )
 
     def semantic_similarity(self, message_to_compare: str) -> float:
         """
@@ -71,9 +216,12 @@ class Message:
         :param message_to_compare: A string representing the message content to compare.
         :return: A float representing the semantic similarity between the two messages.
         """
-        message_embedding = self.get_embedding(message_to_compare)
-        similarity = cosine_similarity([self.embedding], [message_embedding])[0][0]
-        return similarity
+        vector = self.embedding_vector()
+        other = np.asarray(self.get_embedding(message_to_compare), dtype=np.float32)
+        norms = np.linalg.norm(vector) * np.linalg.norm(other)
+        if not norms:
+            return 0.0
+        return float(np.dot(vector, other) / norms)
 
     def to_dict(self):
         """
@@ -92,3 +240,149 @@ class Message:
         :return: A Message object.
         """
         return cls(data["role"], data["content"])
+
+    def to_record(self) -> Dict[str, Any]:
+        """
+        Converts the Message object to a dictionary that also carries its cached values.
+
+        Token counts are stored per model and the embedding as base64-encoded float32 bytes, so
+        from_record can restore the message without recomputing either.
+
+        :return: A JSON-serializable dictionary representing the Message object.
+        """
+        record: Dict[str, Any] = self.to_dict()
+        if self._token_counts:
+            record["tokens"] = dict(self._token_counts)
+        if self._embedding is not None:
+            record["embedding"] = base64.b64encode(self._embedding.tobytes()).decode()
+        return record
+
+    @classmethod
+    def from_record(cls, data: Dict[str, Any]):
+        """
+        Creates a Message object from a dictionary produced by to_record.
+
+        :param data: A dictionary containing 'role' and 'content' keys, and optionally the cached
+            'tokens' and 'embedding'.
+        :return: A Message object.
+        """
+        message = cls(data["role"], data["content"])
+        message._token_counts.update(data.get("tokens", {}))
+        if "embedding" in data:
+            message.embedding = array("f", base64.b64decode(data["embedding"]))
+        return message
+
+
+class EmbeddingBatcher:
+    """
+    Collects messages whose embeddings are still pending and fetches them with multi-input requests.
+
+    Usage:
+        with EmbeddingBatcher() as batcher:
+            batcher.add_all(conversation_manager.chat_log)
+    """
+
+    def __init__(
+        self, engine: str = EMBEDDING_ENGINE, max_batch_size: int = 100
+    ) -> None:
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.pending: List[Message] = []
+
+    def __enter__(self) -> "EmbeddingBatcher":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.flush()
+
+    def add(self, message: Message) -> None:
+        """
+        Queues a message for embedding if it does not have one yet.
+
+        :param message: The Message to embed.
+        """
+        if not message.has_embedding():
+            self.pending.append(message)
+
+    def add_all(self, messages: Iterable[Message]) -> None:
+        """
+        Queues every message that does not have an embedding yet.
+
+        :param messages: An iterable of Message objects.
+        """
+        for message in messages:
+            self.add(message)
+
+    def flush(self) -> int:
+        """
+        Embeds all pending messages, sending each distinct uncached content only once.
+
+        :return: The number of messages that received an embedding.
+        """
+        by_content, num_embedded = self._take_pending()
+        for batch in self._batches(by_content):
+            response = Message.call_with_rate_limit_retry(
+                openai.Embedding.create, input=batch, engine=self.engine
+            )
+            num_embedded += self._apply(batch, response, by_content)
+        return num_embedded
+
+    async def aflush(self) -> int:
+        """
+        Asynchronous version of flush. The batches are requested concurrently.
+
+        :return: The number of messages that received an embedding.
+        """
+        by_content, num_embedded = self._take_pending()
+        batches = self._batches(by_content)
+        responses = await asyncio.gather(
+            *[
+                Message.acall_with_rate_limit_retry(
+                    openai.Embedding.acreate, input=batch, engine=self.engine
+                )
+                for batch in batches
+            ]
+        )
+        for batch, response in zip(batches, responses):
+            num_embedded += self._apply(batch, response, by_content)
+        return num_embedded
+
+    def _take_pending(self):
+        # Groups the pending messages by content and serves what it can from the cache.
+        pending, self.pending = self.pending, []
+        num_embedded = 0
+        by_content: Dict[str, List[Message]] = {}
+        for message in pending:
+            if not message.has_embedding():
+                content = prepare_embedding_input(message.content)
+                by_content.setdefault(content, []).append(message)
+
+        cache = get_embedding_cache()
+        if cache is not None:
+            for content in list(by_content):
+                embedding = cache.get(self.engine, content)
+                if embedding is not None:
+                    for message in by_content.pop(content):
+                        message.embedding = embedding
+                        num_embedded += 1
+        return by_content, num_embedded
+
+    def _batches(self, by_content: Dict[str, List[Message]]) -> List[List[str]]:
+        contents = list(by_content)
+        return [
+            contents[start : start + self.max_batch_size]
+            for start in range(0, len(contents), self.max_batch_size)
+        ]
+
+    def _apply(self, batch: List[str], response, by_content) -> int:
+        cache = get_embedding_cache()
+        num_embedded = 0
+        for item in response["data"]:
+            content = batch[item["index"]]
+            if cache is not None:
+                cache.set(self.engine, content, item["embedding"])
+            for message in by_content[content]:
+                message.embedding = item["embedding"]
+                num_embedded += 1
+        return num_embedded
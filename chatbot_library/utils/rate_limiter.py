@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+
+"""
+rate_limiter.py
+
+This module defines the RateLimiter shared by every OpenAI call the library makes. It enforces
+request and token budgets with token buckets and retries rate-limited calls with exponential
+backoff, so concurrent callers slow down together instead of retrying in lockstep.
+"""
+
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from openai import OpenAIError
+
+from chatbot_library.utils.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+_default_limiter: Optional["RateLimiter"] = None
+
+
+class RateLimitTimeout(Exception):
+    """
+    Raised when a call is still rate limited after the maximum number of retries or wait time.
+    """
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Checks whether an exception raised by the OpenAI client signals a rate limit.
+
+    :param error: The exception to check.
+    :return: True if the call was rejected because of a rate limit.
+    """
+    if not isinstance(error, OpenAIError):
+        return False
+    return (
+        type(error).__name__ == "RateLimitError"
+        or getattr(error, "code", None) in ("rate_limit", "rate_limit_exceeded")
+        or getattr(error, "http_status", None) == 429
+    )
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Reads the number of seconds the server asked us to wait, if it sent a Retry-After header.
+
+    :param error: The exception raised by the OpenAI client.
+    :return: The delay in seconds, or None.
+    """
+    headers = getattr(error, "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        return float(value) if value is not None else None
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(text) -> int:
+    """
+    Cheaply estimates the number of tokens in a string or list of strings, at about four
+    characters per token.
+
+    :param text: A string or a list of strings.
+    :return: An integer estimate.
+    """
+    if isinstance(text, str):
+        text = [text]
+    return sum(len(item) for item in text) // 4 + 1
+
+
+def get_rate_limiter() -> "RateLimiter":
+    """
+    Returns the process-wide rate limiter, creating one with the default budgets if needed.
+
+    :return: The shared RateLimiter.
+    """
+    global _default_limiter
+    if _default_limiter is None:
+        _default_limiter = RateLimiter()
+    return _default_limiter
+
+
+def set_rate_limiter(limiter: Optional["RateLimiter"]) -> None:
+    """
+    Replaces the process-wide rate limiter.
+
+    :param limiter: A RateLimiter, or None to fall back to the default budgets.
+    """
+    global _default_limiter
+    _default_limiter = limiter
+
+
+class RateLimiter:
+    """
+    A token-bucket limiter for both requests per minute and tokens per minute.
+
+    Each acquisition reserves its budget immediately, letting the buckets go into debt, and then
+    waits until the debt has been paid off. Callers are therefore served in arrival order and
+    never wake up together. A rate-limited call pauses every caller for the backoff delay, which
+    is exponential with jitter unless the server sent a Retry-After value.
+
+    :param requests_per_minute: The request budget.
+    :param tokens_per_minute: The token budget.
+    :param max_retries: The number of retries before giving up on a rate-limited call.
+    :param base_delay: The first backoff delay in seconds.
+    :param max_delay: The longest single backoff delay in seconds.
+    :param max_wait: The longest total time in seconds a call may spend waiting, or None (or
+        infinity) for no limit.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 3500,
+        tokens_per_minute: float = 90000,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        max_wait: Optional[float] = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = clock()
+        self._paused_until = 0.0
+
+        # Metrics
+        self.num_calls = 0
+        self.num_retries = 0
+        self.num_rate_limited = 0
+        self.total_queued_time = 0.0
+        self.max_queued_time = 0.0
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Reserves budget for one request and returns how long the caller must wait before sending.
+
+        :param tokens: The number of tokens the request is expected to use.
+        :return: The delay in seconds.
+        """
+        with self._lock:
+            now = self.clock()
+            elapsed = now - self._updated
+            self._updated = now
+            self._requests = min(
+                float(self.requests_per_minute),
+                self._requests + elapsed * self.requests_per_minute / 60,
+            )
+            self._tokens = min(
+                float(self.tokens_per_minute),
+                self._tokens + elapsed * self.tokens_per_minute / 60,
+            )
+            self._requests -= 1
+            self._tokens -= tokens
+            delay = max(
+                0.0,
+                self._paused_until - now,
+                -self._requests * 60 / self.requests_per_minute,
+                -self._tokens * 60 / self.tokens_per_minute,
+            )
+            self.total_queued_time += delay
+            self.max_queued_time = max(self.max_queued_time, delay)
+            return delay
+
+    def release(self, tokens: int = 0) -> None:
+        """
+        Gives back the budget of a reservation whose request will not be sent.
+
+        :param tokens: The number of tokens that were reserved.
+        """
+        with self._lock:
+            self._requests = min(float(self.requests_per_minute), self._requests + 1)
+            self._tokens = min(float(self.tokens_per_minute), self._tokens + tokens)
+
+    def _reserve_within(self, tokens: int, max_wait: Optional[float]) -> float:
+        delay = self.reserve(tokens)
+        if max_wait is not None and not math.isinf(max_wait) and delay > max_wait:
+            self.release(tokens)
+            raise RateLimitTimeout(
+                f"Would have to wait {delay:.1f} seconds for the rate limit"
+            )
+        return delay
+
+    def acquire(self, tokens: int = 0, max_wait: Optional[float] = None) -> float:
+        """
+        Blocks until one request may be sent.
+
+        :param tokens: The number of tokens the request is expected to use.
+        :param max_wait: The longest time in seconds to wait, or None (or infinity) for no limit.
+        :return: The time spent waiting, in seconds.
+        :raises RateLimitTimeout: If the wait would be longer than max_wait, in which case the
+            reservation is given back without sleeping.
+        """
+        delay = self._reserve_within(tokens, max_wait)
+        if delay > 0:
+            self.sleep(delay)
+        return delay
+
+    async def aacquire(
+        self, tokens: int = 0, max_wait: Optional[float] = None
+    ) -> float:
+        """
+        Asynchronous version of acquire.
+
+        :param tokens: The number of tokens the request is expected to use.
+        :param max_wait: The longest time in seconds to wait, or None (or infinity) for no limit.
+        :return: The time spent waiting, in seconds.
+        :raises RateLimitTimeout: If the wait would be longer than max_wait.
+        """
+        delay = self._reserve_within(tokens, max_wait)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def _wait_left(
+        self, waited: float, deadline: Optional[Deadline] = None
+    ) -> Optional[float]:
+        limits = []
+        if self.max_wait is not None and not math.isinf(self.max_wait):
+            limits.append(max(0.0, self.max_wait - waited))
+        if deadline is not None and deadline.remaining() is not None:
+            limits.append(deadline.remaining())
+        return min(limits) if limits else None
+
+    def backoff(
+        self,
+        error: Exception,
+        attempt: int,
+        waited: float,
+        deadline: Optional[Deadline] = None,
+    ) -> float:
+        """
+        Records a rate-limited call and pauses all callers for the backoff delay. The delay itself
+        is waited out by the next acquire.
+
+        :param error: The rate limit error.
+        :param attempt: The number of retries so far.
+        :param waited: The time the call has already spent waiting.
+        :param deadline: The Deadline of the call, if any, which the delay must not outlast.
+        :return: The delay in seconds before the next attempt.
+        """
+        with self._lock:
+            self.num_rate_limited += 1
+        if attempt >= self.max_retries:
+            raise RateLimitTimeout(
+                f"Still rate limited after {attempt} retries"
+            ) from error
+        delay = get_retry_after(error)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2**attempt)
+            delay = random.uniform(delay / 2, delay)
+        wait_left = self._wait_left(waited, deadline)
+        if wait_left is not None and delay > wait_left:
+            raise RateLimitTimeout(
+                f"Still rate limited after waiting {waited:.1f} seconds"
+            ) from error
+        with self._lock:
+            self._paused_until = max(self._paused_until, self.clock() + delay)
+            self.num_retries += 1
+        logger.warning("Rate limit exceeded, retrying in %.1f seconds", delay)
+        return delay
+
+    def call(
+        self,
+        func,
+        *args,
+        estimated_tokens: int = 0,
+        deadline: Optional[Deadline] = None,
+        **kwargs,
+    ):
+        """
+        Calls the given function within the budgets, retrying if a rate limit is exceeded.
+
+        :param func: The function to call.
+        :param args: Positional arguments for the function.
+        :param estimated_tokens: The number of tokens the request is expected to use.
+        :param deadline: A Deadline the waits must not outlast, so that a call abandoned by its
+            caller does not sleep on after the deadline.
+        :param kwargs: Keyword arguments for the function.
+        :return: The result of the function call.
+        """
+        with self._lock:
+            self.num_calls += 1
+        waited = 0.0
+        attempt = 0
+        while True:
+            waited += self.acquire(estimated_tokens, self._wait_left(waited, deadline))
+            try:
+                return func(*args, **kwargs)
+            except OpenAIError as e:
+                if not is_rate_limit_error(e):
+                    raise
+                self.backoff(e, attempt, waited, deadline)
+                attempt += 1
+
+    async def acall(
+        self,
+        func,
+        *args,
+        estimated_tokens: int = 0,
+        deadline: Optional[Deadline] = None,
+        **kwargs,
+    ):
+        """
+        Asynchronous version of call, for coroutine functions.
+
+        :param func: The coroutine function to call.
+        :param args: Positional arguments for the function.
+        :param estimated_tokens: The number of tokens the request is expected to use.
+        :param deadline: A Deadline the waits must not outlast.
+        :param kwargs: Keyword arguments for the function.
+        :return: The result of the function call.
+        """
+        with self._lock:
+            self.num_calls += 1
+        waited = 0.0
+        attempt = 0
+        while True:
+            waited += await self.aacquire(
+                estimated_tokens, self._wait_left(waited, deadline)
+            )
+            try:
+                return await func(*args, **kwargs)
+            except OpenAIError as e:
+                if not is_rate_limit_error(e):
+                    raise
+                self.backoff(e, attempt, waited, deadline)
+                attempt += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the limiter's counters, including the time calls spent queued.
+
+        :return: A dictionary of metrics.
+        """
+        return {
+            "calls": self.num_calls,
+            "retries": self.num_retries,
+            "rate_limited": self.num_rate_limited,
+            "total_queued_time": self.total_queued_time,
+            "max_queued_time": self.max_queued_time,
+            "mean_queued_time": (
+                self.total_queued_time / self.num_calls if self.num_calls else 0.0
+            ),
+        }
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+"""
+response_cache.py
+
+This module defines the ResponseCache, which lets stateless agents answer repeated prompts
+without another completion request.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class _ContextVectors:
+    """
+    The normalized embeddings of the cached requests that share a context, as rows of one
+    float32 matrix. Removed rows are masked out and reclaimed by an occasional compaction, so
+    adding and removing entries never restacks the matrix.
+    """
+
+    def __init__(self, dim: int, initial_capacity: int = 16) -> None:
+        self.matrix = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self.expires = np.zeros(initial_capacity, dtype=np.float64)
+        self.alive = np.zeros(initial_capacity, dtype=bool)
+        self.keys: List[Optional[str]] = []
+        self.rows: Dict[str, int] = {}
+        self.num_dead = 0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, key: str, vector: np.ndarray, expires: float) -> None:
+        row = len(self.keys)
+        if row == self.matrix.shape[0]:
+            self._grow()
+        self.matrix[row] = vector
+        self.expires[row] = expires
+        self.alive[row] = True
+        self.keys.append(key)
+        self.rows[key] = row
+
+    def remove(self, key: str) -> bool:
+        row = self.rows.pop(key, None)
+        if row is None:
+            return False
+        self.alive[row] = False
+        self.keys[row] = None
+        self.num_dead += 1
+        if self.num_dead > max(len(self.rows), 16):
+            self._compact()
+        return True
+
+    def expired(self, now: float) -> List[str]:
+        """
+        Finds the entries that have expired.
+
+        :param now: The current time of the cache's clock.
+        :return: The keys of the expired entries.
+        """
+        num_rows = len(self.keys)
+        rows = np.flatnonzero(self.alive[:num_rows] & (self.expires[:num_rows] <= now))
+        return [self.keys[row] for row in rows]
+
+    def nearest(self, query: np.ndarray) -> Tuple[Optional[str], float]:
+        """
+        Finds the entry whose embedding is most similar to a normalized query.
+
+        :param query: The normalized query embedding.
+        :return: A tuple of (key, cosine similarity), or (None, -inf) if there are no entries.
+        """
+        if not self.rows:
+            return None, -np.inf
+        num_rows = len(self.keys)
+        scores = self.matrix[:num_rows] @ query
+        scores[~self.alive[:num_rows]] = -np.inf
+        best = int(np.argmax(scores))
+        return self.keys[best], float(scores[best])
+
+    def _grow(self) -> None:
+        capacity = self.matrix.shape[0] * 2
+        matrix = np.zeros((capacity, self.matrix.shape[1]), dtype=np.float32)
+        matrix[: self.matrix.shape[0]] = self.matrix
+        expires = np.zeros(capacity, dtype=np.float64)
+        expires[: self.expires.shape[0]] = self.expires
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: self.alive.shape[0]] = self.alive
+        self.matrix, self.expires, self.alive = matrix, expires, alive
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self.alive[: len(self.keys)])
+        self.matrix[: len(keep)] = self.matrix[keep]
+        self.expires[: len(keep)] = self.expires[keep]
+        self.alive[:] = False
+        self.alive[: len(keep)] = True
+        self.keys = [self.keys[row] for row in keep]
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.num_dead = 0
+
+
+class ResponseCache:
+    """
+    Caches chatbot responses keyed by the model, temperature and request messages.
+
+    The exact tier only answers identical requests. When semantic_threshold is set, a request
+    that misses the exact tier can still reuse the response of an earlier request with the same
+    model, temperature and preceding messages whose last message has an embedding at least
+    that similar (cosine similarity) to the new one.
+
+    Entries expire after ttl seconds, and the least recently used entries are evicted once
+    there are more than max_entries.
+
+    :param max_entries: The maximum number of cached responses.
+    :param ttl: The number of seconds a response stays valid, or None to never expire.
+    :param semantic_threshold: The minimum cosine similarity for a semantic hit, or None to only
+        serve exact matches.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 3600.0,
+        semantic_threshold: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.clock = clock
+        # key -> (response, expiry time, context key)
+        self._entries: "OrderedDict[str, Tuple[str, float, str]]" = OrderedDict()
+        # context key -> normalized embeddings of the last messages
+        self._vectors: Dict[str, _ContextVectors] = {}
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_keys(
+        model: str, temperature: float, messages: List[Dict[str, str]]
+    ) -> Tuple[str, str]:
+        """
+        Computes the key of a request and the key of its context, which leaves out the last
+        message.
+
+        :param model: A string representing the name of the model.
+        :param temperature: The sampling temperature.
+        :param messages: The request messages, as dictionaries.
+        :return: A tuple of (key, context key).
+        """
+        context = hashlib.sha256(
+            json.dumps([model, temperature, messages[:-1]], sort_keys=True).encode()
+        )
+        context_key = context.hexdigest()
+        context.update(json.dumps(messages[-1:], sort_keys=True).encode())
+        return context.hexdigest(), context_key
+
+    def get(
+        self,
+        model: str,
+        temperature: float,
+        messages: List[Dict[str, str]],
+        embedding: Optional[Sequence[float]] = None,
+    ) -> Optional[str]:
+        """
+        Looks up the response to a request.
+
+        :param model: A string representing the name of the model.
+        :param temperature: The sampling temperature.
+        :param messages: The request messages, as dictionaries.
+        :param embedding: The embedding of the last message, for the semantic tier.
+        :return: The cached response, or None.
+        """
+        key, context_key = self.make_keys(model, temperature, messages)
+        with self._lock:
+            response = self._lookup(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            if self.semantic_threshold is not None and embedding is not None:
+                key = self._nearest(context_key, embedding)
+                response = self._lookup(key) if key is not None else None
+                if response is not None:
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return response
+            self.misses += 1
+            return None
+
+    def get_exact(
+        self, model: str, temperature: float, messages: List[Dict[str, str]]
+    ) -> Optional[str]:
+        """
+        Looks up the response to a request in the exact tier only, for callers that want to
+        avoid computing an embedding when the request was seen before. A miss is not counted,
+        since it is normally followed by a call to get.
+
+        :param model: A string representing the name of the model.
+        :param temperature: The sampling temperature.
+        :param messages: The request messages, as dictionaries.
+        :return: The cached response, or None.
+        """
+        key, _ = self.make_keys(model, temperature, messages)
+        with self._lock:
+            response = self._lookup(key)
+            if response is not None:
+                self.hits += 1
+            return response
+
+    def set(
+        self,
+        model: str,
+        temperature: float,
+        messages: List[Dict[str, str]],
+        response: str,
+        embedding: Optional[Sequence[float]] = None,
+    ) -> None:
+        """
+        Stores the response to a request.
+
+        :param model: A string representing the name of the model.
+        :param temperature: The sampling temperature.
+        :param messages: The request messages, as dictionaries.
+        :param response: The chatbot's response.
+        :param embedding: The embedding of the last message, for the semantic tier.
+        """
+        key, context_key = self.make_keys(model, temperature, messages)
+        expires = self.clock() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (response, expires, context_key)
+            if self.semantic_threshold is not None and embedding is not None:
+                vector = self._normalize(embedding)
+                if context_key not in self._vectors:
+                    self._vectors[context_key] = _ContextVectors(vector.shape[0])
+                self._vectors[context_key].add(key, vector, expires)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _lookup(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        response, expires, _ = entry
+        if self.clock() >= expires:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def _nearest(self, context_key: str, embedding: Sequence[float]) -> Optional[str]:
+        vectors = self._vectors.get(context_key)
+        if vectors is None:
+            return None
+        # Expired entries are dropped first so they cannot hide a live match.
+        for key in vectors.expired(self.clock()):
+            self._remove(key)
+            self.expirations += 1
+        key, score = vectors.nearest(self._normalize(embedding))
+        return key if score >= self.semantic_threshold else None
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        context_key = entry[2]
+        vectors = self._vectors.get(context_key)
+        if vectors is not None and vectors.remove(key) and not vectors:
+            del self._vectors[context_key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Removes every cached response."""
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the cache's counters and hit rate.
+
+        :return: A dictionary of metrics.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
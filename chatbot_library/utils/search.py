@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""
+search.py
+
+This module defines the GoogleSearchClient shared by the agents' web tools. It builds the
+Custom Search service once, caches results for a while, and lets concurrent identical queries
+share a single request.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_default_client: Optional["GoogleSearchClient"] = None
+_default_client_lock = threading.Lock()
+
+
+def get_search_client() -> "GoogleSearchClient":
+    """
+    Returns the process-wide search client, creating one from the GOOGLE_API_KEY and
+    GOOGLE_CSE_ID environment variables if needed.
+
+    :return: The shared GoogleSearchClient.
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = GoogleSearchClient()
+    return _default_client
+
+
+def set_search_client(client: Optional["GoogleSearchClient"]) -> None:
+    """
+    Replaces the process-wide search client.
+
+    :param client: A GoogleSearchClient, or None to create a new one from the environment.
+    """
+    global _default_client
+    _default_client = client
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query so that queries differing only in case or spacing share a cache entry.
+
+    :param query: A string representing the search query.
+    :return: The normalized query.
+    """
+    return " ".join(query.lower().split())
+
+
+class GoogleSearchClient:
+    """
+    A Google Custom Search client with a result cache.
+
+    The service is built on first use and reused, so the discovery document is only loaded
+    once. Results are cached by normalized query for ttl seconds, up to max_entries queries,
+    and a query that is already in flight is not sent again: later callers wait for the first
+    one's result. Failed searches are not cached.
+
+    :param api_key: The Google API key, by default the GOOGLE_API_KEY environment variable.
+    :param cse_id: The search engine ID, by default the GOOGLE_CSE_ID environment variable.
+    :param ttl: The number of seconds results stay cached.
+    :param max_entries: The maximum number of cached queries.
+    :param service_factory: A callable building the service from the API key, by default
+        googleapiclient.discovery.build.
+    :param http_factory: A callable creating the HTTP object requests are executed with, by
+        default an httplib2.Http. httplib2 is not thread-safe, so each thread gets its own
+        while the service itself is shared.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        cse_id: Optional[str] = None,
+        ttl: float = 600.0,
+        max_entries: int = 256,
+        service_factory: Optional[Callable[[str], Any]] = None,
+        http_factory: Optional[Callable[[], Any]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.api_key = api_key if api_key is not None else os.environ["GOOGLE_API_KEY"]
+        self.cse_id = cse_id if cse_id is not None else os.environ["GOOGLE_CSE_ID"]
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.service_factory = service_factory or _build_service
+        self.http_factory = http_factory or _build_http
+        self._local = threading.local()
+        self.clock = clock
+        self._service = None
+        # (normalized query, num) -> (results, expiry time)
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[List[Dict], float]]" = (
+            OrderedDict()
+        )
+        self._in_flight: Dict[Tuple[str, int], Future] = {}
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def service(self):
+        """The Custom Search service, built on first use."""
+        if self._service is None:
+            with self._lock:
+                if self._service is None:
+                    self._service = self.service_factory(self.api_key)
+        return self._service
+
+    def search(self, query: str, num: int = 3) -> List[Dict[str, Any]]:
+        """
+        Returns the top results for a query.
+
+        :param query: A string representing the search query.
+        :param num: The number of results to request.
+        :return: A list of result dictionaries with 'title' and 'link' keys, among others.
+        """
+        key = (normalize_query(query), num)
+        owner = False
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                if self.clock() < entry[1]:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._cache[key]
+            future = self._in_flight.get(key)
+            if future is None:
+                owner = True
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            results = self._execute(key[0], num)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+            self._cache[key] = (results, self.clock() + self.ttl)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        future.set_result(results)
+        return results
+
+    def _execute(self, query: str, num: int) -> List[Dict[str, Any]]:
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self._local.http = self.http_factory()
+        request = self.service.cse().list(q=query, cx=self.cse_id, num=num)
+        return request.execute(http=http).get("items", [])
+
+    def clear(self) -> None:
+        """Removes every cached result."""
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the cache's counters.
+
+        :return: A dictionary of metrics.
+        """
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+
+def _build_service(api_key: str):
+    # googleapiclient is slow to import and only needed by web search, so it is imported on
+    # first use rather than whenever an agent module is loaded.
+    from googleapiclient.discovery import build
+
+    return build("customsearch", "v1", developerKey=api_key)
+
+
+def _build_http():
+    import httplib2
+
+    return httplib2.Http(timeout=10)
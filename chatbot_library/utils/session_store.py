@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+"""
+session_store.py
+
+This module defines the SessionStore, which maps session IDs to conversations, keeps the most
+recently used ones in memory and evicts the rest to JSONL files on disk.
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+from urllib.parse import quote, unquote
+
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.text_index import SearchHit, TextIndex
+
+
+class SessionStore:
+    """
+    A bounded set of in-memory conversations backed by one JSONL file per session.
+
+    Cold sessions are written with their cached token counts and embeddings, so rehydrating one
+    does not recount or re-embed anything. With journal=True, every hot session mirrors its
+    changes to its file as they happen and eviction compacts the file before closing it.
+
+    A conversation returned by get can be evicted as soon as other sessions are loaded, after
+    which its changes are no longer written anywhere. Code that keeps using a conversation while
+    other threads use the store should check it out, which keeps it in memory until released.
+
+    Usage:
+        store = SessionStore("sessions", max_hot=10_000)
+        with store.checkout(session_id) as conversation_manager:
+            agent = SmartAgent(conversation_manager)
+            agent.get_response(message)
+
+    :param directory: A string representing the directory holding the session files.
+    :param max_hot: The maximum number of sessions kept in memory.
+    :param manager_factory: A callable returning a new ConversationManager.
+    :param journal: Whether hot sessions keep an append-only journal of their changes.
+    :param text_index: A TextIndex kept up to date with every hot session, so that search can
+        cover all of them. Cold sessions stay indexed as they were when evicted.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_hot: int = 1000,
+        manager_factory: Callable[[], ConversationManager] = ConversationManager,
+        journal: bool = False,
+        text_index: Optional[TextIndex] = None,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_hot = max_hot
+        self.manager_factory = manager_factory
+        self.journal = journal
+        self.text_index = text_index
+        self._hot: "OrderedDict[str, ConversationManager]" = OrderedDict()
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        # The session files are counted once; the count is then kept up to date as sessions
+        # are evicted, rehydrated and deleted.
+        self._num_cold = sum(
+            1 for name in os.listdir(directory) if name.endswith(".jsonl")
+        )
+
+        # Metrics
+        self.hits = 0
+        self.rehydrations = 0
+        self.creations = 0
+        self.evictions = 0
+
+    def path_for(self, session_id: str) -> str:
+        """
+        Returns the file that holds a session while it is cold.
+
+        :param session_id: A string identifying the session.
+        :return: A string representing the path of the session file.
+        """
+        return os.path.join(self.directory, quote(session_id, safe="") + ".jsonl")
+
+    def get(self, session_id: str) -> ConversationManager:
+        """
+        Returns the conversation of a session, rehydrating or creating it if it is not in memory.
+
+        The conversation may be evicted by any later call that loads another session. Use
+        checkout to keep it in memory while it is in use.
+
+        :param session_id: A string identifying the session.
+        :return: The session's ConversationManager.
+        """
+        with self._lock:
+            conversation_manager = self._hot.get(session_id)
+            if conversation_manager is not None:
+                self._hot.move_to_end(session_id)
+                self.hits += 1
+                return conversation_manager
+
+            path = self.path_for(session_id)
+            conversation_manager = self.manager_factory()
+            if os.path.exists(path):
+                self.rehydrations += 1
+                self._num_cold -= 1
+            else:
+                self.creations += 1
+            if self.journal:
+                conversation_manager.attach_journal(path)
+            elif os.path.exists(path):
+                conversation_manager.load_chat_log(path)
+            if self.text_index is not None:
+                conversation_manager.attach_text_index(self.text_index, session_id)
+
+            self._hot[session_id] = conversation_manager
+            self._evict_overflow()
+            return conversation_manager
+
+    @contextmanager
+    def checkout(self, session_id: str) -> Iterator[ConversationManager]:
+        """
+        Returns the conversation of a session like get, and keeps it from being evicted until the
+        block exits. Sessions can be checked out by several threads at once. While too many
+        sessions are checked out, the store holds more than max_hot of them.
+
+        :param session_id: A string identifying the session.
+        :return: A context manager yielding the session's ConversationManager.
+        """
+        with self._lock:
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+            try:
+                conversation_manager = self.get(session_id)
+            except BaseException:
+                self._unpin(session_id)
+                raise
+        try:
+            yield conversation_manager
+        finally:
+            with self._lock:
+                self._unpin(session_id)
+                self._evict_overflow()
+
+    def _unpin(self, session_id: str) -> None:
+        if self._pins[session_id] == 1:
+            del self._pins[session_id]
+        else:
+            self._pins[session_id] -= 1
+
+    def _evict_overflow(self) -> None:
+        overflow = len(self._hot) - self.max_hot
+        if overflow <= 0:
+            return
+        victims = []
+        for session_id in self._hot:
+            if session_id not in self._pins:
+                victims.append(session_id)
+                if len(victims) == overflow:
+                    break
+        for session_id in victims:
+            self.evict(session_id)
+
+    def evict(self, session_id: str) -> None:
+        """
+        Writes a session to disk and drops it from memory. Sessions that are checked out are
+        only evicted by an explicit call.
+
+        :param session_id: A string identifying the session.
+        """
+        with self._lock:
+            conversation_manager = self._hot.pop(session_id, None)
+            if conversation_manager is None:
+                return
+            self._persist(session_id, conversation_manager)
+            conversation_manager.detach_journal()
+            conversation_manager.detach_text_index()
+            self.evictions += 1
+            self._num_cold += 1
+
+    def flush(self) -> None:
+        """Writes every in-memory session to disk, keeping them in memory."""
+        with self._lock:
+            for session_id, conversation_manager in self._hot.items():
+                self._persist(session_id, conversation_manager)
+
+    def close(self) -> None:
+        """Evicts every in-memory session."""
+        with self._lock:
+            for session_id in list(self._hot):
+                self.evict(session_id)
+
+    def delete(self, session_id: str) -> None:
+        """
+        Removes a session from memory and disk.
+
+        :param session_id: A string identifying the session.
+        """
+        with self._lock:
+            conversation_manager = self._hot.pop(session_id, None)
+            if conversation_manager is not None:
+                conversation_manager.detach_journal()
+                conversation_manager.detach_text_index()
+            path = self.path_for(session_id)
+            if os.path.exists(path):
+                os.remove(path)
+                if conversation_manager is None:
+                    self._num_cold -= 1
+            if self.text_index is not None:
+                self.text_index.remove_session(session_id)
+
+    def index_sessions(self) -> int:
+        """
+        Adds every cold session file to the text index, for instance after a restart.
+
+        :return: The number of sessions indexed.
+        """
+        with self._lock:
+            cold = [
+                unquote(name[: -len(".jsonl")])
+                for name in os.listdir(self.directory)
+                if name.endswith(".jsonl")
+            ]
+            cold = [session_id for session_id in cold if session_id not in self._hot]
+        for session_id in cold:
+            self.text_index.index_file(session_id, self.path_for(session_id))
+        return len(cold)
+
+    def search(
+        self, query: str, k: int = 10, session_id: Optional[str] = None
+    ) -> List[SearchHit]:
+        """
+        Searches the messages of every indexed session. See TextIndex.search.
+
+        :param query: A string of terms and quoted phrases.
+        :param k: The maximum number of results.
+        :param session_id: Only search this session, if given.
+        :return: A list of SearchHit, best first.
+        """
+        return self.text_index.search(query, k, session_id)
+
+    def _persist(self, session_id: str, conversation_manager: ConversationManager):
+        if conversation_manager.journal is None:
+            conversation_manager.save_chat_log(self.path_for(session_id))
+        else:
+            conversation_manager.compact_journal()
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._hot or os.path.exists(self.path_for(session_id))
+
+    def __len__(self) -> int:
+        return len(self._hot) + self.num_cold()
+
+    def num_cold(self) -> int:
+        """
+        Counts the sessions that are only on disk. Files added to the directory by another
+        process after the store was created are not counted.
+
+        :return: The number of cold sessions.
+        """
+        return self._num_cold
+
+    def memory_usage(self) -> int:
+        """
+        Estimates the bytes held by the in-memory sessions: message objects, contents,
+        embeddings and embedding indexes.
+
+        :return: An approximate number of bytes.
+        """
+        with self._lock:
+            total = 0
+            for conversation_manager in self._hot.values():
+                total += conversation_manager.embedding_index.nbytes
+                for message in conversation_manager.chat_log:
+                    total += sys.getsizeof(message) + sys.getsizeof(message.content)
+                    if message.has_embedding():
+                        total += sys.getsizeof(message.embedding)
+            return total
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the occupancy, memory and hit counters of the store.
+
+        :return: A dictionary of metrics.
+        """
+        with self._lock:
+            lookups = self.hits + self.rehydrations + self.creations
+            return {
+                "hot": len(self._hot),
+                "cold": self.num_cold(),
+                "max_hot": self.max_hot,
+                "memory_bytes": self.memory_usage(),
+                "hits": self.hits,
+                "rehydrations": self.rehydrations,
+                "creations": self.creations,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+"""
+summarizer.py
+
+This module defines the Summarizer, which summarizes texts of any length with map-reduce: the
+text is split into chunks that fit a request, the chunks are summarized in parallel, and the
+partial summaries are combined level by level until one remains.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union
+
+from chatbot_library.utils.async_conversation_manager import AsyncConversationManager
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.deadline import Deadline
+from chatbot_library.utils.message import Message
+from chatbot_library.utils.tokens import split_into_chunks
+
+
+class Summarizer:
+    """
+    Summarizes long texts through a ConversationManager without touching its chat log.
+
+    Requests go through the manager's create_chat_completion (or acreate_chat_completion), so
+    they use its model, temperature and rate limits. With n chunks, a summary takes about
+    log(n) / log(fan_in) + 1 rounds of requests rather than n.
+
+    :param conversation_manager: The ConversationManager used to send requests.
+    :param chunk_tokens: The maximum number of tokens of text per request.
+    :param fan_in: The maximum number of partial summaries combined per request.
+    :param max_workers: The maximum number of requests in flight.
+    """
+
+    def __init__(
+        self,
+        conversation_manager: ConversationManager,
+        chunk_tokens: int = 2000,
+        fan_in: int = 8,
+        max_workers: int = 8,
+    ) -> None:
+        self.conversation_manager = conversation_manager
+        self.chunk_tokens = chunk_tokens
+        self.fan_in = fan_in
+        self.max_workers = max_workers
+
+    def summarize(
+        self,
+        text: str,
+        focus: Optional[str] = None,
+        deadline: Union[Deadline, float, None] = None,
+    ) -> str:
+        """
+        Summarizes a text.
+
+        :param text: The text to summarize.
+        :param focus: An optional question or topic the summary should concentrate on.
+        :param deadline: A Deadline or a number of seconds bounding every request of the
+            summary together.
+        :return: A string representing the summary, empty for an empty text.
+        """
+        summaries = split_into_chunks(text, self.chunk_tokens)
+        if not summaries:
+            return ""
+        complete = functools.partial(self._complete, deadline=Deadline.of(deadline))
+        prompts = [self._chunk_prompt(chunk, focus) for chunk in summaries]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                summaries = list(executor.map(complete, prompts))
+                if len(summaries) == 1:
+                    return summaries[0]
+                prompts = [
+                    self._combine_prompt(group, focus)
+                    for group in self._group(summaries)
+                ]
+
+    async def asummarize(
+        self,
+        text: str,
+        focus: Optional[str] = None,
+        deadline: Union[Deadline, float, None] = None,
+    ) -> str:
+        """
+        Asynchronous version of summarize. Without an AsyncConversationManager, summarize runs
+        in a worker thread.
+
+        :param text: The text to summarize.
+        :param focus: An optional question or topic the summary should concentrate on.
+        :param deadline: A Deadline or a number of seconds bounding every request of the
+            summary together.
+        :return: A string representing the summary, empty for an empty text.
+        """
+        deadline = Deadline.of(deadline)
+        if not isinstance(self.conversation_manager, AsyncConversationManager):
+            return await asyncio.to_thread(self.summarize, text, focus, deadline)
+        summaries = split_into_chunks(text, self.chunk_tokens)
+        if not summaries:
+            return ""
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def complete(prompt: str) -> str:
+            async with semaphore:
+                return await self.conversation_manager.acreate_chat_completion(
+                    [Message("user", prompt)], deadline=deadline
+                )
+
+        prompts = [self._chunk_prompt(chunk, focus) for chunk in summaries]
+        while True:
+            summaries = await asyncio.gather(*(complete(p) for p in prompts))
+            if len(summaries) == 1:
+                return summaries[0]
+            prompts = [
+                self._combine_prompt(group, focus) for group in self._group(summaries)
+            ]
+
+    def _complete(self, prompt: str, deadline: Optional[Deadline] = None) -> str:
+        return self.conversation_manager.create_chat_completion(
+            [Message("user", prompt)], deadline=deadline
+        )
+
+    def _group(self, summaries: List[str]) -> List[List[str]]:
+        # Consecutive summaries are grouped while they fit chunk_tokens, with at least two per
+        # group so that every level shrinks.
+        groups = []
+        group, group_tokens = [], 0
+        for summary in summaries:
+            tokens = Message("user", summary).num_tokens()
+            if len(group) >= 2 and (
+                len(group) == self.fan_in or group_tokens + tokens > self.chunk_tokens
+            ):
+                groups.append(group)
+                group, group_tokens = [], 0
+            group.append(summary)
+            group_tokens += tokens
+        if len(group) == 1 and groups:
+            groups[-1].append(group[0])
+        else:
+            groups.append(group)
+        return groups
+
+    @staticmethod
+    def _chunk_prompt(chunk: str, focus: Optional[str]) -> str:
+        about = f", focusing on: {focus}" if focus else ""
+        return f"Summarize the following text{about}\n\nText: {chunk}"
+
+    @staticmethod
+    def _combine_prompt(summaries: List[str], focus: Optional[str]) -> str:
+        about = f", focusing on: {focus}" if focus else ""
+        parts = "\n\n".join(
+            f"Part {i + 1}: {summary}" for i, summary in enumerate(summaries)
+        )
+        return (
+            "Combine the following summaries of consecutive parts of a text into one "
+            f"summary{about}\n\n{parts}"
+        )
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+"""
+text_index.py
+
+This module defines the TextIndex, an incremental inverted index over the messages of many
+conversations. It answers term and "quoted phrase" queries ranked by BM25 without scanning
+every message.
+"""
+
+import heapq
+import json
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from chatbot_library.utils.journal import read_journal
+from chatbot_library.utils.message import Message
+
+TOKEN_PATTERN = re.compile(r"\w+")
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits a text into lowercase word terms.
+
+    :param text: The text to split.
+    :return: A list of terms, in order.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class Document(NamedTuple):
+    session_id: str
+    role: str
+    content: str
+
+
+class SearchHit(NamedTuple):
+    doc_id: int
+    session_id: str
+    role: str
+    content: str
+    score: float
+
+
+class TextIndex:
+    """
+    An inverted index from terms to the messages containing them, with their positions.
+
+    Messages are added and removed one at a time as conversations change, so the index never
+    has to be rebuilt. Queries combine bare terms, which rank the results, with quoted phrases,
+    which every result must contain. Results are ranked by BM25.
+
+    Usage:
+        index = TextIndex()
+        index.add("session-1", "user", "My locker code is 4512.")
+        index.search('"locker code"')
+
+    :param k1: The BM25 term frequency saturation.
+    :param b: The BM25 length normalization.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._documents: Dict[int, Document] = {}
+        self._lengths: Dict[int, int] = {}
+        # term -> {doc_id: positions}
+        self._postings: Dict[str, Dict[int, Tuple[int, ...]]] = defaultdict(dict)
+        self._sessions: Dict[str, Set[int]] = defaultdict(set)
+        self._total_length = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, session_id: str, role: str, content: str) -> int:
+        """
+        Indexes a message.
+
+        :param session_id: A string identifying the message's conversation.
+        :param role: The role of the message's author.
+        :param content: The text of the message.
+        :return: The ID of the indexed document, used to remove it.
+        """
+        terms = tokenize(content)
+        positions: Dict[str, List[int]] = defaultdict(list)
+        for position, term in enumerate(terms):
+            positions[term].append(position)
+        with self._lock:
+            doc_id = self._next_id
+            self._next_id += 1
+            self._documents[doc_id] = Document(session_id, role, content)
+            self._lengths[doc_id] = len(terms)
+            self._total_length += len(terms)
+            self._sessions[session_id].add(doc_id)
+            for term, term_positions in positions.items():
+                self._postings[term][doc_id] = tuple(term_positions)
+        return doc_id
+
+    def add_messages(self, session_id: str, messages: Iterable[Message]) -> List[int]:
+        """
+        Indexes several messages of a conversation.
+
+        :param session_id: A string identifying the conversation.
+        :param messages: The Message objects to index.
+        :return: The document IDs, in the order of the messages.
+        """
+        return [self.add(session_id, msg.role, msg.content) for msg in messages]
+
+    def remove(self, doc_id: int) -> None:
+        """
+        Removes a message from the index.
+
+        :param doc_id: The ID returned when the message was added.
+        """
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: int) -> None:
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return
+        self._total_length -= self._lengths.pop(doc_id)
+        session = self._sessions[document.session_id]
+        session.discard(doc_id)
+        if not session:
+            del self._sessions[document.session_id]
+        for term in set(tokenize(document.content)):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def remove_session(self, session_id: str) -> int:
+        """
+        Removes every message of a conversation.
+
+        :param session_id: A string identifying the conversation.
+        :return: The number of messages removed.
+        """
+        with self._lock:
+            doc_ids = list(self._sessions.get(session_id, ()))
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+        return len(doc_ids)
+
+    def index_file(self, session_id: str, file_path: str) -> List[int]:
+        """
+        Indexes a chat log saved by ConversationManager.save_chat_log, in place of any messages
+        already indexed for that conversation.
+
+        :param session_id: A string identifying the conversation.
+        :param file_path: The path of a .json or .jsonl chat log.
+        :return: The document IDs, in the order of the messages.
+        """
+        if file_path.endswith(".jsonl"):
+            messages = read_journal(file_path)
+        else:
+            with open(file_path, "r") as f:
+                messages = [Message.from_dict(data) for data in json.load(f)]
+        self.remove_session(session_id)
+        return self.add_messages(session_id, messages)
+
+    def document(self, doc_id: int) -> Optional[Document]:
+        """
+        Returns an indexed message.
+
+        :param doc_id: The ID of the document.
+        :return: The Document, or None if it was removed.
+        """
+        return self._documents.get(doc_id)
+
+    def search(
+        self, query: str, k: int = 10, session_id: Optional[str] = None
+    ) -> List[SearchHit]:
+        """
+        Finds the messages best matching a query.
+
+        Bare terms match messages containing any of them; "quoted phrases" must appear, as
+        consecutive terms, in every result. Matches are ranked by BM25 over all the query's
+        terms.
+
+        :param query: A string of terms and quoted phrases.
+        :param k: The maximum number of results.
+        :param session_id: Only search this conversation, if given.
+        :return: A list of SearchHit, best first.
+        """
+        terms, phrases = [], []
+        for phrase, term in QUERY_PATTERN.findall(query):
+            if phrase:
+                phrase_terms = tokenize(phrase)
+                if phrase_terms:
+                    phrases.append(phrase_terms)
+                    terms.extend(phrase_terms)
+            else:
+                terms.extend(tokenize(term))
+        if not terms:
+            return []
+
+        with self._lock:
+            scope = (
+                self._sessions.get(session_id, set())
+                if session_id is not None
+                else None
+            )
+            required = None
+            for phrase in phrases:
+                matches = self._phrase_matches(phrase, scope)
+                required = matches if required is None else required & matches
+                if not required:
+                    return []
+
+            num_documents = len(self._documents)
+            average_length = self._total_length / max(num_documents, 1)
+            scores: Dict[int, float] = defaultdict(float)
+            for term in set(terms):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(
+                    1 + (num_documents - len(postings) + 0.5) / (len(postings) + 0.5)
+                )
+                for doc_id, positions in self._candidates(postings, required or scope):
+                    frequency = len(positions)
+                    norm = self.k1 * (
+                        1 - self.b + self.b * self._lengths[doc_id] / average_length
+                    )
+                    scores[doc_id] += (
+                        idf * frequency * (self.k1 + 1) / (frequency + norm)
+                    )
+
+            top = heapq.nsmallest(
+                k, scores.items(), key=lambda item: (-item[1], item[0])
+            )
+            return [
+                SearchHit(doc_id, *self._documents[doc_id], score)
+                for doc_id, score in top
+            ]
+
+    @staticmethod
+    def _candidates(postings, scope: Optional[Set[int]]):
+        if scope is None:
+            return postings.items()
+        if len(scope) < len(postings):
+            return [
+                (doc_id, postings[doc_id]) for doc_id in scope if doc_id in postings
+            ]
+        return [(doc_id, p) for doc_id, p in postings.items() if doc_id in scope]
+
+    def _phrase_matches(self, phrase: List[str], scope: Optional[Set[int]]) -> Set[int]:
+        postings = [self._postings.get(term) for term in phrase]
+        if not all(postings):
+            return set()
+        rarest = min(postings, key=len)
+        matches = set()
+        for doc_id, _ in self._candidates(rarest, scope):
+            if not all(doc_id in term_postings for term_postings in postings):
+                continue
+            starts = set(postings[0][doc_id])
+            for offset, term_postings in enumerate(postings[1:], 1):
+                starts &= {position - offset for position in term_postings[doc_id]}
+                if not starts:
+                    break
+            if starts:
+                matches.add(doc_id)
+        return matches
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""
+tokens.py
+
+This module provides the token counting helpers shared by Message and ConversationManager.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import tiktoken
+
+from chatbot_library.utils.instrumentation import timed
+
+DEFAULT_TOKEN_MODEL = "gpt-3.5-turbo-0301"
+
+# Every reply is primed with <|start|>assistant<|message|>
+REPLY_PRIMING_TOKENS = 3
+
+
+@lru_cache(maxsize=None)
+def get_token_params(model: str = DEFAULT_TOKEN_MODEL) -> Tuple[object, int, int]:
+    """
+    Resolves the encoding and per-message overheads used to count tokens for a model.
+
+    The lookup is cached, so tiktoken is only consulted once per model.
+
+    :param model: A string representing the name of the model.
+    :return: A tuple of (encoding, tokens_per_message, tokens_per_name).
+    """
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        print("Warning: model not found. Using cl100k_base encoding.")
+        encoding = tiktoken.get_encoding("cl100k_base")
+    if model == "gpt-3.5-turbo":
+        print(
+            "Warning: gpt-3.5-turbo may change over time. Returning num tokens assuming gpt-3.5-turbo-0301."
+        )
+        return get_token_params("gpt-3.5-turbo-0301")
+    elif model == "gpt-4":
+        print(
+            "Warning: gpt-4 may change over time. Returning num tokens assuming gpt-4-0314."
+        )
+        return get_token_params("gpt-4-0314")
+    elif model == "gpt-3.5-turbo-0301":
+        tokens_per_message = (
+            4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
+        )
+        tokens_per_name = -1  # if there's a name, the role is omitted
+    elif model == "gpt-4-0314":
+        tokens_per_message = 3
+        tokens_per_name = 1
+    else:
+        raise NotImplementedError(
+            f"""num_tokens_from_messages() is not implemented for model {model}. See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens."""
+        )
+    return encoding, tokens_per_message, tokens_per_name
+
+
+@timed("token_count")
+def num_tokens_from_message(
+    message: Dict[str, str], model: str = DEFAULT_TOKEN_MODEL
+) -> int:
+    """
+    Returns the number of tokens a single message dictionary contributes to a request.
+
+    This excludes the reply priming tokens, which are added once per request.
+
+    :param message: A dictionary representation of a message.
+    :param model: A string representing the name of the model.
+    :return: An integer representing the number of tokens.
+    """
+    encoding, tokens_per_message, tokens_per_name = get_token_params(model)
+    num_tokens = tokens_per_message
+    for key, value in message.items():
+        num_tokens += len(encoding.encode(value))
+        if key == "name":
+            num_tokens += tokens_per_name
+    return num_tokens
+
+
+def split_into_chunks(
+    text: str, chunk_tokens: int, model: str = DEFAULT_TOKEN_MODEL
+) -> List[str]:
+    """
+    Splits a text into consecutive pieces of at most chunk_tokens tokens of the model's
+    encoding. The text is encoded once, so this is linear in its length.
+
+    Byte-level encodings can split a multibyte UTF-8 character across tokens, so a boundary
+    that would fall inside a character is moved back to the character's first token, and every
+    piece decodes without replacement characters. Only a character longer than chunk_tokens
+    tokens makes its piece longer.
+
+    :param text: The text to split.
+    :param chunk_tokens: The maximum number of tokens per piece.
+    :param model: A string representing the name of the model.
+    :return: A list of strings, empty for an empty text.
+    """
+    encoding = get_token_params(model)[0]
+    tokens = encoding.encode(text)
+    token_bytes = getattr(encoding, "decode_single_token_bytes", None)
+    if token_bytes is None:
+        # Tokens of this encoding are whole strings, so any boundary is clean.
+        return [
+            encoding.decode(tokens[start : start + chunk_tokens])
+            for start in range(0, len(tokens), chunk_tokens)
+        ]
+
+    def splits_character(start: int, end: int) -> bool:
+        # A character is at most 4 bytes, and every token holds at least one.
+        tail = b"".join(
+            token_bytes(token) for token in tokens[max(start, end - 4) : end]
+        )
+        return _ends_mid_character(tail)
+
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        end = min(start + chunk_tokens, len(tokens))
+        boundary = end
+        while boundary > start and splits_character(start, boundary):
+            boundary -= 1
+        if boundary == start:
+            boundary = end
+            while boundary < len(tokens) and splits_character(start, boundary):
+                boundary += 1
+        chunks.append(encoding.decode(tokens[start:boundary]))
+        start = boundary
+    return chunks
+
+
+def _ends_mid_character(data: bytes) -> bool:
+    for i in range(1, min(4, len(data)) + 1):
+        byte = data[-i]
+        if byte & 0xC0 == 0x80:
+            # A continuation byte: keep looking for the character's first byte.
+            continue
+        if byte < 0x80:
+            length = 1
+        elif byte >= 0xF0:
+            length = 4
+        elif byte >= 0xE0:
+            length = 3
+        else:
+            length = 2
+        return length > i
+    return False
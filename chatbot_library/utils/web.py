@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+"""
+web.py
+
+This module fetches web pages for the agents' research tools. Pages are downloaded over a
+shared, pooled HTTP session with timeouts and a size cap, and their text is extracted by a
+streaming HTML parser while the body is still arriving.
+"""
+
+import codecs
+import threading
+from html.parser import HTMLParser
+from typing import Iterator, List, Optional
+
+from chatbot_library.utils.deadline import Deadline
+
+DEFAULT_TIMEOUT = (3.05, 10.0)  # (connect, read) seconds
+DEFAULT_MAX_BYTES = 2_000_000
+CHUNK_SIZE = 64 * 1024
+POOL_SIZE = 16
+USER_AGENT = "chatbot_library/1.0"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Returns the process-wide requests session, creating it on first use. Connections are kept
+    alive and reused across fetches, up to POOL_SIZE per host.
+
+    :return: A requests.Session.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # requests is only needed to fetch pages, so it is imported on first use.
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["User-Agent"] = USER_AGENT
+                _session = session
+    return _session
+
+
+class ParagraphExtractor(HTMLParser):
+    """
+    Collects the text of the <p> elements of an HTML document as it is fed, skipping scripts
+    and styles.
+    """
+
+    SKIPPED_TAGS = {"script", "style", "noscript", "template"}
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.paragraphs: List[str] = []
+        self._parts: List[str] = []
+        self._paragraph_depth = 0
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs) -> None:
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == "p":
+            if self._paragraph_depth == 0:
+                self._parts = []
+            self._paragraph_depth += 1
+
+    def handle_endtag(self, tag) -> None:
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "p" and self._paragraph_depth > 0:
+            self._paragraph_depth -= 1
+            if self._paragraph_depth == 0:
+                self._end_paragraph()
+
+    def handle_data(self, data) -> None:
+        if self._paragraph_depth > 0 and self._skip_depth == 0:
+            self._parts.append(data)
+
+    def close(self) -> None:
+        super().close()
+        if self._paragraph_depth > 0:
+            self._paragraph_depth = 0
+            self._end_paragraph()
+
+    def _end_paragraph(self) -> None:
+        text = "".join(self._parts).strip()
+        if text:
+            self.paragraphs.append(text)
+        self._parts = []
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.paragraphs)
+
+
+def extract_text(html: str) -> str:
+    """
+    Returns the text of the <p> elements of an HTML document.
+
+    :param html: A string of HTML.
+    :return: The paragraphs, joined by spaces.
+    """
+    parser = ParagraphExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.text
+
+
+def fetch_page_text(
+    url: str,
+    timeout=DEFAULT_TIMEOUT,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    session=None,
+    deadline: Optional[Deadline] = None,
+) -> str:
+    """
+    Downloads a web page and returns the text of its paragraphs.
+
+    The body is streamed through the parser in chunks, and the download stops after max_bytes,
+    so a huge page costs no more than its first max_bytes.
+
+    The requests timeout only bounds each read from the socket, and a chunk is made of as many
+    reads as it takes to fill it, so a server that trickles its body could hold a fetch
+    indefinitely. With a deadline, the timeouts are capped by the time remaining, the body is
+    consumed as it arrives rather than in full chunks, and the deadline is checked after every
+    read.
+
+    :param url: A string representing the URL of the webpage.
+    :param timeout: The requests timeout, in seconds or as a (connect, read) tuple.
+    :param max_bytes: The maximum number of bytes read from the body.
+    :param session: The requests session to use, by default the shared one.
+    :param deadline: A Deadline bounding the whole download, or None.
+    :return: The paragraphs, joined by spaces.
+    :raises requests.RequestException: If the page cannot be fetched or the status is an error.
+    :raises ChatTimeoutError: If the deadline passes before the download completes.
+    :raises ChatCancelledError: If the deadline is cancelled first.
+    """
+    session = session if session is not None else get_http_session()
+    remaining = deadline.remaining() if deadline is not None else None
+    if deadline is not None:
+        deadline.check()
+    if remaining is not None:
+        timeout = _cap_timeout(timeout, remaining)
+    parser = ParagraphExtractor()
+    try:
+        with session.get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            decoder = codecs.getincrementaldecoder(_codec(response))(errors="replace")
+            received = 0
+            chunks = (
+                response.iter_content(CHUNK_SIZE)
+                if deadline is None
+                else _iter_available(response)
+            )
+            for chunk in chunks:
+                if deadline is not None:
+                    deadline.check()
+                chunk = chunk[: max_bytes - received]
+                received += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if received >= max_bytes:
+                    break
+            parser.feed(decoder.decode(b"", final=True))
+    except Exception:
+        # A read cut short by the capped timeout failed because of the deadline.
+        if deadline is not None:
+            deadline.check()
+        raise
+    parser.close()
+    return parser.text
+
+
+def _cap_timeout(timeout, limit: float):
+    if isinstance(timeout, tuple):
+        return tuple(None if t is None else min(t, limit) for t in timeout)
+    return limit if timeout is None else min(timeout, limit)
+
+
+def _iter_available(response) -> Iterator[bytes]:
+    # read1 returns what a single read from the socket brings, up to CHUNK_SIZE bytes. urllib3
+    # 1.x lacks it, and there whole chunks are read.
+    read1 = getattr(response.raw, "read1", None)
+    if read1 is None:
+        yield from response.iter_content(CHUNK_SIZE)
+        return
+    while True:
+        chunk = read1(CHUNK_SIZE, decode_content=True)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _codec(response) -> str:
+    # requests falls back to ISO-8859-1 for text/* without a charset, but pages without one
+    # are almost always UTF-8 nowadays.
+    if "charset" not in response.headers.get("content-type", "").lower():
+        return "utf-8"
+    try:
+        return codecs.lookup(response.encoding).name
+    except (LookupError, TypeError):
+        return "utf-8"
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 from chatbot_library.agents.smart_agent import SmartAgent
 from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.deadline import ChatError
 
 
 def main():
@@ -19,9 +20,16 @@ def main():
                 print("Invalid position. Please enter a valid position.")
             continue
 
-        response = smart_agent.get_response(user_input)
-
-        print(response)
+        # Print the response as it streams in; Ctrl-C cancels the turn without a partial reply.
+        stream = smart_agent.stream_response(user_input)
+        try:
+            for delta in stream:
+                print(delta, end="", flush=True)
+        except KeyboardInterrupt:
+            stream.close()
+        except ChatError as e:
+            print(f"\nError: {e}", end="")
+        print()
 
 
 if __name__ == "__main__":
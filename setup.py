@@ -11,9 +11,9 @@ setup(
         "openai",
         "tiktoken",
         "google-api-python-client",
-        "beautifulsoup4",
         "colored",
         "requests",
+        "numpy",
     ],
     classifiers=[
         "Development Status :: 3 - Alpha",
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 
+import asyncio
 import os
+import time
 import pytest
 import unittest.mock as mock
 from chatbot_library.agents.smart_agent import Agent, AmnesicAgent, SmartAgent
+from chatbot_library.utils.async_conversation_manager import AsyncConversationManager
 from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.deadline import ChatRequestError
+from chatbot_library.utils.response_cache import ResponseCache
 
 mock_conversation_manager = mock.Mock()
 mock_conversation_manager.get_chatbot_response.return_value = "Hello, how are you?"
@@ -59,3 +64,245 @@ def test_smart_agent_get_webpage_summary(conversation_manager):
 
     assert isinstance(summary, str)
     assert len(summary) > 0
+
+
+def test_smart_agent_aget_response_does_not_interleave_turns():
+    conversation_manager = AsyncConversationManager()
+    smart_agent = SmartAgent(conversation_manager)
+    seen_logs = []
+
+    async def acreate(model, messages, temperature):
+        seen_logs.append([msg["content"] for msg in messages])
+        await asyncio.sleep(0.01)
+        return {"choices": [{"message": {"content": f"re: {messages[-1]['content']}"}}]}
+
+    async def run_turns():
+        return await asyncio.gather(
+            smart_agent.aget_response("first"), smart_agent.aget_response("second")
+        )
+
+    with mock.patch("openai.ChatCompletion.acreate", side_effect=acreate):
+        responses = asyncio.run(run_turns())
+
+    assert responses == ["re: first", "re: second"]
+    assert seen_logs == [["first"], ["first", "re: first", "second"]]
+
+
+def test_amnesic_agent_aget_response_resets_log():
+    conversation_manager = AsyncConversationManager()
+    amnesic_agent = AmnesicAgent(conversation_manager)
+
+    with mock.patch(
+        "openai.ChatCompletion.acreate",
+        new_callable=mock.AsyncMock,
+        return_value={"choices": [{"message": {"content": "Paris"}}]},
+    ):
+        response = asyncio.run(amnesic_agent.aget_response("Capital of France?"))
+
+    assert response == "Paris"
+    assert conversation_manager.chat_log == []
+
+
+def test_aget_response_falls_back_to_thread():
+    amnesic_agent = AmnesicAgent(mock_conversation_manager)
+    response = asyncio.run(amnesic_agent.aget_response("Hello, how are you?"))
+    assert response == "Hello, how are you?"
+
+
+def stream_chunks(deltas):
+    return iter([{"choices": [{"delta": {"content": delta}}]} for delta in deltas])
+
+
+def test_smart_agent_stream_response():
+    conversation_manager = ConversationManager()
+    smart_agent = SmartAgent(conversation_manager)
+
+    with mock.patch(
+        "openai.ChatCompletion.create", return_value=stream_chunks(["Hi", " there"])
+    ):
+        deltas = list(smart_agent.stream_response("Hello"))
+
+    assert deltas == ["Hi", " there"]
+    assert [msg.content for msg in conversation_manager.chat_log] == [
+        "Hello",
+        "Hi there",
+    ]
+
+
+def test_smart_agent_withdraws_unanswered_messages():
+    conversation_manager = ConversationManager()
+    smart_agent = SmartAgent(conversation_manager, personality="Be nice.")
+
+    with mock.patch(
+        "openai.ChatCompletion.create", return_value=stream_chunks(["Hi", " there"])
+    ):
+        stream = smart_agent.stream_response("Hello")
+        assert next(stream) == "Hi"
+        stream.close()
+    assert [msg.role for msg in conversation_manager.chat_log] == ["system"]
+
+    async def astream():
+        async for delta in smart_agent.astream_response("Hello"):
+            pass
+
+    smart_agent.conversation_manager = AsyncConversationManager()
+    with mock.patch("openai.ChatCompletion.acreate", side_effect=RuntimeError("boom")):
+        with pytest.raises(ChatRequestError):
+            asyncio.run(astream())
+    assert smart_agent.conversation_manager.chat_log == []
+
+    smart_agent.conversation_manager = conversation_manager
+    with mock.patch("openai.ChatCompletion.create", side_effect=RuntimeError("boom")):
+        with pytest.raises(ChatRequestError):
+            smart_agent.get_response("Hello")
+    assert [msg.role for msg in conversation_manager.chat_log] == ["system"]
+
+
+def test_amnesic_agent_stream_response_resets_log_when_cancelled():
+    conversation_manager = ConversationManager()
+    amnesic_agent = AmnesicAgent(conversation_manager)
+
+    with mock.patch(
+        "openai.ChatCompletion.create", return_value=stream_chunks(["Hi", " there"])
+    ):
+        stream = amnesic_agent.stream_response("Hello")
+        assert next(stream) == "Hi"
+        stream.close()
+
+    assert conversation_manager.chat_log == []
+
+
+def test_amnesic_agent_response_cache_skips_repeated_requests():
+    conversation_manager = ConversationManager()
+    amnesic_agent = AmnesicAgent(conversation_manager, response_cache=ResponseCache())
+
+    with mock.patch(
+        "openai.ChatCompletion.create",
+        return_value={"choices": [{"message": {"content": "Paris"}}]},
+    ) as create:
+        first = amnesic_agent.get_response("Capital of France?")
+        second = amnesic_agent.get_response("Capital of France?")
+        streamed = list(amnesic_agent.stream_response("Capital of France?"))
+
+    assert first == second == "Paris"
+    assert streamed == ["Paris"]
+    assert create.call_count == 1
+    assert amnesic_agent.response_cache.stats()["hits"] == 2
+    assert conversation_manager.chat_log == []
+
+
+def test_amnesic_agent_semantic_cache_reuses_similar_questions():
+    conversation_manager = AsyncConversationManager()
+    amnesic_agent = AmnesicAgent(
+        conversation_manager, response_cache=ResponseCache(semantic_threshold=0.9)
+    )
+    embeddings = {"Capital of France?": [1.0, 0.0], "France's capital?": [0.99, 0.1]}
+
+    async def aget_embedding(self, content, engine=None):
+        return embeddings[content]
+
+    with mock.patch(
+        "openai.ChatCompletion.acreate",
+        new_callable=mock.AsyncMock,
+        return_value={"choices": [{"message": {"content": "Paris"}}]},
+    ) as acreate, mock.patch(
+        "chatbot_library.utils.message.Message.aget_embedding", aget_embedding
+    ):
+        first = asyncio.run(amnesic_agent.aget_response("Capital of France?"))
+        second = asyncio.run(amnesic_agent.aget_response("France's capital?"))
+
+    assert first == second == "Paris"
+    assert acreate.await_count == 1
+    assert amnesic_agent.response_cache.stats()["semantic_hits"] == 1
+
+
+def test_amnesic_agent_exact_hits_skip_embedding():
+    conversation_manager = ConversationManager()
+    amnesic_agent = AmnesicAgent(
+        conversation_manager, response_cache=ResponseCache(semantic_threshold=0.9)
+    )
+
+    with mock.patch(
+        "openai.ChatCompletion.create",
+        return_value={"choices": [{"message": {"content": "Paris"}}]},
+    ), mock.patch(
+        "chatbot_library.utils.message.Message.get_embedding", return_value=[1.0, 0.0]
+    ) as get_embedding:
+        assert amnesic_agent.get_response("Capital of France?") == "Paris"
+        assert list(amnesic_agent.stream_response("Capital of France?")) == ["Paris"]
+
+    assert get_embedding.call_count == 1
+    stats = amnesic_agent.response_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_amnesic_agent_batch_uses_response_cache():
+    conversation_manager = ConversationManager()
+    amnesic_agent = AmnesicAgent(conversation_manager, response_cache=ResponseCache())
+
+    def create(model, messages, temperature):
+        return {"choices": [{"message": {"content": messages[-1]["content"] * 2}}]}
+
+    with mock.patch("openai.ChatCompletion.create", side_effect=create) as create_mock:
+        assert amnesic_agent.get_response("a") == "aa"
+        results = amnesic_agent.batch(["a", "b", "c"])
+        again = asyncio.run(amnesic_agent.abatch(["c", "b"]))
+
+    assert results == ["aa", "bb", "cc"]
+    assert again == ["cc", "bb"]
+    assert create_mock.call_count == 3
+    assert conversation_manager.chat_log == []
+
+
+def research_agent(page_delay):
+    smart_agent = SmartAgent(ConversationManager())
+    results = [{"link": f"https://example.com/{i}"} for i in range(3)]
+
+    def fetch(url, deadline=None):
+        time.sleep(page_delay)
+        return "" if url.endswith("/2") else f"Text of {url}"
+
+    smart_agent._search_results = lambda query, num: results
+    smart_agent._fetch_page_text = fetch
+    return smart_agent
+
+
+def summarize(model, messages, temperature):
+    prompt = messages[-1]["content"]
+    if prompt.startswith("Using"):
+        return {"choices": [{"message": {"content": f"Merged: {prompt}"}}]}
+    return {"choices": [{"message": {"content": prompt.split("Text: ")[1]}}]}
+
+
+def test_smart_agent_research_fetches_pages_in_parallel():
+    smart_agent = research_agent(page_delay=0.2)
+
+    with mock.patch("openai.ChatCompletion.create", side_effect=summarize) as create:
+        start = time.perf_counter()
+        answer = smart_agent.research("What is at example.com?")
+        elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.5
+    assert "Source 1: Text of https://example.com/0" in answer
+    assert "Source 2: Text of https://example.com/1" in answer
+    assert "example.com/2" not in answer
+    assert create.call_count == 3
+    assert [msg.role for msg in smart_agent.conversation_manager.chat_log] == [
+        "user",
+        "assistant",
+    ]
+
+
+def test_smart_agent_aresearch():
+    smart_agent = research_agent(page_delay=0.0)
+    smart_agent.conversation_manager = AsyncConversationManager()
+
+    async def acreate(model, messages, temperature):
+        return summarize(model, messages, temperature)
+
+    with mock.patch("openai.ChatCompletion.acreate", side_effect=acreate):
+        answer = asyncio.run(smart_agent.aresearch("What is at example.com?"))
+
+    assert answer.startswith("Merged:")
+    assert "Source 2: Text of https://example.com/1" in answer
+    assert smart_agent.conversation_manager.chat_log[-1].content == answer
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+from chatbot_library.utils.archive import ChatArchive, export_archive
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.message import Message
+
+
+class TestChatArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmpdir.name, "archive")
+        self.messages = [
+            Message("system", "You are a helpful assistant."),
+            Message("user", "Où est la gare ?", embedding=[0.0, 2.0]),
+            Message("assistant", "", embedding=[3.0, 0.0]),
+            Message("user", "Thanks!", embedding=[1.0, 1.0]),
+        ]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_round_trip_matches_from_dict_shape(self):
+        self.assertEqual(export_archive(self.messages, self.directory), 4)
+        archive = ChatArchive(self.directory)
+
+        self.assertEqual(len(archive), 4)
+        self.assertEqual(list(archive), [msg.to_dict() for msg in self.messages])
+        self.assertEqual(archive[-1], {"role": "user", "content": "Thanks!"})
+        self.assertEqual(Message.from_dict(archive[1]).content, "Où est la gare ?")
+        with self.assertRaises(IndexError):
+            archive[4]
+
+    def test_restores_cached_tokens_and_embeddings(self):
+        self.messages[3].num_tokens()
+        export_archive(self.messages, self.directory)
+        archive = ChatArchive(self.directory)
+
+        restored = archive.message(3)
+        self.assertEqual(
+            restored.cached_num_tokens(), self.messages[3].cached_num_tokens()
+        )
+        self.assertIsNone(archive.message(1).cached_num_tokens())
+        self.assertEqual(list(restored.embedding), [1.0, 1.0])
+        self.assertFalse(archive.message(0).has_embedding())
+
+    def test_search_without_building_messages(self):
+        export_archive(self.messages, self.directory)
+        archive = ChatArchive(self.directory)
+
+        results = archive.search([0.1, 1.0], k=2)
+        self.assertEqual([position for position, _ in results], [1, 3])
+        self.assertAlmostEqual(results[0][1], 0.995, places=3)
+
+    def test_search_skips_messages_without_embeddings(self):
+        export_archive(self.messages, self.directory)
+        archive = ChatArchive(self.directory)
+
+        results = archive.search([-1.0, -1.0], k=4)
+        self.assertEqual(len(results), 3)
+        self.assertNotIn(0, [position for position, _ in results])
+
+    def test_empty_archive(self):
+        export_archive([], self.directory)
+        archive = ChatArchive(self.directory)
+        self.assertEqual(len(archive), 0)
+        self.assertEqual(archive.search([1.0, 0.0]), [])
+
+    def test_conversation_manager_export_and_import(self):
+        conversation_manager = ConversationManager()
+        conversation_manager.chat_log = list(self.messages)
+        conversation_manager.export_archive(self.directory)
+
+        restored = ConversationManager()
+        restored.import_archive(self.directory)
+        self.assertEqual(
+            [msg.to_dict() for msg in restored.chat_log],
+            [msg.to_dict() for msg in self.messages],
+        )
+        self.assertEqual(restored.total_tokens(), conversation_manager.total_tokens())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from chatbot_library.utils.async_conversation_manager import AsyncConversationManager
+from chatbot_library.utils.deadline import ChatRequestError
+
+
+def chat_response(content):
+    return {"choices": [{"message": {"content": content}}]}
+
+
+async def stream_response(deltas):
+    for delta in deltas:
+        await asyncio.sleep(0)
+        yield {"choices": [{"delta": {"content": delta}}]}
+
+
+class TestAsyncConversationManager(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.conversation_manager = AsyncConversationManager()
+
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_aget_chatbot_response(self, mock_acreate):
+        mock_acreate.return_value = chat_response("Hello, how can I help you?")
+        self.conversation_manager.append_user_message("Hello")
+        response = await self.conversation_manager.aget_chatbot_response()
+
+        self.assertEqual(response, "Hello, how can I help you?")
+        self.assertEqual(self.conversation_manager.chat_log[-1].role, "assistant")
+        self.assertEqual(
+            mock_acreate.call_args[1]["messages"],
+            [
+                {"role": "user", "content": "Hello"},
+            ],
+        )
+
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_aget_chatbot_response_error(self, mock_acreate):
+        mock_acreate.side_effect = RuntimeError("boom")
+        self.conversation_manager.append_user_message("Hello")
+        with self.assertRaises(ChatRequestError) as raised:
+            await self.conversation_manager.aget_chatbot_response()
+        self.assertIsInstance(raised.exception.__cause__, RuntimeError)
+        self.assertEqual(self.conversation_manager.chat_log[-1].role, "user")
+
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_astream_chatbot_response(self, mock_acreate):
+        mock_acreate.return_value = stream_response(["Hello, ", "how can I help you?"])
+        self.conversation_manager.append_user_message("Hello")
+        deltas = [
+            delta
+            async for delta in self.conversation_manager.astream_chatbot_response()
+        ]
+
+        self.assertEqual(deltas, ["Hello, ", "how can I help you?"])
+        self.assertEqual(
+            self.conversation_manager.chat_log[-1].content, "Hello, how can I help you?"
+        )
+
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_cancelled_astream_leaves_no_partial_message(self, mock_acreate):
+        mock_acreate.return_value = stream_response(["Hello, ", "how can I help you?"])
+        self.conversation_manager.append_user_message("Hello")
+        stream = self.conversation_manager.astream_chatbot_response()
+        self.assertEqual(await stream.__anext__(), "Hello, ")
+        await stream.aclose()
+
+        self.assertEqual(len(self.conversation_manager.chat_log), 1)
+
+    @patch("openai.Embedding.acreate", new_callable=AsyncMock)
+    async def test_asemantic_search(self, mock_acreate):
+        vectors = {
+            "Tell me about the weather.": [1.0, 0.0],
+            "What is your name?": [0.0, 1.0],
+            "Will it rain?": [0.9, 0.1],
+        }
+
+        async def embed(input, engine):
+            inputs = input if isinstance(input, list) else [input]
+            return {
+                "data": [
+                    {"index": i, "embedding": vectors[text]}
+                    for i, text in enumerate(inputs)
+                ]
+            }
+
+        mock_acreate.side_effect = embed
+        self.conversation_manager.append_user_message("Tell me about the weather.")
+        self.conversation_manager.append_user_message("What is your name?")
+
+        messages = await self.conversation_manager.asemantic_search("Will it rain?", 1)
+        self.assertEqual(
+            [msg.content for msg in messages], ["Tell me about the weather."]
+        )
+        # One request for the query and one batched request for the chat log.
+        self.assertEqual(mock_acreate.call_count, 2)
+
+    @patch("openai.Embedding.acreate", new_callable=AsyncMock)
+    async def test_aembed_chat_log(self, mock_acreate):
+        mock_acreate.return_value = {
+            "data": [
+                {"index": 0, "embedding": [1.0]},
+                {"index": 1, "embedding": [2.0]},
+            ]
+        }
+        self.conversation_manager.append_user_message("Hi")
+        self.conversation_manager.append_bot_message("Hello")
+        self.assertEqual(await self.conversation_manager.aembed_chat_log(), 2)
+        self.assertTrue(
+            all(msg.has_embedding() for msg in self.conversation_manager.chat_log)
+        )
+
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_aget_chatbot_responses(self, mock_acreate):
+        async def acreate(model, messages, temperature):
+            content = messages[-1]["content"]
+            if content == "bad":
+                raise ValueError("bad prompt")
+            return {"choices": [{"message": {"content": content.upper()}}]}
+
+        mock_acreate.side_effect = acreate
+        results = await self.conversation_manager.aget_chatbot_responses(
+            ["a", "bad", "c"], max_concurrency=2
+        )
+
+        self.assertEqual(results[0], "A")
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], "C")
+        self.assertEqual(self.conversation_manager.chat_log, [])
+
+    @patch("openai.ChatCompletion.acreate", new_callable=AsyncMock)
+    async def test_forks_answer_concurrently(self, mock_acreate):
+        async def acreate(model, messages, temperature):
+            await asyncio.sleep(0.01)
+            return chat_response(f"{temperature}: {len(messages)}")
+
+        mock_acreate.side_effect = acreate
+        self.conversation_manager.append_user_message("Hello")
+        branches = [self.conversation_manager.fork() for _ in range(3)]
+        for temperature, branch in enumerate(branches):
+            branch.temperature = temperature
+
+        responses = await asyncio.gather(
+            *(branch.aget_chatbot_response() for branch in branches)
+        )
+
+        self.assertEqual(responses, ["0: 1", "1: 1", "2: 1"])
+        self.assertEqual(len({id(branch.lock) for branch in branches}), 3)
+        self.assertEqual(len(self.conversation_manager.chat_log), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
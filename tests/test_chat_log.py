@@ -0,0 +1,53 @@
+import unittest
+
+from chatbot_library.utils.chat_log import ChatLog
+from chatbot_library.utils.message import Message
+
+
+class TestChatLog(unittest.TestCase):
+    def setUp(self):
+        self.messages = [Message("user", str(i)) for i in range(4)]
+        self.log = ChatLog(list(self.messages))
+
+    def test_behaves_like_a_list(self):
+        self.log.append(Message("user", "4"))
+        self.log.insert(0, Message("system", "Be nice."))
+
+        self.assertEqual(len(self.log), 6)
+        self.assertEqual(self.log[1:5], self.messages)
+        self.assertEqual(self.log[-1].content, "4")
+        self.assertEqual(self.log.pop(0).content, "Be nice.")
+        self.assertEqual(self.log + [], list(self.log))
+        self.assertEqual(ChatLog(), [])
+        with self.assertRaises(IndexError):
+            ChatLog().pop()
+
+    def test_forks_share_their_prefix_without_copying_it(self):
+        branch = self.log.fork()
+        self.log.append(Message("user", "parent"))
+        branch.append(Message("user", "branch"))
+        other = self.log.fork()
+
+        self.assertIs(other._prefix, branch._prefix)
+        self.assertEqual(
+            [msg.content for msg in branch], ["0", "1", "2", "3", "branch"]
+        )
+        self.assertEqual([msg.content for msg in other], ["0", "1", "2", "3", "parent"])
+        self.assertEqual(list(self.log), list(other))
+
+        last = branch.fork()
+        self.assertIsNot(last._prefix, other._prefix)
+        self.assertEqual([msg.content for msg in last], ["0", "1", "2", "3", "branch"])
+
+    def test_changing_a_shared_message_only_affects_one_log(self):
+        branch = self.log.fork()
+        popped = branch.pop(1)
+        branch[0] = Message("system", "Be rude.")
+
+        self.assertIs(popped, self.messages[1])
+        self.assertEqual(list(self.log), self.messages)
+        self.assertEqual([msg.content for msg in branch], ["Be rude.", "2", "3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+
+from chatbot_library.utils.context import pack_context, score_messages
+from chatbot_library.utils.message import Message
+
+
+def make_log(*contents):
+    return [Message("system", "Be nice.")] + [
+        Message("user" if i % 2 == 0 else "assistant", content)
+        for i, content in enumerate(contents)
+    ]
+
+
+class TestPackContext(unittest.TestCase):
+    def test_log_that_fits_is_returned_whole(self):
+        messages = make_log("a", "b", "c")
+        self.assertEqual(pack_context(messages, 10_000), messages)
+
+    def test_system_and_latest_messages_are_always_kept(self):
+        messages = make_log("one two three", "four five six", "seven")
+        packed = pack_context(messages, 1)
+        self.assertEqual(packed, [messages[0], messages[-1]])
+
+    def test_result_fits_budget_and_keeps_order(self):
+        messages = make_log(*[f"message number {i}" for i in range(30)])
+        budget = 60
+        packed = pack_context(messages, budget)
+
+        self.assertLessEqual(sum(msg.num_tokens() for msg in packed) + 3, budget)
+        positions = [messages.index(msg) for msg in packed]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_recency_alone_prefers_recent_messages(self):
+        messages = make_log(*[f"message number {i}" for i in range(30)])
+        packed = pack_context(messages, 60)
+        self.assertIn(messages[-2], packed)
+        self.assertNotIn(messages[1], packed)
+
+    def test_relevant_old_message_beats_recent_chit_chat(self):
+        messages = make_log(
+            "My locker code is 4512.",
+            "ok",
+            "nice weather",
+            "indeed",
+            "what is my locker code?",
+        )
+        similarities = np.array([0.0, 0.9, 0.1, 0.1, 0.1, 1.0])
+        budget = (
+            messages[0].num_tokens()
+            + messages[1].num_tokens()
+            + messages[-1].num_tokens()
+        ) + 3
+        packed = pack_context(messages, budget, similarities, relevance_weight=0.9)
+        self.assertEqual(packed, [messages[0], messages[1], messages[-1]])
+
+    def test_message_that_does_not_fit_is_skipped(self):
+        messages = make_log(
+            " ".join(["relevant"] * 40),
+            "ok",
+            "what was that?",
+        )
+        similarities = np.array([0.0, 1.0, 0.0, 1.0])
+        budget = (
+            messages[0].num_tokens()
+            + messages[2].num_tokens()
+            + messages[-1].num_tokens()
+        ) + 3
+        packed = pack_context(messages, budget, similarities, relevance_weight=0.9)
+        self.assertEqual(packed, [messages[0], messages[2], messages[-1]])
+
+    def test_scores_mix_recency_and_relevance(self):
+        recency = score_messages(3, recency_half_life=1.0)
+        np.testing.assert_allclose(recency, [0.25, 0.5, 1.0])
+        mixed = score_messages(3, np.array([1.0, 0.0, 0.0]), 0.5, 1.0)
+        np.testing.assert_allclose(mixed, [0.625, 0.25, 0.5])
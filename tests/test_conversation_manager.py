@@ -2,6 +2,9 @@ import unittest
 import os
 from unittest.mock import patch
 from chatbot_library.utils.conversation_manager import ConversationManager, Message
+from chatbot_library.utils.deadline import ChatRequestError
+from chatbot_library.utils.memory import LongTermMemory
+from chatbot_library.utils.tokens import get_token_params
 
 
 class TestConversationManager(unittest.TestCase):
@@ -33,6 +36,60 @@ class TestConversationManager(unittest.TestCase):
         response = self.conversation_manager.get_chatbot_response()
         self.assertEqual(response, "Hello, how can I help you?")
 
+    @patch("openai.ChatCompletion.create")
+    def test_get_chatbot_response_raises_typed_errors(self, mock_openai_create):
+        mock_openai_create.side_effect = RuntimeError("boom")
+        self.conversation_manager.append_user_message("Hello")
+        with self.assertRaises(ChatRequestError) as raised:
+            self.conversation_manager.get_chatbot_response()
+        self.assertIsInstance(raised.exception.__cause__, RuntimeError)
+        self.assertEqual(self.conversation_manager.chat_log[-1].role, "user")
+
+        mock_openai_create.side_effect = RuntimeError("broken stream")
+        with self.assertRaises(ChatRequestError):
+            list(self.conversation_manager.stream_chatbot_response())
+
+    @patch("openai.ChatCompletion.create")
+    def test_stream_chatbot_response(self, mock_openai_create):
+        mock_openai_create.return_value = iter(
+            [
+                {"choices": [{"delta": {"role": "assistant"}}]},
+                {"choices": [{"delta": {"content": "Hello, "}}]},
+                {"choices": [{"delta": {"content": "how can I help you?"}}]},
+                {"choices": [{"delta": {}}]},
+            ]
+        )
+        self.conversation_manager.append_user_message("Hello")
+        deltas = list(self.conversation_manager.stream_chatbot_response())
+
+        self.assertEqual(deltas, ["Hello, ", "how can I help you?"])
+        self.assertTrue(mock_openai_create.call_args[1]["stream"])
+        self.assertEqual(
+            self.conversation_manager.chat_log[-1].to_dict(),
+            {"role": "assistant", "content": "Hello, how can I help you?"},
+        )
+
+    @patch("openai.ChatCompletion.create")
+    def test_cancelled_stream_leaves_no_partial_message(self, mock_openai_create):
+        mock_openai_create.return_value = iter(
+            [
+                {"choices": [{"delta": {"content": "Hello, "}}]},
+                {"choices": [{"delta": {"content": "how can I help you?"}}]},
+            ]
+        )
+        self.conversation_manager.append_user_message("Hello")
+        stream = self.conversation_manager.stream_chatbot_response()
+        self.assertEqual(next(stream), "Hello, ")
+        stream.close()
+
+        self.assertEqual(len(self.conversation_manager.chat_log), 1)
+        self.assertEqual(
+            self.conversation_manager.total_tokens(),
+            self.conversation_manager.num_tokens_from_messages(
+                self.conversation_manager.chat_log
+            ),
+        )
+
     def test_search_for_message(self):
         self.conversation_manager.append_user_message("Hi, how are you?")
         self.conversation_manager.append_bot_message("I'm doing well, thank you!")
@@ -46,6 +103,30 @@ class TestConversationManager(unittest.TestCase):
         self.assertEqual(messages[0].role, "user")
         self.assertEqual(messages[0].content, "What's the weather like?")
 
+    @patch("chatbot_library.utils.message.Message.call_with_rate_limit_retry")
+    def test_semantic_search(self, mock_call_with_rate_limit_retry):
+        vectors = {
+            "Tell me about the weather.": [1.0, 0.0],
+            "Rain is expected tomorrow.": [0.9, 0.1],
+            "What is your name?": [0.0, 1.0],
+            "Will it rain?": [0.8, 0.2],
+        }
+        mock_call_with_rate_limit_retry.side_effect = lambda func, input, engine: {
+            "data": [
+                {"index": i, "embedding": vectors[text]}
+                for i, text in enumerate(input if isinstance(input, list) else [input])
+            ]
+        }
+        self.conversation_manager.append_user_message("Tell me about the weather.")
+        self.conversation_manager.append_bot_message("Rain is expected tomorrow.")
+        self.conversation_manager.append_user_message("What is your name?")
+
+        messages = self.conversation_manager.semantic_search("Will it rain?", k=2)
+        self.assertEqual(
+            [msg.content for msg in messages],
+            ["Rain is expected tomorrow.", "Tell me about the weather."],
+        )
+
     def test_save_and_load_chat_log(self):
         self.conversation_manager.append_user_message("Hi")
         self.conversation_manager.append_bot_message("Hello")
@@ -96,14 +177,178 @@ class TestConversationManagerExtended(TestConversationManager):
             f"Number of tokens {num_tokens} exceeded the maximum limit {self.conversation_manager.max_tokens}.",
         )
 
-    @patch("chatbot_library.utils.conversation_manager.tiktoken.encoding_for_model")
+    @patch("chatbot_library.utils.tokens.tiktoken.encoding_for_model")
     def test_num_tokens_from_messages_model_not_found(self, mock_encoding_for_model):
         mock_encoding_for_model.side_effect = KeyError("Model not found")
+        get_token_params.cache_clear()
+        self.addCleanup(get_token_params.cache_clear)
         messages = [Message("user", "Hello!")]
         tokens = self.conversation_manager.num_tokens_from_messages(messages)
         self.assertTrue(isinstance(tokens, int))
         self.assertGreater(tokens, 0)
 
+    def test_total_tokens_tracks_appends_and_trims(self):
+        self.conversation_manager.initialize_conversation("Welcome to the chatbot.")
+        self.conversation_manager.max_tokens = 60
+        for i in range(20):
+            self.conversation_manager.append_user_message(f"User message number {i}.")
+            self.conversation_manager.append_bot_message(f"Bot reply number {i}.")
+            self.assertEqual(
+                self.conversation_manager.total_tokens(),
+                self.conversation_manager.num_tokens_from_messages(
+                    self.conversation_manager.chat_log
+                ),
+            )
+        self.assertLessEqual(
+            self.conversation_manager.total_tokens(),
+            self.conversation_manager.max_tokens,
+        )
+        self.assertEqual(self.conversation_manager.chat_log[0].role, "system")
+
+    def test_total_tokens_after_replacing_chat_log(self):
+        self.conversation_manager.append_user_message("Hi")
+        self.conversation_manager.append_bot_message("Hello")
+        messages = list(self.conversation_manager.chat_log)
+        self.conversation_manager.reset_chat_log()
+        self.assertEqual(
+            self.conversation_manager.total_tokens(),
+            self.conversation_manager.num_tokens_from_messages([]),
+        )
+        self.conversation_manager.chat_log = messages
+        self.assertEqual(
+            self.conversation_manager.total_tokens(),
+            self.conversation_manager.num_tokens_from_messages(messages),
+        )
+
+    @patch("openai.ChatCompletion.create")
+    def test_get_chatbot_responses_keeps_order_and_errors(self, mock_openai_create):
+        def create(model, messages, temperature):
+            content = messages[-1]["content"]
+            if content == "bad":
+                raise ValueError("bad prompt")
+            return {"choices": [{"message": {"content": content.upper()}}]}
+
+        mock_openai_create.side_effect = create
+        self.conversation_manager.initialize_conversation("Classify the text.")
+        results = self.conversation_manager.get_chatbot_responses(
+            ["a", "bad", "c"], max_workers=2
+        )
+
+        self.assertEqual(results[0], "A")
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], "C")
+        self.assertEqual(len(self.conversation_manager.chat_log), 1)
+        for call in mock_openai_create.call_args_list:
+            self.assertEqual(call.kwargs["messages"][0]["role"], "system")
+
+    @patch("openai.ChatCompletion.create")
+    def test_context_tokens_select_relevant_messages(self, mock_openai_create):
+        mock_openai_create.return_value = {
+            "choices": [{"message": {"content": "4512"}}]
+        }
+        embeddings = {"locker": [1.0, 0.0], "other": [0.0, 1.0]}
+        conversation_manager = self.conversation_manager
+        conversation_manager.initialize_conversation("Be nice.")
+        conversation_manager.append_user_message("My locker code is 4512.")
+        for _ in range(10):
+            conversation_manager.append_bot_message("The weather is nice today.")
+        conversation_manager.append_user_message("What is my locker code?")
+        for msg in conversation_manager.chat_log:
+            msg.embedding = embeddings["locker" if "locker" in msg.content else "other"]
+        conversation_manager.context_tokens = 40
+        conversation_manager.relevance_weight = 0.9
+
+        conversation_manager.get_chatbot_response()
+
+        sent = [m["content"] for m in mock_openai_create.call_args.kwargs["messages"]]
+        self.assertEqual(sent[0], "Be nice.")
+        self.assertIn("My locker code is 4512.", sent)
+        self.assertEqual(sent[-1], "What is my locker code?")
+        self.assertLess(len(sent), 13)
+
+    @patch("openai.ChatCompletion.create")
+    def test_trimmed_messages_are_recalled_from_long_term_memory(
+        self, mock_openai_create
+    ):
+        mock_openai_create.return_value = {
+            "choices": [{"message": {"content": "4512"}}]
+        }
+        conversation_manager = self.conversation_manager
+        conversation_manager.long_term_memory = LongTermMemory()
+        conversation_manager.memory_k = 1
+        conversation_manager.max_tokens = 60
+        conversation_manager.initialize_conversation("Be nice.")
+        conversation_manager.append_user_message("My locker code is 4512.")
+        conversation_manager.chat_log[-1].embedding = [1.0, 0.0]
+        for _ in range(10):
+            conversation_manager.append_bot_message("The weather is nice today.")
+            conversation_manager.chat_log[-1].embedding = [0.0, 1.0]
+        conversation_manager.append_user_message("What is my locker code?")
+        conversation_manager.chat_log[-1].embedding = [0.9, 0.1]
+        self.assertNotIn(
+            "My locker code is 4512.",
+            [msg.content for msg in conversation_manager.chat_log],
+        )
+
+        conversation_manager.get_chatbot_response()
+
+        sent = mock_openai_create.call_args.kwargs["messages"]
+        self.assertEqual(sent[0]["content"], "Be nice.")
+        self.assertEqual(sent[1]["content"], "My locker code is 4512.")
+        self.assertEqual(sent[-1]["content"], "What is my locker code?")
+        self.assertLessEqual(
+            conversation_manager.num_tokens_from_messages(
+                [Message.from_dict(msg) for msg in sent]
+            ),
+            conversation_manager.max_tokens,
+        )
+
+    @patch("chatbot_library.utils.message.Message.call_with_rate_limit_retry")
+    def test_fork_shares_history_without_copying_it(self, mock_embedding):
+        conversation_manager = self.conversation_manager
+        conversation_manager.initialize_conversation("Be nice.")
+        conversation_manager.chat_log[0].embedding = [1.0, 0.0]
+        for i in range(5):
+            conversation_manager.append_user_message(f"Question {i}")
+            conversation_manager.chat_log[-1].embedding = [1.0, float(i)]
+        total_tokens = conversation_manager.total_tokens()
+
+        branch = conversation_manager.fork()
+        branch.temperature = 0.2
+        branch.append_user_message("Branch only")
+        branch.chat_log[-1].embedding = [0.0, 1.0]
+
+        self.assertEqual(conversation_manager.total_tokens(), total_tokens)
+        self.assertEqual(len(conversation_manager.chat_log), 6)
+        self.assertEqual(len(branch.chat_log), 7)
+        self.assertEqual(conversation_manager.temperature, 1.0)
+        for original, shared in zip(conversation_manager.chat_log, branch.chat_log):
+            self.assertIs(original, shared)
+        self.assertEqual(
+            branch.total_tokens(),
+            total_tokens + branch.chat_log[-1].num_tokens(),
+        )
+        results = branch.embedding_index.search([0.0, 1.0], k=1)
+        self.assertEqual([msg.content for msg, _ in results], ["Branch only"])
+        self.assertNotIn(branch.chat_log[-1], conversation_manager.embedding_index)
+        mock_embedding.assert_not_called()
+
+    def test_forking_every_turn_keeps_sharing_the_history(self):
+        conversation_manager = self.conversation_manager
+        conversation_manager.initialize_conversation("Be nice.")
+        branches = []
+        for i in range(20):
+            conversation_manager.append_user_message(f"Question {i}")
+            conversation_manager.chat_log[-1].embedding = [1.0, float(i)]
+            branches.append(conversation_manager.fork())
+
+        self.assertIs(branches[0].chat_log._prefix, branches[-1].chat_log._prefix)
+        self.assertEqual(len(branches[0].chat_log), 2)
+        self.assertEqual(len(branches[-1].chat_log), 21)
+        self.assertEqual(
+            list(branches[-1].chat_log), list(conversation_manager.chat_log)
+        )
+
     def test_print_latest_message(self):
         self.conversation_manager.append_user_message("Hi")
         self.conversation_manager.append_bot_message("Hello")
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from chatbot_library.utils.embedding_cache import (
+    EmbeddingCache,
+    get_embedding_cache,
+    set_embedding_cache,
+)
+from chatbot_library.utils.message import EmbeddingBatcher, Message
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "embeddings.sqlite3")
+
+    def tearDown(self):
+        set_embedding_cache(None)
+        self.tmpdir.cleanup()
+
+    def test_key_normalizes_content_and_includes_engine(self):
+        key = EmbeddingCache.make_key("engine-a", "Hello   world\n")
+        self.assertEqual(key, EmbeddingCache.make_key("engine-a", "Hello world"))
+        self.assertNotEqual(key, EmbeddingCache.make_key("engine-b", "Hello world"))
+
+    def test_memory_tier_hits_and_misses(self):
+        cache = EmbeddingCache()
+        self.assertIsNone(cache.get("engine", "Hi"))
+        cache.set("engine", "Hi", [0.5, 0.25])
+        self.assertEqual(cache.get("engine", "Hi").tolist(), [0.5, 0.25])
+
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["memory_hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_memory_tier_is_lru_bounded(self):
+        cache = EmbeddingCache(memory_entries=2)
+        cache.set("engine", "a", [1.0])
+        cache.set("engine", "b", [2.0])
+        cache.get("engine", "a")
+        cache.set("engine", "c", [3.0])
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("engine", "b"))
+        self.assertEqual(cache.get("engine", "a").tolist(), [1.0])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_disk_tier_persists_across_instances(self):
+        cache = EmbeddingCache(self.path)
+        cache.set("engine", "Hi", [0.5, 0.25])
+        cache.close()
+
+        reopened = EmbeddingCache(self.path)
+        self.assertEqual(len(reopened), 1)
+        self.assertEqual(reopened.get("engine", "Hi").tolist(), [0.5, 0.25])
+        self.assertEqual(reopened.stats()["memory_hits"], 0)
+        reopened.close()
+
+    def test_disk_tier_evicts_least_recently_used(self):
+        cache = EmbeddingCache(self.path, max_entries=2, memory_entries=0)
+        cache.set("engine", "a", [1.0])
+        cache.set("engine", "b", [2.0])
+        cache.get("engine", "a")
+        cache.set("engine", "c", [3.0])
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("engine", "b"))
+        self.assertEqual(cache.get("engine", "a").tolist(), [1.0])
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache.close()
+
+    def test_disk_hits_do_not_write_until_flushed(self):
+        cache = EmbeddingCache(self.path, memory_entries=0)
+        cache.set("engine", "a", [1.0])
+        changes = cache._connection.total_changes
+        self.assertEqual(cache.get("engine", "a").tolist(), [1.0])
+        self.assertEqual(cache._connection.total_changes, changes)
+        cache.flush()
+        self.assertEqual(cache._connection.total_changes, changes + 1)
+        cache.close()
+
+    @patch("chatbot_library.utils.message.Message.call_with_rate_limit_retry")
+    def test_message_embeddings_use_cache(self, mock_call_with_rate_limit_retry):
+        mock_call_with_rate_limit_retry.return_value = {
+            "data": [{"embedding": [0.5, 0.25, 0.125]}]
+        }
+        set_embedding_cache(EmbeddingCache())
+        self.assertIsNotNone(get_embedding_cache())
+
+        msg = Message("system", "You are a helpful assistant.")
+        self.assertEqual(msg.embedding.tolist(), [0.5, 0.25, 0.125])
+        msg.semantic_similarity("You are a helpful assistant.")
+        Message("system", "You are a helpful assistant.").embedding
+
+        mock_call_with_rate_limit_retry.assert_called_once()
+
+    @patch("chatbot_library.utils.message.Message.call_with_rate_limit_retry")
+    def test_batcher_only_sends_uncached_content(self, mock_call_with_rate_limit_retry):
+        mock_call_with_rate_limit_retry.return_value = {
+            "data": [{"index": 0, "embedding": [2.0]}]
+        }
+        cache = EmbeddingCache()
+        cache.set("text-embedding-ada-002", "Cached", [1.0])
+        set_embedding_cache(cache)
+
+        messages = [Message("user", "Cached"), Message("user", "New")]
+        batcher = EmbeddingBatcher()
+        batcher.add_all(messages)
+        self.assertEqual(batcher.flush(), 2)
+
+        mock_call_with_rate_limit_retry.assert_called_once()
+        self.assertEqual(mock_call_with_rate_limit_retry.call_args[1]["input"], ["New"])
+        self.assertEqual([msg.embedding.tolist() for msg in messages], [[1.0], [2.0]])
+        self.assertEqual(cache.get("text-embedding-ada-002", "New").tolist(), [2.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+from unittest.mock import patch
+
+from chatbot_library.utils.embedding_index import MAX_BASE_DEPTH, EmbeddingIndex
+from chatbot_library.utils.message import Message
+
+
+class TestEmbeddingIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = EmbeddingIndex(initial_capacity=2)
+        self.north = Message("user", "north", embedding=[0.0, 2.0])
+        self.east = Message("user", "east", embedding=[3.0, 0.0])
+        self.north_east = Message("user", "north east", embedding=[1.0, 1.0])
+
+    def test_search_ranks_by_cosine_similarity(self):
+        self.index.add_all([self.north, self.east, self.north_east])
+        results = self.index.search([0.1, 1.0], k=2)
+
+        self.assertEqual([msg for msg, _ in results], [self.north, self.north_east])
+        self.assertAlmostEqual(results[0][1], 0.995, places=3)
+
+    def test_k_larger_than_index(self):
+        self.index.add_all([self.north, self.east])
+        self.assertEqual(len(self.index.search([1.0, 0.0], k=10)), 2)
+        self.assertEqual(EmbeddingIndex().search([1.0, 0.0]), [])
+
+    def test_removed_messages_are_not_returned(self):
+        self.index.add_all([self.north, self.east, self.north_east])
+        self.index.remove(self.north)
+
+        results = self.index.search([0.0, 1.0], k=3)
+        self.assertEqual([msg for msg, _ in results], [self.north_east, self.east])
+        self.assertEqual(len(self.index), 2)
+
+    def test_compaction_keeps_remaining_rows(self):
+        messages = [
+            Message("user", str(i), embedding=[1.0, float(i)]) for i in range(10)
+        ]
+        self.index.add_all(messages)
+        for message in messages[:8]:
+            self.index.remove(message)
+
+        results = self.index.search([0.0, 1.0], k=5)
+        self.assertEqual([msg for msg, _ in results], [messages[9], messages[8]])
+
+    @patch("chatbot_library.utils.message.Message.call_with_rate_limit_retry")
+    def test_pending_messages_are_embedded_in_one_batch(
+        self, mock_call_with_rate_limit_retry
+    ):
+        mock_call_with_rate_limit_retry.return_value = {
+            "data": [
+                {"index": 0, "embedding": [1.0, 0.0]},
+                {"index": 1, "embedding": [0.0, 1.0]},
+            ]
+        }
+        first, second = Message("user", "first"), Message("user", "second")
+        self.index.add_all([first, second])
+        mock_call_with_rate_limit_retry.assert_not_called()
+
+        results = self.index.search([0.0, 1.0], k=1)
+        self.assertEqual(results[0][0], second)
+        mock_call_with_rate_limit_retry.assert_called_once()
+
+    def test_removing_pending_message(self):
+        pending = Message("user", "pending")
+        self.index.add(pending)
+        self.index.remove(pending)
+        self.assertNotIn(pending, self.index)
+        self.assertEqual(self.index.search([1.0, 0.0]), [])
+
+    def test_fork_shares_rows_until_either_side_changes(self):
+        self.index.add_all([self.north, self.east])
+        fork = self.index.fork()
+        fork.add(self.north_east)
+        fork.remove(self.north)
+
+        self.assertEqual(
+            [msg for msg, _ in fork.search([0.0, 1.0], k=3)],
+            [self.north_east, self.east],
+        )
+        self.assertEqual(
+            [msg for msg, _ in self.index.search([0.0, 1.0], k=3)],
+            [self.north, self.east],
+        )
+        self.assertEqual(len(fork), 2)
+        self.assertEqual(len(self.index), 2)
+        self.assertNotIn(self.north, fork)
+        self.assertIn(self.north, self.index)
+        self.assertEqual(fork.nbytes, EmbeddingIndex(2).nbytes + 2 * 2 * 4 + 2)
+        self.assertEqual(
+            list(fork.similarities([0.0, 1.0], [self.north, self.north_east])),
+            [0.0, self.north_east.embedding_vector()[1] / 2**0.5],
+        )
+
+        fork.add(self.north)
+        self.assertEqual(len(fork), 3)
+        self.assertIs(fork.search([0.0, 1.0], k=1)[0][0], self.north)
+
+    def test_fork_flattens_once_most_shared_rows_are_removed(self):
+        messages = [
+            Message("user", str(i), embedding=[1.0, float(i)]) for i in range(200)
+        ]
+        self.index.add_all(messages)
+        fork = self.index.fork().fork()
+        for message in messages[:150]:
+            fork.remove(message)
+
+        self.assertIsNone(fork._base)
+        self.assertEqual(len(fork), 50)
+        self.assertEqual(fork.search([0.0, 1.0], k=1)[0][0], messages[-1])
+        self.assertEqual(len(self.index), 200)
+
+    def test_forking_repeatedly_keeps_the_base_chain_short(self):
+        self.index.add(self.north)
+        forks = [self.index.fork() for _ in range(20)]
+        self.assertTrue(all(fork._base is self.index._base for fork in forks))
+        self.assertEqual(self.index._depth(), 1)
+
+        messages = [
+            Message("user", str(i), embedding=[1.0, float(i)]) for i in range(50)
+        ]
+        for message in messages:
+            self.index.add(message)
+            forks.append(self.index.fork())
+
+        self.assertLessEqual(self.index._depth(), MAX_BASE_DEPTH)
+        self.assertLessEqual(max(fork._depth() for fork in forks), MAX_BASE_DEPTH)
+        self.assertEqual(len(self.index), 51)
+        self.assertEqual(len(forks[-1]), 51)
+        self.assertEqual(len(forks[20]), 2)
+        self.assertIs(forks[-1].search([1.0, 49.0], k=1)[0][0], messages[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
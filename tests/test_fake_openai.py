@@ -0,0 +1,75 @@
+import asyncio
+import time
+import unittest
+
+import openai
+
+from benchmarks.fake_openai import FakeEncoding, FakeOpenAI
+from chatbot_library.agents.smart_agent import SmartAgent
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.message import Message
+from chatbot_library.utils.tokens import get_token_params
+
+
+class TestFakeOpenAI(unittest.TestCase):
+    def test_embeddings_are_deterministic_unit_vectors(self):
+        backend = FakeOpenAI(embedding_dim=16)
+        first = backend.embed("Hello")
+        self.assertEqual(first, FakeOpenAI(embedding_dim=16).embed("Hello"))
+        self.assertNotEqual(first, backend.embed("Goodbye"))
+        self.assertAlmostEqual(sum(x * x for x in first), 1.0, places=5)
+
+    def test_installed_routes_library_calls(self):
+        backend = FakeOpenAI(embedding_dim=8, reply_words=3)
+        with backend.installed(tokenizer=True):
+            agent = SmartAgent(ConversationManager())
+            self.assertEqual(agent.get_response("one two"), "one two one")
+            msg = Message("user", "Hello")
+            self.assertEqual(len(msg.embedding), 8)
+        self.assertEqual(backend.num_chat_calls, 1)
+        self.assertEqual(backend.num_embedding_calls, 1)
+        self.assertIsNot(openai.ChatCompletion.create, backend.chat_create)
+
+    def test_streaming_and_async_responses(self):
+        backend = FakeOpenAI(reply_words=4)
+        messages = [{"role": "user", "content": "a b"}]
+        chunks = backend.chat_create(messages, stream=True)
+        streamed = "".join(c["choices"][0]["delta"]["content"] for c in chunks)
+        self.assertEqual(streamed, "a b a b")
+
+        response = asyncio.run(backend.chat_acreate(messages))
+        self.assertEqual(response["choices"][0]["message"]["content"], "a b a b")
+
+    def test_latency_is_applied(self):
+        backend = FakeOpenAI(latency=0.05, jitter=0.01)
+        start = time.perf_counter()
+        backend.embedding_create(input=["x"])
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+
+    def test_injected_delays_and_request_timeout(self):
+        backend = FakeOpenAI(latency=0.0)
+        backend.inject_delays(0.2)
+        messages = [{"role": "user", "content": "a"}]
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            backend.chat_create(messages, request_timeout=0.05)
+        self.assertLess(time.perf_counter() - start, 0.15)
+        self.assertEqual(backend.delay(), 0.0)
+
+    def test_slow_fraction(self):
+        backend = FakeOpenAI(latency=0.1, slow_fraction=0.5, slow_latency=1.0)
+        delays = [backend.delay() for _ in range(100)]
+        self.assertEqual(set(delays), {0.1, 1.1})
+
+    def test_fake_encoding_round_trips(self):
+        encoding = FakeEncoding()
+        text = "Hello, world!  How are you?"
+        token_ids = encoding.encode(text)
+        self.assertEqual(len(token_ids), 8)
+        self.assertEqual(encoding.decode(token_ids), text)
+
+    def test_fake_tokenizer_is_removed_afterwards(self):
+        with FakeOpenAI().installed(tokenizer=True):
+            encoding = get_token_params()[0]
+            self.assertIsInstance(encoding, FakeEncoding)
+        self.assertIsNot(get_token_params()[0], encoding)
@@ -0,0 +1,250 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from benchmarks.fake_openai import FakeOpenAI
+from chatbot_library.agents.smart_agent import SmartAgent
+from chatbot_library.utils.async_conversation_manager import AsyncConversationManager
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.deadline import (
+    ChatCancelledError,
+    ChatTimeoutError,
+    Deadline,
+)
+from chatbot_library.utils import hedging
+from chatbot_library.utils.hedging import (
+    LatencyTracker,
+    acall_with_deadline,
+    call_with_deadline,
+    get_latency_tracker,
+    num_abandoned,
+)
+
+
+class TestDeadline(unittest.TestCase):
+    def test_remaining_and_expiry(self):
+        now = [100.0]
+        deadline = Deadline(5.0, clock=lambda: now[0])
+        self.assertEqual(deadline.remaining(), 5.0)
+        deadline.check()
+        now[0] = 106.0
+        self.assertEqual(deadline.remaining(), 0.0)
+        self.assertTrue(deadline.expired)
+        with self.assertRaises(ChatTimeoutError):
+            deadline.check()
+
+    def test_cancel_and_of(self):
+        deadline = Deadline()
+        self.assertIsNone(deadline.remaining())
+        self.assertIs(Deadline.of(deadline), deadline)
+        self.assertIsNone(Deadline.of(None))
+        deadline.cancel()
+        with self.assertRaises(ChatCancelledError):
+            deadline.check()
+
+
+class TestLatencyTracker(unittest.TestCase):
+    def test_quantile_needs_min_samples(self):
+        tracker = LatencyTracker(window=100, min_samples=10)
+        for i in range(9):
+            tracker.record(i)
+        self.assertIsNone(tracker.quantile(0.95))
+        for i in range(9, 100):
+            tracker.record(i)
+        self.assertEqual(tracker.quantile(0.95), 95)
+        self.assertEqual(tracker.quantile(1.0), 99)
+
+    def test_window_keeps_recent_latencies(self):
+        tracker = LatencyTracker(window=10, min_samples=1)
+        for i in range(20):
+            tracker.record(i)
+        self.assertEqual(len(tracker), 10)
+        self.assertEqual(tracker.quantile(0.0), 10)
+
+
+class TestCallWithDeadline(unittest.TestCase):
+    def test_times_out(self):
+        start = time.perf_counter()
+        with self.assertRaises(ChatTimeoutError):
+            call_with_deadline(lambda: time.sleep(1.0), Deadline(0.1))
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_cancel_from_another_thread(self):
+        deadline = Deadline()
+        threading.Timer(0.1, deadline.cancel).start()
+        with self.assertRaises(ChatCancelledError):
+            call_with_deadline(lambda: time.sleep(1.0), deadline)
+
+    def test_hedged_call_returns_first_result(self):
+        delays = iter([1.0, 0.0])
+
+        def func():
+            delay = next(delays)
+            time.sleep(delay)
+            return delay
+
+        start = time.perf_counter()
+        self.assertEqual(call_with_deadline(func, Deadline(2.0), hedge_delay=0.05), 0.0)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_abandoned_calls_are_counted_until_they_finish(self):
+        with self.assertRaises(ChatTimeoutError):
+            call_with_deadline(lambda: time.sleep(0.3), Deadline(0.05))
+        self.assertGreaterEqual(num_abandoned(), 1)
+        # Other tests' abandoned calls sleep for at most a second.
+        stop = time.monotonic() + 2.0
+        while num_abandoned() and time.monotonic() < stop:
+            time.sleep(0.05)
+        self.assertEqual(num_abandoned(), 0)
+
+    def test_no_hedging_while_too_many_calls_are_abandoned(self):
+        calls = []
+
+        def func():
+            calls.append(None)
+            time.sleep(0.2)
+            return len(calls)
+
+        with patch.object(hedging, "MAX_ABANDONED", 0):
+            result = call_with_deadline(func, Deadline(1.0), hedge_delay=0.01)
+        self.assertEqual(result, 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_errors_are_raised_when_every_call_fails(self):
+        def func():
+            raise ValueError("bad request")
+
+        with self.assertRaises(ValueError):
+            call_with_deadline(func, Deadline(1.0), hedge_delay=0.01)
+
+
+class TestDeadlinesAndHedging(unittest.TestCase):
+    def setUp(self):
+        self.tracker = get_latency_tracker("gpt-3.5-turbo")
+        self.tracker.clear()
+
+    def tearDown(self):
+        self.tracker.clear()
+
+    def test_get_chatbot_response_times_out(self):
+        backend = FakeOpenAI(latency=1.0)
+        with backend.installed(tokenizer=True):
+            conversation_manager = ConversationManager()
+            conversation_manager.request_timeout = 0.1
+            conversation_manager.append_user_message("Hello")
+            start = time.perf_counter()
+            with self.assertRaises(ChatTimeoutError):
+                conversation_manager.get_chatbot_response()
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(conversation_manager.chat_log[-1].role, "user")
+
+    def test_deadline_propagates_through_agents(self):
+        backend = FakeOpenAI(latency=1.0)
+        with backend.installed(tokenizer=True):
+            agent = SmartAgent(ConversationManager())
+            with self.assertRaises(ChatTimeoutError):
+                agent.get_response("Hello", deadline=0.1)
+            with self.assertRaises(ChatTimeoutError):
+                asyncio.run(agent.aget_response("Hello", deadline=0.1))
+
+    def test_hedged_request_cuts_slow_responses(self):
+        for _ in range(self.tracker.min_samples):
+            self.tracker.record(0.05)
+        backend = FakeOpenAI(reply_words=2)
+        backend.inject_delays(1.0, 0.0)
+        with backend.installed(tokenizer=True):
+            conversation_manager = ConversationManager()
+            conversation_manager.hedge = True
+            conversation_manager.append_user_message("Hello there")
+            start = time.perf_counter()
+            response = conversation_manager.get_chatbot_response()
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(response, "Hello there")
+
+    def test_stream_times_out_between_chunks(self):
+        backend = FakeOpenAI(reply_words=3)
+        with backend.installed(tokenizer=True):
+            conversation_manager = ConversationManager()
+            conversation_manager.append_user_message("Hello")
+            deadline = Deadline(0.2)
+            stream = conversation_manager.stream_chatbot_response(deadline)
+            self.assertEqual(next(stream), "Hello")
+            time.sleep(0.25)
+            with self.assertRaises(ChatTimeoutError):
+                list(stream)
+        self.assertEqual(conversation_manager.chat_log[-1].role, "user")
+
+    def test_no_hedging_until_latencies_are_known(self):
+        backend = FakeOpenAI(latency=0.05)
+        with backend.installed(tokenizer=True):
+            conversation_manager = ConversationManager()
+            conversation_manager.hedge = True
+            conversation_manager.append_user_message("Hello")
+            conversation_manager.get_chatbot_response()
+        self.assertEqual(backend.num_chat_calls, 1)
+        self.assertEqual(len(self.tracker), 1)
+
+
+class TestAsyncDeadlinesAndHedging(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tracker = get_latency_tracker("gpt-3.5-turbo")
+        self.tracker.clear()
+        self.backend = FakeOpenAI(reply_words=2)
+        self.installed = self.backend.installed(tokenizer=True)
+        self.installed.__enter__()
+        self.conversation_manager = AsyncConversationManager()
+        self.conversation_manager.append_user_message("Hello there")
+
+    def tearDown(self):
+        self.installed.__exit__(None, None, None)
+        self.tracker.clear()
+
+    async def test_aget_chatbot_response_times_out(self):
+        self.backend.latency = 1.0
+        with self.assertRaises(ChatTimeoutError):
+            await self.conversation_manager.aget_chatbot_response(deadline=0.1)
+
+    async def test_astream_with_deadline(self):
+        stream = self.conversation_manager.astream_chatbot_response(deadline=1.0)
+        deltas = [delta async for delta in stream]
+        self.assertEqual("".join(deltas), "Hello there")
+        self.assertEqual(self.conversation_manager.chat_log[-1].content, "Hello there")
+
+    async def test_hedged_request_cancels_the_slow_one(self):
+        for _ in range(self.tracker.min_samples):
+            self.tracker.record(0.05)
+        self.backend.inject_delays(0.3, 0.0)
+        self.conversation_manager.hedge = True
+        response = await self.conversation_manager.aget_chatbot_response()
+        self.assertEqual(response, "Hello there")
+        await asyncio.sleep(0.4)
+        self.assertEqual(self.backend.num_chat_calls, 1)
+
+    async def test_cancelling_the_task_cancels_the_request(self):
+        self.backend.latency = 0.2
+        task = asyncio.create_task(
+            self.conversation_manager.aget_chatbot_response(deadline=5.0)
+        )
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.3)
+        self.assertEqual(self.backend.num_chat_calls, 0)
+
+    async def test_acall_with_deadline_hedges(self):
+        delays = iter([1.0, 0.0])
+
+        async def func():
+            delay = next(delays)
+            await asyncio.sleep(delay)
+            return delay
+
+        result = await acall_with_deadline(func, Deadline(2.0), hedge_delay=0.05)
+        self.assertEqual(result, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
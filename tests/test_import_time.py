@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED_MODULES = ["sklearn", "bs4", "googleapiclient", "requests"]
+# The package itself imports nothing heavy; its modules are imported one by one.
+PACKAGE_DEFERRED_MODULES = DEFERRED_MODULES + ["numpy", "openai", "tiktoken"]
+# About 1.5 times the measured import time of the slowest module.
+BUDGET_MS = 1500
+
+
+class TestImportTime(unittest.TestCase):
+    def test_agents_do_not_import_web_dependencies(self):
+        code = (
+            "import sys\n"
+            "import chatbot_library.agents.smart_agent\n"
+            f"print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=ROOT,
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+    def test_package_does_not_import_heavy_dependencies(self):
+        code = (
+            "import sys\n"
+            "import chatbot_library\n"
+            f"print(','.join(m for m in {PACKAGE_DEFERRED_MODULES!r} if m in sys.modules))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=ROOT,
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+    def test_import_time_is_within_budget(self):
+        result = subprocess.run(
+            [
+                sys.executable,
+                "benchmarks/import_time.py",
+                "--budget-ms",
+                str(BUDGET_MS),
+            ],
+            capture_output=True,
+            text=True,
+            cwd=ROOT,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+
+from chatbot_library.utils import instrumentation as instrumentation_module
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.instrumentation import (
+    Instrumentation,
+    increment,
+    set_instrumentation,
+    timed,
+    timer,
+)
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.instrumentation = Instrumentation()
+        set_instrumentation(self.instrumentation)
+
+    def tearDown(self):
+        set_instrumentation(None)
+
+    def test_timers_and_counters_are_recorded(self):
+        @timed("work")
+        def work():
+            return 42
+
+        self.assertEqual(work(), 42)
+        with timer("block"):
+            pass
+        increment("things", 2)
+        increment("things")
+
+        snapshot = self.instrumentation.snapshot()
+        self.assertEqual(snapshot["timers"]["work"]["count"], 1)
+        self.assertEqual(snapshot["timers"]["block"]["count"], 1)
+        self.assertEqual(snapshot["counters"]["things"], 3)
+
+    def test_coroutines_are_timed(self):
+        @timed("async_work")
+        async def work():
+            await asyncio.sleep(0)
+            return "done"
+
+        self.assertEqual(asyncio.run(work()), "done")
+        self.assertEqual(self.instrumentation.timers["async_work"].count, 1)
+
+    def test_failed_calls_are_still_timed(self):
+        @timed("failing")
+        def fail():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            fail()
+        self.assertEqual(self.instrumentation.timers["failing"].count, 1)
+
+    def test_disabled_instrumentation_records_nothing(self):
+        set_instrumentation(None)
+
+        @timed("work")
+        def work():
+            return 1
+
+        work()
+        increment("things")
+        self.assertIs(timer("block"), instrumentation_module._disabled_timer)
+        self.assertEqual(self.instrumentation.snapshot()["timers"], {})
+        self.assertEqual(self.instrumentation.snapshot()["counters"], {})
+
+    def test_callbacks_receive_every_observation(self):
+        events = []
+        set_instrumentation(
+            Instrumentation(callbacks=[lambda *event: events.append(event)])
+        )
+        with timer("block"):
+            pass
+        increment("things", 2)
+
+        self.assertEqual(events[0][:2], ("timer", "block"))
+        self.assertEqual(events[1], ("counter", "things", 2))
+
+    def test_prometheus_output(self):
+        self.instrumentation.observe("chat", 0.2)
+        self.instrumentation.observe("chat", 20.0)
+        self.instrumentation.increment("trimmed_messages", 3)
+        text = self.instrumentation.to_prometheus()
+
+        self.assertIn("# TYPE chatbot_chat_seconds histogram", text)
+        self.assertIn('chatbot_chat_seconds_bucket{le="0.25"} 1', text)
+        self.assertIn('chatbot_chat_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn("chatbot_chat_seconds_count 2", text)
+        self.assertIn("chatbot_trimmed_messages_total 3", text)
+
+    def test_conversation_manager_hot_paths_are_instrumented(self):
+        conversation_manager = ConversationManager()
+        conversation_manager.max_tokens = 30
+        for _ in range(5):
+            conversation_manager.append_user_message("one two three four five")
+        conversation_manager.search_for_message("two")
+
+        snapshot = self.instrumentation.snapshot()
+        self.assertIn("token_count", snapshot["timers"])
+        self.assertEqual(snapshot["timers"]["trim"]["count"], 5)
+        self.assertEqual(snapshot["timers"]["search"]["count"], 1)
+        self.assertGreater(snapshot["counters"]["trimmed_messages"], 0)
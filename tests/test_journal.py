@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.journal import ChatLogJournal, iter_journal, read_journal
+from chatbot_library.utils.message import Message
+
+
+class TestChatLogJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "chat_log.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_record_round_trip_restores_cached_values(self):
+        msg = Message("user", "Hello", embedding=[0.5, -0.25])
+        msg.num_tokens()
+        restored = Message.from_record(msg.to_record())
+
+        self.assertEqual(restored.to_dict(), msg.to_dict())
+        self.assertEqual(restored.embedding, msg.embedding)
+        with patch("chatbot_library.utils.message.num_tokens_from_message") as count:
+            self.assertEqual(restored.num_tokens(), msg.num_tokens())
+            count.assert_not_called()
+
+    def test_append_and_pop_are_replayed(self):
+        journal = ChatLogJournal(self.path)
+        messages = [Message("system", "Be nice."), Message("user", "a")]
+        for msg in messages:
+            journal.append(msg)
+        journal.pop(1)
+        journal.append(Message("user", "b"))
+        journal.close()
+
+        self.assertEqual(len(list(iter_journal(self.path))), 4)
+        self.assertEqual(
+            [msg.content for msg in read_journal(self.path)], ["Be nice.", "b"]
+        )
+
+    def test_compaction_rewrites_live_messages(self):
+        journal = ChatLogJournal(self.path, compact_every=4)
+        messages = []
+        for i in range(5):
+            messages.append(Message("user", str(i)))
+            journal.append(messages[-1])
+            journal.maybe_compact(messages)
+        for _ in range(3):
+            messages.pop(0)
+            journal.pop(0)
+        journal.maybe_compact(messages)
+        journal.close()
+
+        self.assertEqual(journal.num_lines, 2)
+        self.assertEqual([msg.content for msg in read_journal(self.path)], ["3", "4"])
+
+    def test_invalid_fsync_policy(self):
+        with self.assertRaises(ValueError):
+            ChatLogJournal(self.path, fsync="sometimes")
+
+    def test_conversation_manager_journal(self):
+        conversation_manager = ConversationManager()
+        conversation_manager.initialize_conversation("Welcome to the chatbot.")
+        conversation_manager.attach_journal(self.path, fsync="always")
+        conversation_manager.max_tokens = 40
+        for i in range(10):
+            conversation_manager.append_user_message(f"User message number {i}.")
+        conversation_manager.detach_journal()
+
+        restored = ConversationManager()
+        restored.attach_journal(self.path)
+        self.assertEqual(
+            [msg.to_dict() for msg in restored.chat_log],
+            [msg.to_dict() for msg in conversation_manager.chat_log],
+        )
+        self.assertEqual(restored.total_tokens(), conversation_manager.total_tokens())
+
+        restored.append_bot_message("Hello")
+        restored.detach_journal()
+        self.assertEqual(read_journal(self.path)[-1].content, "Hello")
+
+    def test_torn_last_line_is_skipped_and_truncated(self):
+        conversation_manager = ConversationManager()
+        conversation_manager.attach_journal(self.path)
+        conversation_manager.append_user_message("Hello")
+        conversation_manager.detach_journal()
+        with open(self.path, "a") as f:
+            f.write('{"role": "assistant", "cont')
+
+        self.assertEqual([msg.content for msg in read_journal(self.path)], ["Hello"])
+        restored = ConversationManager()
+        restored.attach_journal(self.path)
+        restored.append_bot_message("Hi")
+        restored.detach_journal()
+        self.assertEqual(
+            [msg.content for msg in read_journal(self.path)], ["Hello", "Hi"]
+        )
+
+    def test_corrupt_line_in_the_middle_raises(self):
+        with open(self.path, "w") as f:
+            f.write('{"role": "user", "content": "a"}\n{"role": \n')
+            f.write('{"role": "user", "content": "b"}\n')
+        with self.assertRaises(ValueError):
+            read_journal(self.path)
+
+    def test_embeddings_computed_later_are_recorded(self):
+        conversation_manager = ConversationManager()
+        conversation_manager.attach_journal(self.path)
+        conversation_manager.append_user_message("Hello")
+        conversation_manager.append_bot_message("Hi")
+        for i, msg in enumerate(conversation_manager.chat_log):
+            msg.embedding = [float(i), 1.0]
+        conversation_manager.detach_journal()
+
+        restored = read_journal(self.path)
+        self.assertTrue(all(msg.has_embedding() for msg in restored))
+        self.assertEqual(list(restored[1].embedding), [1.0, 1.0])
+
+    def test_save_and_load_jsonl(self):
+        conversation_manager = ConversationManager()
+        conversation_manager.chat_log = [
+            Message("user", "Hi", embedding=[1.0, 0.0]),
+            Message("assistant", "Hello"),
+        ]
+        conversation_manager.save_chat_log(self.path)
+
+        restored = ConversationManager()
+        restored.load_chat_log(self.path)
+        self.assertEqual(len(restored.chat_log), 2)
+        self.assertTrue(restored.chat_log[0].has_embedding())
+        self.assertFalse(restored.chat_log[1].has_embedding())
+
+
+if __name__ == "__main__":
+    unittest.main()
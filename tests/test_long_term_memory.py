@@ -0,0 +1,154 @@
+import time
+import unittest
+
+import numpy as np
+
+from chatbot_library.utils.memory import IVFIndex, LongTermMemory
+from chatbot_library.utils.message import Message
+
+
+def unit_vectors(num_vectors, dim, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(num_vectors, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+class TestIVFIndex(unittest.TestCase):
+    def test_exhaustive_search_before_training(self):
+        index = IVFIndex(nlist=4, train_size=100)
+        vectors = unit_vectors(10, 8)
+        for i, vector in enumerate(vectors):
+            index.add(vector, i)
+
+        ids, scores = index.search(vectors[3], 3)
+        self.assertIsNone(index.centroids)
+        self.assertEqual(ids[0], 3)
+        self.assertAlmostEqual(scores[0], 1.0, places=5)
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_trained_index_finds_exact_matches(self):
+        index = IVFIndex(nlist=16, nprobe=4, train_size=500)
+        vectors = unit_vectors(2000, 32)
+        for i, vector in enumerate(vectors):
+            index.add(vector, i)
+        index.wait_for_training()
+
+        self.assertIsNotNone(index.centroids)
+        self.assertEqual(len(index), 2000)
+        found = sum(index.search(vectors[i], 1)[0][0] == i for i in range(0, 2000, 50))
+        self.assertEqual(found, 40)
+
+    def test_recall_against_exhaustive_search(self):
+        vectors = unit_vectors(5000, 16)
+        index = IVFIndex(nlist=32, nprobe=8, train_size=5000)
+        for i, vector in enumerate(vectors):
+            index.add(vector, i)
+        index.wait_for_training()
+
+        queries = unit_vectors(50, 16, seed=1)
+        recall = 0
+        for query in queries:
+            exact = set(np.argsort(-(vectors @ query))[:10])
+            recall += len(exact & set(index.search(query, 10)[0])) / 10
+        self.assertGreater(recall / len(queries), 0.6)
+
+    def test_search_is_fast_on_a_large_index(self):
+        vectors = unit_vectors(200_000, 64)
+        index = IVFIndex(nlist=512, nprobe=4, train_size=20_000)
+        for i, vector in enumerate(vectors):
+            index.add(vector, i)
+        index.wait_for_training()
+
+        queries = unit_vectors(100, 64, seed=1)
+        start = time.perf_counter()
+        for query in queries:
+            index.search(query, 5)
+        self.assertLess((time.perf_counter() - start) / len(queries), 0.01)
+
+    def test_training_does_not_block_add(self):
+        vectors = unit_vectors(4000, 64)
+        index = IVFIndex(nlist=64, train_size=2000)
+        slowest = 0.0
+        for i, vector in enumerate(vectors):
+            start = time.perf_counter()
+            index.add(vector, i)
+            slowest = max(slowest, time.perf_counter() - start)
+            if i == 2500:
+                # Vectors are searchable while the index is being trained.
+                self.assertEqual(index.search(vectors[2400], 1)[0][0], 2400)
+        index.wait_for_training()
+
+        self.assertLess(slowest, 0.05)
+        self.assertIsNotNone(index.centroids)
+        self.assertEqual(len(index), 4000)
+        found = sum(index.search(vectors[i], 1)[0][0] == i for i in range(0, 4000, 97))
+        self.assertEqual(found, len(range(0, 4000, 97)))
+
+    def test_index_is_retrained_with_more_lists_as_it_grows(self):
+        vectors = unit_vectors(4000, 16)
+        index = IVFIndex(nlist=1024, train_size=100, retrain_factor=4, background=False)
+        for i, vector in enumerate(vectors[:100]):
+            index.add(vector, i)
+        first_nlist = len(index.centroids)
+        for i, vector in enumerate(vectors[100:], 100):
+            index.add(vector, i)
+
+        self.assertEqual(first_nlist, 40)
+        self.assertEqual(len(index.centroids), int(4 * np.sqrt(1600)))
+        self.assertEqual(len(index), 4000)
+
+    def test_probes_scan_at_most_max_probe_rows(self):
+        vectors = unit_vectors(1000, 8)
+        index = IVFIndex(nlist=1, nprobe=1, train_size=10, max_probe_rows=100)
+        for i, vector in enumerate(vectors):
+            index.add(vector, i)
+        index.wait_for_training()
+
+        ids, _ = index.search(vectors[0], 1000)
+        self.assertEqual(sorted(ids.tolist()), list(range(900, 1000)))
+
+    def test_old_vectors_in_a_long_list_are_still_found(self):
+        vectors = unit_vectors(10000, 8)
+        index = IVFIndex(nlist=1, nprobe=1, train_size=10)
+        for i, vector in enumerate(vectors):
+            index.add(vector, i)
+        index.wait_for_training()
+
+        ids, _ = index.search(vectors[0], 1)
+        self.assertEqual(ids.tolist(), [0])
+
+    def test_empty_index(self):
+        ids, scores = IVFIndex().search(np.ones(4, dtype=np.float32), 3)
+        self.assertEqual(len(ids), 0)
+
+
+class TestLongTermMemory(unittest.TestCase):
+    def test_search_returns_the_most_similar_messages(self):
+        memory = LongTermMemory()
+        for content, embedding in [
+            ("cats", [1.0, 0.0, 0.0]),
+            ("dogs", [0.0, 1.0, 0.0]),
+            ("fish", [0.0, 0.0, 1.0]),
+        ]:
+            message = Message("user", content)
+            message.embedding = embedding
+            memory.add(message)
+
+        results = memory.search([0.1, 0.9, 0.0], k=2)
+        self.assertEqual([message.content for message, _ in results], ["dogs", "cats"])
+        self.assertAlmostEqual(results[0][1], 0.9 / np.sqrt(0.82), places=5)
+
+    def test_search_returns_the_stored_messages(self):
+        memory = LongTermMemory()
+        message = Message("user", "cats")
+        message.embedding = [1.0, 0.0]
+        memory.add(message)
+
+        stored, _ = memory.search([1.0, 0.0])[0]
+        self.assertIs(stored, message)
+        self.assertTrue(stored.has_embedding())
+
+    def test_messages_without_embeddings_wait_for_sync(self):
+        memory = LongTermMemory()
+        memory.add(Message("user", "cats"))
+        self.assertEqual(len(memory), 1)
+        self.assertEqual(memory.search([1.0, 0.0]), [])
@@ -1,6 +1,8 @@
+import sys
 import unittest
+from array import array
 from unittest.mock import patch
-from chatbot_library.utils.message import Message
+from chatbot_library.utils.message import EmbeddingBatcher, Message
 
 
 class TestMessage(unittest.TestCase):
@@ -38,6 +40,77 @@ class TestMessage(unittest.TestCase):
         similarity = msg1.semantic_similarity(msg2_content)
         self.assertIsInstance(similarity, float)
 
+    @patch("chatbot_library.utils.message.Message.call_with_rate_limit_retry")
+    def test_embedding_is_lazy(self, mock_call_with_rate_limit_retry):
+        mock_call_with_rate_limit_retry.return_value = {
+            "data": [{"embedding": [0.1, 0.2, 0.3]}]
+        }
+        msg = Message("user", "Hello, how are you?")
+        mock_call_with_rate_limit_retry.assert_not_called()
+        self.assertFalse(msg.has_embedding())
+
+        self.assertEqual(msg.embedding, array("f", [0.1, 0.2, 0.3]))
+        self.assertEqual(msg.embedding, array("f", [0.1, 0.2, 0.3]))
+        mock_call_with_rate_limit_retry.assert_called_once()
+
+    @patch("chatbot_library.utils.message.Message.call_with_rate_limit_retry")
+    def test_from_dict_does_not_embed(self, mock_call_with_rate_limit_retry):
+        Message.from_dict({"role": "user", "content": "Hello, how are you?"})
+        mock_call_with_rate_limit_retry.assert_not_called()
+
+    @patch("chatbot_library.utils.message.Message.call_with_rate_limit_retry")
+    def test_embedding_batcher(self, mock_call_with_rate_limit_retry):
+        def embed(func, input, engine):
+            return {
+                "data": [
+                    {"index": i, "embedding": [float(len(text))]}
+                    for i, text in enumerate(input)
+                ]
+            }
+
+        mock_call_with_rate_limit_retry.side_effect = embed
+        messages = [
+            Message("system", "Be brief."),
+            Message("user", "Hi"),
+            Message("assistant", "Hello there"),
+            Message("user", "Hi"),
+            Message("user", "Already embedded", embedding=[9.0]),
+        ]
+
+        batcher = EmbeddingBatcher(max_batch_size=2)
+        batcher.add_all(messages)
+        self.assertEqual(batcher.flush(), 4)
+
+        # Three distinct contents in batches of two, and the duplicate "Hi" is sent once.
+        self.assertEqual(mock_call_with_rate_limit_retry.call_count, 2)
+        self.assertEqual(
+            [msg.embedding.tolist() for msg in messages],
+            [[9.0], [2.0], [11.0], [2.0], [9.0]],
+        )
+        self.assertEqual(batcher.pending, [])
+
+    def test_embedding_is_stored_as_float32_array(self):
+        msg = Message("user", "Hello", embedding=[0.5] * 1536)
+        self.assertFalse(hasattr(msg, "__dict__"))
+        self.assertEqual(msg.embedding.typecode, "f")
+        self.assertLess(sys.getsizeof(msg.embedding), 1536 * 4 + 128)
+
+    def test_embedding_vector_shares_memory(self):
+        msg = Message("user", "Hello", embedding=[0.5, 0.25])
+        vector = msg.embedding_vector()
+        self.assertEqual(str(vector.dtype), "float32")
+        self.assertEqual(vector.tolist(), [0.5, 0.25])
+        msg.embedding[0] = 1.0
+        self.assertEqual(vector[0], 1.0)
+
+    @patch("chatbot_library.utils.message.Message.call_with_rate_limit_retry")
+    def test_semantic_similarity_value(self, mock_call_with_rate_limit_retry):
+        mock_call_with_rate_limit_retry.return_value = {
+            "data": [{"embedding": [1.0, 1.0]}]
+        }
+        msg = Message("user", "Hello", embedding=[1.0, 0.0])
+        self.assertAlmostEqual(msg.semantic_similarity("Hi"), 2**-0.5, places=6)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,167 @@
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+from openai import OpenAIError
+
+from chatbot_library.utils.deadline import Deadline
+from chatbot_library.utils.rate_limiter import (
+    RateLimiter,
+    RateLimitTimeout,
+    get_rate_limiter,
+    is_rate_limit_error,
+    set_rate_limiter,
+)
+
+
+class RateLimitError(OpenAIError):
+    def __init__(self, retry_after=None):
+        super().__init__("Rate limit reached")
+        self.headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def make_limiter(self, **kwargs):
+        return RateLimiter(clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_request_budget_spaces_out_calls(self):
+        limiter = self.make_limiter(requests_per_minute=60, tokens_per_minute=10**6)
+        limiter._requests = 1.0
+        self.assertEqual(limiter.acquire(), 0.0)
+        self.assertAlmostEqual(limiter.acquire(), 1.0)
+        self.assertAlmostEqual(limiter.acquire(), 1.0)
+        self.assertAlmostEqual(limiter.stats()["total_queued_time"], 2.0)
+
+    def test_token_budget(self):
+        limiter = self.make_limiter(requests_per_minute=10**6, tokens_per_minute=600)
+        self.assertEqual(limiter.acquire(tokens=600), 0.0)
+        self.assertAlmostEqual(limiter.acquire(tokens=100), 10.0)
+
+    def test_reservations_queue_in_arrival_order(self):
+        limiter = self.make_limiter(requests_per_minute=60, tokens_per_minute=10**6)
+        limiter._requests = 0.0
+        delays = [limiter.reserve() for _ in range(3)]
+        self.assertEqual([round(delay, 6) for delay in delays], [1.0, 2.0, 3.0])
+
+    def test_retries_with_retry_after(self):
+        limiter = self.make_limiter()
+        func = Mock(side_effect=[RateLimitError(retry_after=7), "ok"])
+        self.assertEqual(limiter.call(func, 1, key="value"), "ok")
+
+        func.assert_called_with(1, key="value")
+        self.assertEqual(self.clock.sleeps, [7.0])
+        self.assertEqual(limiter.stats()["retries"], 1)
+        self.assertEqual(limiter.stats()["rate_limited"], 1)
+
+    def test_exponential_backoff_with_jitter(self):
+        limiter = self.make_limiter(base_delay=1.0, max_delay=4.0)
+        func = Mock(side_effect=[RateLimitError()] * 4 + ["ok"])
+        self.assertEqual(limiter.call(func), "ok")
+
+        for sleep, cap in zip(self.clock.sleeps, [1.0, 2.0, 4.0, 4.0]):
+            self.assertGreaterEqual(sleep, cap / 2)
+            self.assertLessEqual(sleep, cap)
+
+    def test_gives_up_after_max_retries(self):
+        limiter = self.make_limiter(max_retries=2)
+        func = Mock(side_effect=RateLimitError())
+        with self.assertRaises(RateLimitTimeout):
+            limiter.call(func)
+        self.assertEqual(func.call_count, 3)
+
+    def test_gives_up_after_max_wait(self):
+        limiter = self.make_limiter(max_wait=5.0)
+        func = Mock(side_effect=RateLimitError(retry_after=10))
+        with self.assertRaises(RateLimitTimeout):
+            limiter.call(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_max_wait_bounds_queueing(self):
+        limiter = self.make_limiter(requests_per_minute=60, max_wait=5.0)
+        for _ in range(60):
+            limiter.reserve()
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire(max_wait=0.5)
+        self.assertEqual(self.clock.sleeps, [])
+        # The refused reservation was given back.
+        self.assertAlmostEqual(limiter.reserve(), 1.0)
+        for _ in range(5):
+            limiter.reserve()
+        func = Mock(return_value="ok")
+        with self.assertRaises(RateLimitTimeout):
+            limiter.call(func)
+        func.assert_not_called()
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_deadline_bounds_the_wait(self):
+        limiter = self.make_limiter(requests_per_minute=60)
+        for _ in range(60):
+            limiter.reserve()
+        func = Mock(return_value="ok")
+        with self.assertRaises(RateLimitTimeout):
+            limiter.call(func, deadline=Deadline(0.5, clock=self.clock))
+        func.assert_not_called()
+        self.assertEqual(
+            limiter.call(func, deadline=Deadline(5.0, clock=self.clock)), "ok"
+        )
+        self.assertAlmostEqual(self.clock.now, 1.0)
+
+    def test_no_max_wait(self):
+        for max_wait in (None, float("inf")):
+            limiter = self.make_limiter(max_wait=max_wait)
+            func = Mock(side_effect=[RateLimitError(retry_after=1000), "ok"])
+            self.assertEqual(limiter.call(func), "ok")
+
+    def test_other_errors_are_not_retried(self):
+        limiter = self.make_limiter()
+        func = Mock(side_effect=OpenAIError("Invalid request"))
+        with self.assertRaises(OpenAIError):
+            limiter.call(func)
+        self.assertFalse(is_rate_limit_error(ValueError()))
+
+    def test_backoff_pauses_other_callers(self):
+        limiter = self.make_limiter()
+        limiter.backoff(RateLimitError(retry_after=5), attempt=0, waited=0.0)
+        self.assertAlmostEqual(limiter.reserve(), 5.0)
+
+    def test_calls_are_counted_across_threads(self):
+        limiter = RateLimiter(requests_per_minute=1e9, tokens_per_minute=1e9)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: limiter.call(lambda: None), range(2000)))
+        self.assertEqual(limiter.stats()["calls"], 2000)
+
+    def test_acall(self):
+        limiter = RateLimiter()
+
+        async def func(value):
+            return value
+
+        self.assertEqual(asyncio.run(limiter.acall(func, "ok")), "ok")
+        self.assertEqual(limiter.stats()["calls"], 1)
+
+    def test_default_limiter_is_shared(self):
+        self.addCleanup(set_rate_limiter, None)
+        limiter = RateLimiter()
+        set_rate_limiter(limiter)
+        self.assertIs(get_rate_limiter(), limiter)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+from chatbot_library.utils.response_cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def request(content, system="Be nice."):
+    return [{"role": "system", "content": system}, {"role": "user", "content": content}]
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_exact_hits_require_identical_requests(self):
+        cache = ResponseCache(clock=self.clock)
+        cache.set("gpt-3.5-turbo", 1.0, request("Hi"), "Hello!")
+
+        self.assertEqual(cache.get("gpt-3.5-turbo", 1.0, request("Hi")), "Hello!")
+        self.assertIsNone(cache.get("gpt-4", 1.0, request("Hi")))
+        self.assertIsNone(cache.get("gpt-3.5-turbo", 0.5, request("Hi")))
+        self.assertIsNone(cache.get("gpt-3.5-turbo", 1.0, request("Hi", "Be rude.")))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 3)
+
+    def test_entries_expire(self):
+        cache = ResponseCache(ttl=10, clock=self.clock)
+        cache.set("m", 1.0, request("Hi"), "Hello!")
+        self.clock.now = 10
+        self.assertIsNone(cache.get("m", 1.0, request("Hi")))
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResponseCache(max_entries=2, clock=self.clock)
+        cache.set("m", 1.0, request("a"), "A")
+        cache.set("m", 1.0, request("b"), "B")
+        cache.get("m", 1.0, request("a"))
+        cache.set("m", 1.0, request("c"), "C")
+
+        self.assertEqual(cache.get("m", 1.0, request("a")), "A")
+        self.assertIsNone(cache.get("m", 1.0, request("b")))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_semantic_hits_need_similar_embeddings_and_same_context(self):
+        cache = ResponseCache(semantic_threshold=0.95, clock=self.clock)
+        cache.set("m", 1.0, request("Capital of France?"), "Paris", [1.0, 0.0])
+
+        similar = cache.get("m", 1.0, request("France's capital?"), [0.99, 0.05])
+        different = cache.get("m", 1.0, request("Capital of Spain?"), [0.6, 0.8])
+        other_context = cache.get(
+            "m", 1.0, request("France's capital?", "Be rude."), [1.0, 0.0]
+        )
+
+        self.assertEqual(similar, "Paris")
+        self.assertIsNone(different)
+        self.assertIsNone(other_context)
+        self.assertEqual(cache.stats()["semantic_hits"], 1)
+
+    def test_evicted_entries_leave_the_semantic_tier(self):
+        cache = ResponseCache(max_entries=1, semantic_threshold=0.9, clock=self.clock)
+        cache.set("m", 1.0, request("a"), "A", [1.0, 0.0])
+        cache.set("m", 1.0, request("b"), "B", [0.0, 1.0])
+
+        self.assertIsNone(cache.get("m", 1.0, request("x"), [1.0, 0.0]))
+        self.assertEqual(cache.get("m", 1.0, request("y"), [0.0, 1.0]), "B")
+
+    def test_expired_best_match_falls_back_to_a_live_one(self):
+        cache = ResponseCache(ttl=10, semantic_threshold=0.9, clock=self.clock)
+        cache.set("m", 1.0, request("a"), "A", [1.0, 0.0])
+        self.clock.now = 5
+        cache.set("m", 1.0, request("b"), "B", [0.95, 0.31])
+        self.clock.now = 12
+
+        self.assertEqual(cache.get("m", 1.0, request("x"), [1.0, 0.0]), "B")
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(len(cache), 1)
+
+    def test_semantic_tier_survives_many_replacements(self):
+        cache = ResponseCache(max_entries=8, semantic_threshold=0.99, clock=self.clock)
+        vectors = [[float(i == j) for j in range(200)] for i in range(200)]
+        for i, vector in enumerate(vectors):
+            cache.set("m", 1.0, request(str(i)), str(i), vector)
+            self.assertEqual(cache.get("m", 1.0, request("x"), vector), str(i))
+
+        self.assertIsNone(cache.get("m", 1.0, request("x"), vectors[100]))
+        self.assertEqual(len(cache), 8)
@@ -0,0 +1,134 @@
+import threading
+import time
+import unittest
+
+from chatbot_library.agents.smart_agent import SmartAgent
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.search import GoogleSearchClient, normalize_query
+
+
+class FakeRequest:
+    def __init__(self, service, query, num):
+        self.service = service
+        self.query = query
+        self.num = num
+
+    def execute(self, http=None):
+        self.service.requests.append(self.query)
+        self.service.started.set()
+        self.service.release.wait(5)
+        if self.service.error is not None:
+            raise self.service.error
+        return {
+            "items": [
+                {"title": f"{self.query} {i}", "link": f"https://example.com/{i}"}
+                for i in range(self.num)
+            ]
+        }
+
+
+class FakeService:
+    """A stand-in for the Custom Search service built from the discovery document."""
+
+    def __init__(self):
+        self.requests = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def cse(self):
+        return self
+
+    def list(self, q, cx, num):
+        return FakeRequest(self, q, num)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestGoogleSearchClient(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeService()
+        self.builds = []
+        self.clock = FakeClock()
+        self.client = GoogleSearchClient(
+            api_key="key",
+            cse_id="cse",
+            ttl=60,
+            max_entries=2,
+            service_factory=self.build,
+            http_factory=object,
+            clock=self.clock,
+        )
+
+    def build(self, api_key):
+        self.builds.append(api_key)
+        return self.service
+
+    def test_service_is_built_once(self):
+        self.client.search("cats")
+        self.client.search("dogs")
+        self.assertEqual(self.builds, ["key"])
+
+    def test_normalized_queries_share_cached_results(self):
+        first = self.client.search("Cute  Cats")
+        second = self.client.search(" cute cats ")
+        self.assertIs(first, second)
+        self.assertEqual(self.service.requests, ["cute cats"])
+        self.assertEqual(self.client.stats()["hits"], 1)
+        self.assertEqual(normalize_query("  A\tB  "), "a b")
+
+    def test_results_expire(self):
+        self.client.search("cats")
+        self.clock.now = 61
+        self.client.search("cats")
+        self.assertEqual(len(self.service.requests), 2)
+
+    def test_cache_is_bounded(self):
+        for query in ["a", "b", "c"]:
+            self.client.search(query)
+        self.client.search("a")
+        self.assertEqual(self.service.requests, ["a", "b", "c", "a"])
+        self.assertEqual(self.client.stats()["entries"], 2)
+
+    def test_concurrent_identical_queries_make_one_call(self):
+        self.service.release.clear()
+        results = []
+
+        def search():
+            results.append(self.client.search("cats"))
+
+        threads = [threading.Thread(target=search) for _ in range(5)]
+        threads[0].start()
+        self.service.started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while self.client.stats()["coalesced"] < 4:
+            time.sleep(0.001)
+        self.service.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.service.requests, ["cats"])
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_failures_are_not_cached(self):
+        self.service.error = RuntimeError("quota")
+        with self.assertRaises(RuntimeError):
+            self.client.search("cats")
+        self.service.error = None
+        self.assertEqual(len(self.client.search("cats")), 3)
+
+    def test_smart_agent_uses_the_client(self):
+        smart_agent = SmartAgent(ConversationManager(), search_client=self.client)
+        results = smart_agent.search_google("cats")
+        self.assertEqual(
+            results.splitlines()[:2], ["1. cats 0", "https://example.com/0"]
+        )
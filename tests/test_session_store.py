@@ -0,0 +1,165 @@
+import logging
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.session_store import SessionStore
+from chatbot_library.utils.text_index import TextIndex
+
+
+class TestSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = SessionStore(self.tmpdir.name, max_hot=2)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_get_returns_the_same_conversation(self):
+        conversation_manager = self.store.get("alice")
+        self.assertIs(self.store.get("alice"), conversation_manager)
+        self.assertEqual(self.store.stats()["hits"], 1)
+        self.assertEqual(self.store.stats()["creations"], 1)
+
+    def test_least_recently_used_session_is_evicted_to_disk(self):
+        self.store.get("alice").append_user_message("Hi, I'm Alice")
+        self.store.get("bob")
+        self.store.get("alice")
+        self.store.get("carol")
+
+        self.assertTrue(os.path.exists(self.store.path_for("bob")))
+        stats = self.store.stats()
+        self.assertEqual(stats["hot"], 2)
+        self.assertEqual(stats["cold"], 1)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertIn("bob", self.store)
+        self.assertEqual(len(self.store), 3)
+
+    def test_rehydrated_session_keeps_tokens_and_embeddings(self):
+        conversation_manager = self.store.get("alice")
+        conversation_manager.append_user_message("Hello there")
+        msg = conversation_manager.get_message_at(0)
+        msg.embedding = [0.5, -0.25]
+        total_tokens = conversation_manager.total_tokens()
+        self.store.evict("alice")
+
+        with patch("chatbot_library.utils.message.num_tokens_from_message") as count:
+            restored = self.store.get("alice")
+            self.assertEqual(restored.total_tokens(), total_tokens)
+            count.assert_not_called()
+        self.assertIsNot(restored, conversation_manager)
+        self.assertEqual(restored.get_message_at(0).content, "Hello there")
+        self.assertEqual(restored.get_message_at(0).embedding.tolist(), [0.5, -0.25])
+        self.assertEqual(self.store.stats()["rehydrations"], 1)
+
+    def test_journaled_sessions_are_written_as_they_change(self):
+        store = SessionStore(self.tmpdir.name, max_hot=1, journal=True)
+        store.get("alice").append_user_message("Hi")
+        with open(store.path_for("alice")) as f:
+            self.assertIn("Hi", f.read())
+
+        store.get("bob")
+        self.assertEqual(store.stats()["hot"], 1)
+        self.assertEqual([msg.content for msg in store.get("alice").chat_log], ["Hi"])
+        store.close()
+
+    def test_evicted_journals_are_compacted(self):
+        store = SessionStore(self.tmpdir.name, max_hot=1, journal=True)
+        conversation_manager = store.get("alice")
+        for content in ["One", "Two", "Three"]:
+            conversation_manager.append_user_message(content)
+        conversation_manager.pop_last_message()
+        conversation_manager.get_message_at(0).embedding = [0.5, -0.25]
+        store.get("bob")
+
+        with open(store.path_for("alice")) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        restored = store.get("alice")
+        self.assertEqual([msg.content for msg in restored.chat_log], ["One", "Two"])
+        self.assertEqual(restored.get_message_at(0).embedding.tolist(), [0.5, -0.25])
+        store.close()
+
+    def test_checked_out_sessions_are_not_evicted(self):
+        with self.store.checkout("alice") as alice:
+            self.store.get("bob")
+            self.store.get("carol")
+            self.store.get("dave")
+            self.assertIs(self.store.get("alice"), alice)
+            alice.append_user_message("Still here")
+        self.assertEqual(self.store.stats()["hot"], 2)
+
+        self.store.get("erin")
+        self.store.get("frank")
+        restored = self.store.get("alice")
+        self.assertIsNot(restored, alice)
+        self.assertEqual([msg.content for msg in restored.chat_log], ["Still here"])
+
+    def test_cold_sessions_are_counted_without_listing_the_directory(self):
+        for session_id in ["alice", "bob", "carol", "dave"]:
+            self.store.get(session_id)
+        self.store.delete("alice")
+        self.store.delete("dave")
+        with patch("os.listdir") as listdir:
+            self.assertEqual(self.store.stats()["cold"], 1)
+            self.assertEqual(len(self.store), 2)
+            listdir.assert_not_called()
+        self.store.get("bob")
+        self.assertEqual(self.store.num_cold(), 0)
+
+        self.store.close()
+        self.assertEqual(SessionStore(self.tmpdir.name).num_cold(), 2)
+
+    def test_unusual_session_ids_map_to_distinct_files(self):
+        self.assertNotEqual(self.store.path_for("a/b"), self.store.path_for("a_b"))
+        self.assertEqual(os.path.dirname(self.store.path_for("../a")), self.tmpdir.name)
+
+    def test_delete_removes_memory_and_disk(self):
+        self.store.get("alice").append_user_message("Hi")
+        self.store.evict("alice")
+        self.store.delete("alice")
+        self.assertNotIn("alice", self.store)
+        self.assertEqual(self.store.get("alice").chat_log, [])
+
+    def test_memory_usage_counts_hot_sessions(self):
+        empty = self.store.stats()["memory_bytes"]
+        self.store.get("alice").append_user_message("x" * 10_000)
+        self.assertGreater(self.store.stats()["memory_bytes"], empty + 10_000)
+
+    def test_text_index_covers_hot_and_cold_sessions(self):
+        store = SessionStore(self.tmpdir.name, max_hot=1, text_index=TextIndex())
+        store.get("alice").append_user_message("My locker code is 4512.")
+        store.get("bob").append_user_message("Where is the locker room?")
+
+        hits = store.search("locker")
+        self.assertEqual({hit.session_id for hit in hits}, {"alice", "bob"})
+        self.assertEqual(store.get("alice").search_for_message("4512")[0].role, "user")
+        self.assertEqual(len(store.text_index), 2)
+
+        restarted = SessionStore(self.tmpdir.name, text_index=TextIndex())
+        store.close()
+        self.assertEqual(restarted.index_sessions(), 2)
+        self.assertEqual(len(restarted.search('"locker room"')), 1)
+        restarted.delete("bob")
+        self.assertEqual(restarted.search("room"), [])
+
+    def test_deleted_sessions_leave_the_text_index(self):
+        store = SessionStore(self.tmpdir.name, text_index=TextIndex())
+        alice = store.get("alice")
+        alice.append_user_message("My locker code is 4512.")
+        store.delete("alice")
+        alice.append_user_message("Where is my locker?")
+
+        self.assertEqual(store.search("locker"), [])
+        self.assertEqual(len(store.text_index), 0)
+        store.close()
+
+
+class TestConversationManagerLogging(unittest.TestCase):
+    def test_managers_share_one_handler(self):
+        ConversationManager()
+        ConversationManager()
+        logger = logging.getLogger("chatbot_library.utils.conversation_manager")
+        self.assertEqual(len(logger.handlers), 1)
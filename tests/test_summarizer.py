@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from chatbot_library.utils.async_conversation_manager import AsyncConversationManager
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.summarizer import Summarizer
+from chatbot_library.utils.tokens import split_into_chunks
+
+
+def reply(content):
+    return {"choices": [{"message": {"content": content}}]}
+
+
+class TestSummarizer(unittest.TestCase):
+    def setUp(self):
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def create(self, model, messages, temperature):
+        prompt = messages[-1]["content"]
+        with self.lock:
+            self.prompts.append(prompt)
+        time.sleep(0.05)
+        return reply("summary")
+
+    def test_split_into_chunks(self):
+        text = " ".join(f"word{i}" for i in range(100))
+        chunks = split_into_chunks(text, 30)
+        self.assertEqual("".join(chunks), text)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(split_into_chunks("", 30), [])
+
+    def test_split_into_chunks_keeps_characters_whole(self):
+        class ByteEncoding:
+            def encode(self, text):
+                return list(text.encode("utf-8"))
+
+            def decode(self, tokens):
+                return bytes(tokens).decode("utf-8", errors="replace")
+
+            def decode_single_token_bytes(self, token):
+                return bytes([token])
+
+        text = "caf\u00e9 \u2603\U0001f600 na\u00efve" * 3
+        with patch(
+            "chatbot_library.utils.tokens.get_token_params",
+            return_value=(ByteEncoding(), 3, 1),
+        ):
+            for chunk_tokens in (1, 2, 3, 5, 7):
+                chunks = split_into_chunks(text, chunk_tokens)
+                self.assertEqual("".join(chunks), text)
+                self.assertNotIn("\ufffd", "".join(chunks))
+                self.assertTrue(
+                    all(
+                        len(chunk.encode("utf-8")) <= max(chunk_tokens, 4)
+                        for chunk in chunks
+                    )
+                )
+
+    def test_short_text_takes_one_request(self):
+        conversation_manager = ConversationManager()
+        with patch("openai.ChatCompletion.create", side_effect=self.create):
+            summary = Summarizer(conversation_manager).summarize("A short text.")
+
+        self.assertEqual(summary, "summary")
+        self.assertEqual(len(self.prompts), 1)
+        self.assertTrue(self.prompts[0].endswith("Text: A short text."))
+
+    def test_long_text_is_reduced_hierarchically(self):
+        conversation_manager = ConversationManager()
+        conversation_manager.append_user_message("Hi")
+        text = " ".join(f"word{i}" for i in range(1000))
+        summarizer = Summarizer(conversation_manager, chunk_tokens=100, fan_in=4)
+
+        with patch("openai.ChatCompletion.create", side_effect=self.create):
+            start = time.perf_counter()
+            summary = summarizer.summarize(text, focus="numbers")
+            elapsed = time.perf_counter() - start
+
+        map_prompts = [p for p in self.prompts if p.startswith("Summarize")]
+        reduce_prompts = [p for p in self.prompts if p.startswith("Combine")]
+        self.assertEqual(summary, "summary")
+        self.assertEqual(len(map_prompts), 10)
+        # 10 summaries -> 3 -> 1
+        self.assertEqual(len(reduce_prompts), 4)
+        self.assertTrue(all("focusing on: numbers" in p for p in self.prompts))
+        # Three rounds of parallel requests, not fourteen sequential ones.
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual([msg.content for msg in conversation_manager.chat_log], ["Hi"])
+
+    def test_asummarize(self):
+        conversation_manager = AsyncConversationManager()
+        text = " ".join(f"word{i}" for i in range(300))
+
+        async def acreate(model, messages, temperature):
+            self.prompts.append(messages[-1]["content"])
+            return reply("summary")
+
+        with patch("openai.ChatCompletion.acreate", side_effect=acreate):
+            summary = asyncio.run(
+                Summarizer(conversation_manager, chunk_tokens=100).asummarize(text)
+            )
+
+        self.assertEqual(summary, "summary")
+        self.assertEqual(len(self.prompts), 4)
+        self.assertEqual(conversation_manager.chat_log, [])
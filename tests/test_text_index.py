@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+import unittest
+
+from chatbot_library.utils.conversation_manager import ConversationManager
+from chatbot_library.utils.message import Message
+from chatbot_library.utils.text_index import TextIndex, tokenize
+
+
+class TestTextIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = TextIndex()
+        self.locker = self.index.add("alice", "user", "My locker code is 4512.")
+        self.weather = self.index.add("alice", "assistant", "The weather is nice.")
+        self.bob = self.index.add("bob", "user", "Where is the locker room? Locker!")
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize("Hello, World! It's 4512."), ["hello", "world", "it", "s", "4512"]
+        )
+
+    def test_terms_are_ranked_by_bm25(self):
+        hits = self.index.search("locker")
+        self.assertEqual([hit.doc_id for hit in hits], [self.bob, self.locker])
+        self.assertGreater(hits[0].score, hits[1].score)
+        self.assertEqual(hits[1].content, "My locker code is 4512.")
+
+    def test_rare_terms_weigh_more(self):
+        hits = self.index.search("weather is")
+        self.assertEqual(hits[0].doc_id, self.weather)
+
+    def test_phrases_must_match_in_order(self):
+        self.assertEqual(
+            [hit.doc_id for hit in self.index.search('"locker code"')], [self.locker]
+        )
+        self.assertEqual(self.index.search('"code locker"'), [])
+        self.assertEqual(
+            [hit.doc_id for hit in self.index.search('"locker room" code')],
+            [self.bob],
+        )
+
+    def test_search_within_a_session(self):
+        hits = self.index.search("locker", session_id="alice")
+        self.assertEqual([hit.doc_id for hit in hits], [self.locker])
+        self.assertEqual(self.index.search("locker", session_id="carol"), [])
+
+    def test_removed_messages_are_not_found(self):
+        self.index.remove(self.locker)
+        self.assertEqual(
+            [hit.doc_id for hit in self.index.search("locker")], [self.bob]
+        )
+        self.assertEqual(self.index.search("4512"), [])
+        self.assertEqual(self.index.remove_session("bob"), 1)
+        self.assertEqual(self.index.search("locker"), [])
+        self.assertEqual(len(self.index), 1)
+
+    def test_index_saved_chat_log(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "chat_log.json")
+            with open(path, "w") as f:
+                json.dump([{"role": "user", "content": "Saved locker message"}], f)
+            self.index.index_file("alice", path)
+
+        hits = self.index.search("locker", session_id="alice")
+        self.assertEqual([hit.content for hit in hits], ["Saved locker message"])
+
+
+class TestConversationManagerTextIndex(unittest.TestCase):
+    def test_index_follows_appends_and_trims(self):
+        text_index = TextIndex()
+        conversation_manager = ConversationManager()
+        conversation_manager.append_user_message("My locker code is 4512.")
+        conversation_manager.attach_text_index(text_index, "alice")
+        conversation_manager.append_bot_message("Noted, your locker code is saved.")
+
+        results = conversation_manager.search_for_message('"locker code" 4512')
+        self.assertEqual(
+            [msg.content for msg in results],
+            ["My locker code is 4512.", "Noted, your locker code is saved."],
+        )
+        self.assertIs(results[0], conversation_manager.chat_log[0])
+
+        conversation_manager.max_tokens = 0
+        conversation_manager.trim_chat_log_to_token_limit()
+        self.assertEqual(
+            [msg.content for msg in conversation_manager.search_for_message("locker")],
+            ["My locker code is 4512."],
+        )
+        self.assertEqual(len(text_index), 1)
+
+        conversation_manager.chat_log = [Message("user", "Fresh start")]
+        self.assertEqual(conversation_manager.search_for_message("locker"), [])
+        self.assertEqual(len(text_index.search("fresh", session_id="alice")), 1)
+
+    def test_managers_sharing_an_index_only_find_their_own_messages(self):
+        text_index = TextIndex()
+        alice, bob = ConversationManager(), ConversationManager()
+        alice.attach_text_index(text_index)
+        bob.attach_text_index(text_index)
+        alice.append_user_message("My locker code is 4512.")
+        bob.append_user_message("Where is my locker?")
+
+        self.assertNotEqual(alice.session_id, bob.session_id)
+        self.assertEqual(
+            [msg.content for msg in alice.search_for_message("locker")],
+            ["My locker code is 4512."],
+        )
+        self.assertEqual(
+            [msg.content for msg in bob.search_for_message("locker")],
+            ["Where is my locker?"],
+        )
+        with self.assertRaises(ValueError):
+            bob.attach_text_index(text_index, "")
@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import patch
+
+import tiktoken
+
+from chatbot_library.utils.message import Message
+from chatbot_library.utils.tokens import get_token_params, num_tokens_from_message
+
+
+def reference_num_tokens_from_messages(messages, model="gpt-3.5-turbo-0301"):
+    """The original whole-log implementation, kept to check the cached counts against."""
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    if model == "gpt-3.5-turbo":
+        return reference_num_tokens_from_messages(messages, model="gpt-3.5-turbo-0301")
+    elif model == "gpt-4":
+        return reference_num_tokens_from_messages(messages, model="gpt-4-0314")
+    elif model == "gpt-3.5-turbo-0301":
+        tokens_per_message = 4
+        tokens_per_name = -1
+    elif model == "gpt-4-0314":
+        tokens_per_message = 3
+        tokens_per_name = 1
+    else:
+        raise NotImplementedError(model)
+    num_tokens = 0
+    for message in messages:
+        num_tokens += tokens_per_message
+        for key, value in message.items():
+            num_tokens += len(encoding.encode(value))
+            if key == "name":
+                num_tokens += tokens_per_name
+    num_tokens += 3
+    return num_tokens
+
+
+class TestTokens(unittest.TestCase):
+    MESSAGES = [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": "Hello!"},
+        {"role": "assistant", "content": "Hi there, how can I help you?"},
+        {"role": "user", "content": "Tell me a joke.", "name": "alice"},
+        {"role": "assistant", "content": ""},
+    ]
+
+    def test_counts_match_reference_implementation(self):
+        for model in ["gpt-3.5-turbo", "gpt-3.5-turbo-0301", "gpt-4", "gpt-4-0314"]:
+            with self.subTest(model=model):
+                cached = sum(
+                    num_tokens_from_message(msg, model) for msg in self.MESSAGES
+                )
+                self.assertEqual(
+                    cached + 3,
+                    reference_num_tokens_from_messages(self.MESSAGES, model),
+                )
+
+    def test_message_counts_match_reference_implementation(self):
+        for data in self.MESSAGES[:3]:
+            msg = Message(data["role"], data["content"])
+            for model in ["gpt-3.5-turbo-0301", "gpt-4-0314"]:
+                self.assertEqual(
+                    msg.num_tokens(model) + 3,
+                    reference_num_tokens_from_messages([data], model),
+                )
+
+    def test_message_count_is_cached_per_model(self):
+        msg = Message("user", "Hello!")
+        with patch(
+            "chatbot_library.utils.message.num_tokens_from_message", return_value=7
+        ) as mock_count:
+            self.assertEqual(msg.num_tokens("gpt-4-0314"), 7)
+            self.assertEqual(msg.num_tokens("gpt-4-0314"), 7)
+            mock_count.assert_called_once()
+
+    def test_encoding_lookup_is_cached(self):
+        get_token_params.cache_clear()
+        self.addCleanup(get_token_params.cache_clear)
+        with patch(
+            "chatbot_library.utils.tokens.tiktoken.encoding_for_model",
+            wraps=tiktoken.encoding_for_model,
+        ) as mock_encoding_for_model:
+            num_tokens_from_message(self.MESSAGES[0], "gpt-4-0314")
+            num_tokens_from_message(self.MESSAGES[1], "gpt-4-0314")
+            mock_encoding_for_model.assert_called_once_with("gpt-4-0314")
+
+    def test_unknown_model_is_not_implemented(self):
+        with self.assertRaises(NotImplementedError):
+            num_tokens_from_message(self.MESSAGES[0], "not-a-model")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from chatbot_library.utils.deadline import ChatTimeoutError, Deadline
+from chatbot_library.utils.web import extract_text, fetch_page_text, get_http_session
+
+PAGE = (
+    "<html><head><style>p { color: red; }</style><script>var p = '<p>';</script></head>"
+    "<body><p>First &amp; <b>bold</b> paragraph.</p><div>Not a paragraph.</div>"
+    "<p>Café au lait.</p></body></html>"
+)
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/missing":
+            self.send_error(404)
+            return
+        if self.path == "/trickle":
+            self.trickle()
+            return
+        body = PAGE.encode("utf-8")
+        if self.path == "/huge":
+            body = b"<p>" + b"x" * 1_000_000 + b"</p>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def trickle(self):
+        # One byte every 50 ms: no single read ever times out.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", "1000")
+        self.end_headers()
+        try:
+            for _ in range(1000):
+                self.wfile.write(b"x")
+                self.wfile.flush()
+                time.sleep(0.05)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestWeb(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_extract_text_keeps_paragraphs_only(self):
+        self.assertEqual(extract_text(PAGE), "First & bold paragraph. Café au lait.")
+
+    def test_fetch_page_text(self):
+        self.assertEqual(
+            fetch_page_text(f"{self.base_url}/page"),
+            "First & bold paragraph. Café au lait.",
+        )
+
+    def test_fetch_stops_at_max_bytes(self):
+        text = fetch_page_text(f"{self.base_url}/huge", max_bytes=10_000)
+        self.assertEqual(len(text), 10_000 - len("<p>"))
+
+    def test_deadline_bounds_a_trickling_body(self):
+        start = time.perf_counter()
+        with self.assertRaises(ChatTimeoutError):
+            fetch_page_text(f"{self.base_url}/trickle", deadline=Deadline(0.3))
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(
+            fetch_page_text(f"{self.base_url}/page", deadline=Deadline(5.0)),
+            "First & bold paragraph. Café au lait.",
+        )
+
+    def test_http_errors_are_raised(self):
+        with self.assertRaises(requests.HTTPError):
+            fetch_page_text(f"{self.base_url}/missing")
+
+    def test_session_is_shared(self):
+        self.assertIs(get_http_session(), get_http_session())